@@ -7,147 +7,32 @@ python -m serial.tools.list_ports
 """
 
 from random import sample
-import time
 import serial
 import argparse
-import parse
 import csv
 from pathlib import Path
-import threading
-import pandas as pd
-import xarray as xr
+import signal
+import functools
+import asyncio
+import math
+import json
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
 
 from datetime import datetime, timezone
-from waggle.plugin import Plugin, get_timestamp
-
-def parse_values(sample, **kwargs):
-    # Set a default
-    ndict = None
-    # Note: Specific to WXT ASCII query commands
-    if sample.startswith(b'0R0'):
-        # ASCII sting changes voltage heater character if
-        # voltage is supplied or not.
-        #   - '#' for voltage not supplied
-        #          - assigned value - 0
-        #   - 'N' for supplied voltage and above heating temp
-        #          - assigned value - 1
-        #   - 'V' heating is on at 50% duty cycle, between high and middle control
-        #          - assigned value - 2
-        #   - 'W' heating is on 100% duty cycle, between low and middle control temps
-        #          - assigned value - 3
-        #   - 'F' heating is on at 50% duty cycle, heating temp below low control temp
-        #          - assigned value - 4
-        # The heater character is the last value, skip for now.
-        data = parse.search("Dm={:d}D," +
-                    "Sm={:f}M," +
-                    "Ta={:f}C," +
-                    "Ua={:f}P," +
-                    "Pa={:f}H," +
-                    "Rc={:f}M," +
-                    "Hc={:f}M," +
-                    "Th={:f}C," +
-                    "Vh={:f}",
-                    sample.decode('utf-8')
-        )
-        if data:
-            parms = ['Dm', 'Sm', 'Ta', 'Ua', 'Pa', 'Rc', 'Hc', 'Th', 'Vh']
-            # Convert to a list to convert from parse result object
-            strip = [float(var) for var in data]
-            ndict = dict(zip(parms, strip))
-            # Search for remaining heating options
-            if parse.search("Vs={:f}V,", sample.decode('utf-8')):
-                ndict.update({'Vs' : [float(var) for var in parse.search("Vs={:f}V", sample.decode('utf-8'))][0]})
-            if parse.search("Vr={:f}V,", sample.decode('utf-8')):
-                ndict.update({'Vr' : [float(var) for var in parse.search("Vr={:f}V", sample.decode('utf-8'))][0]})
-            # Apply the heater status to the dictionary
-            if parse.search("Vh={:f}N", sample.decode('utf-8')):
-                ndict.update({'Jo' : 1})
-            elif parse.search("Vh={:f}V", sample.decode('utf-8')):
-                ndict.update({'Jo' : 2})
-            elif parse.search("Vh={:f}W", sample.decode('utf-8')):
-                ndict.update({'Jo' : 3})
-            elif parse.search("Vh={:f}F", sample.decode('utf-8')):
-                ndict.update({'Jo' : 5})
-            else:
-                ndict.update({'Jo' : 0})
-        else:
-            # The WXT summary command is user-defined. 
-            # Thus, WXT may not have same summary configuration as the CROCUS nodes.
-            # Define the faculty default for the summary command.
-            # The heater character is the last value, skip for now.
-            data = parse.search("Dm={:d}D," +
-                                "Sm={:f}M," +
-                                "Ta={:f}C," +
-                                "Ua={:f}P," +
-                                "Pa={:f}H," +
-                                "Rc={:f}M," +
-                                "Th={:f}C," +
-                                "Vh={:f}",
-                                sample.decode('utf-8')[:-1]
-            )
-            if data:
-                parms = ['Dm', 'Sm', 'Ta', 'Ua', 'Pa', 'Rc', 'Th', 'Vh']
-                # Convert to a list to convert from parse result object
-                strip = [float(var) for var in data]
-                ndict = dict(zip(parms, strip))
-                # Apply the heater status to the dictionary
-                if sample.decode('utf-8')[-1] == 'N':
-                    ndict.update({'Jo' : 1})
-                elif sample.decode('utf-8')[-1] == 'V':
-                    ndict.update({'Jo' : 2})
-                elif sample.decode('utf-8')[-1] == 'W':
-                    ndict.update({'Jo' : 3})
-                elif sample.decode('utf-8')[-1] == 'F':
-                    ndict.update({'Jo' : 5})
-                else:
-                    ndict.update({'Jo' : 0})
-
-    elif sample.startswith(b'0R1'):
-        parms = ['Dn', 'Dm', 'Dx', 'Sn', 'Sm', 'Sx']
-        data = parse.search("Dn={:d}D," +
-                            "Dm={:d}D," +
-                            "Dx={:d}D," +
-                            "Sn={:f}M," +
-                            "Sm={:f}M," +
-                            "Sx={:f}M",
-                            sample.decode('utf-8')
-                            )
-        if data:
-            # Can't figure out why I can't format parse class
-            strip = [float(var) for var in data]
-            ndict = dict(zip(parms, strip))
-
-    elif sample.startswith(b'0R2'):
-        parms = ['Ta', 'Ua', 'Pa']
-        data = parse.search("Ta={:f}C," +
-                            "Ua={:f}P," +
-                            "Pa={:f}H",
-                            sample.decode('utf-8')
-                            )
-        if data:
-            # Can't figure out why I can't format parse class
-            strip = [float(var) for var in data]
-            ndict = dict(zip(parms, strip))
-
-    elif sample.startswith(b'0R3'):
-        parms = ['Rc', 'Rd', 'Ri', 'Hc', 'Hd', 'Hi']
-        data = parse.search("Rc={:f}M," +
-                            "Rd={:f}S," +
-                            "Ri={:f}M," +
-                            "Hc={:f}M," +
-                            "Hd={:f}S," +
-                            "Hi={:f}M",
-                            sample.decode('utf-8')
-                            )
-        if data:
-            # Can't figure out why I can't format parse class
-            strip = [float(var) for var in data]
-            ndict = dict(zip(parms, strip))
+from waggle.plugin import get_timestamp
 
-    else:
-        ndict = None
-
-    return ndict
+from wxt_parse import parse_values
+from wxt_stats import RunningAverage, WindStatistics, STATUS_KEYS
+from wxt_storage import (BufferedCSVWriter, STORAGE_FORMATS, CODECS, compress_file, file_codec,
+                         check_storage, check_codec)
+from wxt_uplink import PluginSession, UploadQueue, Backfill
+from wxt_journal import SampleJournal, JournaledWriter
+from wxt_metrics import StageMetrics, DISABLED
+from wxt_qc import QualityControl, load_limits, flag_names, accepted, QC_SUFFIX
+from wxt_adaptive import AdaptiveRate
+from wxt_schedule import SampleClock, IntervalBoundary, QuerySchedule
+from wxt_serial import SerialConnection, TelegramStream, clean_telegram, crc_command, STREAM_CONFIG, POLL_CONFIG
 
 def list_files(img_dir):
     """
@@ -167,7 +52,7 @@ def list_files(img_dir):
 
 def secs_to_xr_freq(seconds):
     """cleanly convert seconds to a string frequency for xarray resampling"""
-    seconds = int(seconds) * 60
+    seconds = int(round(seconds * 60))
     if seconds <= 0:
         raise ValueError("seconds must be > 0")
 
@@ -178,16 +63,25 @@ def secs_to_xr_freq(seconds):
         return f"{seconds // 60}min"
     return f"{seconds}s"
 
-def initialize_local_file(site, outdir, publish_names):
-    """Function to generate the filename and header info for local file"""
+def initialize_local_file(site, outdir, publish_names, storage="csv", instrument=None):
+    """
+    Function to generate the filename and header info for local file.
+    Header info is only written for CSV files, columnar files store it as
+    metadata of the columns. The instrument name, if given, is part of
+    the filename.
+    """
     nout = (site +
             '.wxt536.' +
+            (f"{instrument}." if instrument else "") +
             datetime.now(timezone.utc).strftime("%Y%m%d.%H%M%S") +
-            '.csv')
-    # Define the Path to the CSV file
+            STORAGE_FORMATS[storage][0])
+    # Define the Path to the local file
     csv_path = Path(outdir) / nout
     # Ensure the parent directory exists
     csv_path.parent.mkdir(parents=True, exist_ok=True)
+    if storage != "csv":
+        print(f"Initializing local {storage} file at {csv_path}")
+        return csv_path
 
     # Initialize the CSV file with headers
     print(f"Initializing local CSV file at {csv_path}")
@@ -206,121 +100,885 @@ def initialize_local_file(site, outdir, publish_names):
 
     return csv_path
 
-def publish_file(file_path):
-    """Utilizing threading, publish file to Beehive"""
-    def upload_file(file_path):
-        """Call the Waggle Plugin"""
-        with Plugin() as plugin:
-            plugin.upload_file(file_path, timestamp=get_timestamp())
-            print(f"Published {file_path}")
-    # Define threads
-    thread = threading.Thread(target=upload_file, args=(file_path,))
-    thread.start()
-    thread.join()
+def upload_file(file_path, session):
+    """
+    Call the shared Waggle Plugin session to upload a file to Beehive. The
+    compression codec of the file is recorded in the upload metadata.
+    """
+    meta = {"codec" : file_codec(file_path) or "none"}
+    session.upload_file(file_path, meta=meta, timestamp=get_timestamp())
+    print(f"Published {file_path}")
 
-def publish_avg(arg, file_path, publish_names):
+def publish_file(file_path, upload_queue):
     """
-    Calculate a user define average from the local data files
-    and publish to Beehive. 
+    Hand a file to the background upload queue for publishing to Beehive.
+    The upload is retried by the queue, acquisition does not wait on it.
     """
-    # Define the timestamp
-    timestamp = get_timestamp()
+    if upload_queue.submit(file_path):
+        print(f"Queued {file_path} for upload ({upload_queue.depth} pending)")
+
+def publish_metrics(metrics, session, timestamp=None, meta=None):
+    """
+    Publish plugin system metrics to Beehive as wxt.sys.<name>
+
+    Parameters:
+        metrics: Dictionary of metric names and values
+        session: Shared wxt_uplink.PluginSession
+        timestamp: Timestamp of the metrics, defaults to now
+        meta: Additional metadata (e.g. the instrument name)
+    """
+    if timestamp is None:
+        timestamp = get_timestamp()
+    for name, value in metrics.items():
+        session.publish(f"wxt.sys.{name}",
+                        value=value,
+                        meta={"sensor" : "vaisala-wxt536", **(meta or {})},
+                        scope="beehive",
+                        timestamp=timestamp
+        )
 
-    # Define a list to hold the additional meta data for the heater
-    heater_info = ["Heating Voltage Not Supplied",
-                   "Heating Voltage Supplied and Above Heating Temperature Threshold",
-                   "Heating Voltage Supplied and is between High and Middle Control Temperature Threshold",
-                   "Heating Voltage Supplied and is between Low and Middle Control Temperature Threshold",
-                   "Heating Voltage Supplied and is Below Low Control Temperature Threshold"]
+# Wind statistics of the interval (wxt_stats.WindStatistics) published
+# alongside the averaged wind; speed percentiles are named speed_p<N>
+WIND_NAMES = {"speed_vector" : ["wxt.wind.speed_vector", "Vector Mean Wind Speed", "m/s"],
+              "direction_vector" : ["wxt.wind.direction_vector", "Vector Mean Wind Direction", "degrees"],
+              "direction_std" : ["wxt.wind.direction_std", "Wind Direction Standard Deviation (Yamartino)", "degrees"],
+              "gust" : ["wxt.wind.gust", "Wind Gust", "m/s"],
+              "speed_max" : ["wxt.wind.speed_max", "Maximum Mean Wind Speed", "m/s"],
+              "speed_std" : ["wxt.wind.speed_std", "Wind Speed Standard Deviation", "m/s"],
+             }
 
-    df = pd.read_csv(file_path, skiprows=3, na_values=-9999)
-    df["time"] = pd.to_datetime(df["time"], utc=True, errors="coerce").dt.tz_convert(None)
-    df = df.set_index("time").sort_index()
-    ds = xr.Dataset.from_dataframe(df)
+def publish_avg(arg, accumulator, publish_names, session, minutes=None):
+    """
+    Publish the user defined average accumulated from the parsed samples
+    to Beehive, followed by the wind statistics if the accumulator keeps
+    them.
 
-    ds = ds.assign_coords(time=pd.to_datetime(ds["time"].values))
+    Parameters:
+        arg: Command line arguments
+        accumulator: wxt_stats.RunningAverage holding the current interval
+        publish_names: Dictionary of WXT variables to publish
+        session: Shared wxt_uplink.PluginSession
+        minutes: Length of the averaged interval, if not the publish
+            interval (e.g. the adaptive rates changed it midway)
+    """
+    # Stamp the average with its last sample, the interval may be published late
+    timestamp = accumulator.timestamp or get_timestamp()
 
-    # define temporal frequency for resampling
-    nfreq = secs_to_xr_freq(arg.beehive_interval)
+    # Define a dictionary to hold the additional meta data for the heater
+    heater_info = {0 : "Heating Voltage Not Supplied",
+                   1 : "Heating Voltage Supplied and Above Heating Temperature Threshold",
+                   2 : "Heating Voltage Supplied and is between High and Middle Control Temperature Threshold",
+                   3 : "Heating Voltage Supplied and is between Low and Middle Control Temperature Threshold",
+                   5 : "Heating Voltage Supplied and is Below Low Control Temperature Threshold"}
 
-    # Temporal mean for everything except rainfall accumulation
-    ds_mean = ds.drop_vars(["Rc"]).resample(time=nfreq).mean()
+    # define temporal frequency of the average
+    nfreq = secs_to_xr_freq(arg.beehive_interval if minutes is None else minutes)
 
-    # put it back into one Dataset
-    ds_mean['Rc'] = [ds.Rc.data[-1]]
+    # Temporal mean for everything except accumulations (last value),
+    # wind direction (vector mean) and heater status (mode)
+    averages = accumulator.mean()
 
     ## -- Publish Parsed and Averaged Telegram to Beehive ---
     # publish each value in sample
-    with Plugin() as plugin:
-        for name, key in publish_names.items():
-            try:
-                value = ds_mean[name].round(decimals=3).data[-1]
-            except KeyError:
-                continue
-            # Update the log
-            if key == 'Jo':
-                plugin.publish(key[0],
-                               value=value,
-                               meta={"units" : key[2],
-                                     "sensor" : "vaisala-wxt536",
-                                     "missing" : "-9999.9",
-                                     "status" : heater_info[value],
-                                     "avg_frequency" : nfreq
-                                },
-                                scope="beehive",
-                                timestamp=timestamp
-                )
-            else:
-                plugin.publish(key[0],
-                               value=value,
-                               meta={"units" : key[2],
-                                     "sensor" : "vaisala-wxt536",
-                                     "missing" : "-9999.9",
-                                     "avg_frequency" : nfreq},
-                               scope="beehive",
-                               timestamp=timestamp
-                )
-    # cleanup
-    del df, ds, ds_mean
-
-def query(args, ser, publish_names, **kwargs):
-    """
-    Sends query command to the WXT536 instrument, parses the returned
-    telegram, and publishes to Beehive via Waggle Plugin.
-
-    Additionally, writes the raw data to a local file if specified.
+    for name, key in publish_names.items():
+        if name not in averages:
+            continue
+        value = round(averages[name], 3)
+        # Update the log
+        if name == 'Jo':
+            session.publish(key[0],
+                            value=value,
+                            meta={"units" : key[2],
+                                  "sensor" : "vaisala-wxt536",
+                                  "missing" : "-9999.9",
+                                  "status" : heater_info.get(value, "Unknown"),
+                                  "avg_frequency" : nfreq,
+                                  **instrument_meta(arg)
+                            },
+                            scope="beehive",
+                            timestamp=timestamp
+            )
+        else:
+            session.publish(key[0],
+                            value=value,
+                            meta={"units" : key[2],
+                                  "sensor" : "vaisala-wxt536",
+                                  "missing" : "-9999.9",
+                                  "avg_frequency" : nfreq,
+                                  **instrument_meta(arg)},
+                            scope="beehive",
+                            timestamp=timestamp
+            )
+
+    ## -- Publish the Wind Statistics of the Interval ---
+    if accumulator.wind is None:
+        return
+    for name, value in accumulator.wind.stats().items():
+        if name.startswith("speed_p"):
+            key = [f"wxt.wind.{name}", f"Wind Speed {name[7:]}th Percentile", "m/s"]
+        else:
+            key = WIND_NAMES[name]
+        meta = {"units" : key[2],
+                "sensor" : "vaisala-wxt536",
+                "description" : key[1],
+                "avg_frequency" : nfreq,
+                **instrument_meta(arg)}
+        if name == "gust":
+            meta["gust_window"] = f"{arg.gust_window}s"
+        session.publish(key[0],
+                        value=round(value, 3),
+                        meta=meta,
+                        scope="beehive",
+                        timestamp=timestamp
+        )
+
+def read_telegram(ser, command, metrics=DISABLED):
+    """
+    Sends a query command (e.g. 0R0) to the WXT536 instrument and reads the
+    returned telegram. The round trip is timed as the serial stage of the
+    wxt_metrics.StageMetrics (metrics keyword).
+
+    Returns:
+        Tuple of the query timestamp (ns) and the raw telegram bytes
     """
     # Define the timestamp
     timestamp = get_timestamp()
+    with metrics.time("serial"):
+        # Note: WXT interface commands located within manual
+        # Note: query command sent to the instrument needs to be byte
+        ser.write(bytearray(command + '\r\n', 'utf-8'))
+        line = ser.readline()
+    if not line.endswith(b'\n'):
+        # readline returned on the port timeout
+        metrics.count("serial.timeouts")
+    return timestamp, line
 
-    ## -- Query the WXT and Parse the Returned Telegram ----
+def decode_telegram(args, timestamp, line):
+    """
+    Cleans and parses a raw telegram returned by the WXT536 instrument.
 
-    # Note: WXT interface commands located within manual
-    # Note: query command sent to the instrument needs to be byte
-    ser.write(bytearray(args.query + '\r\n', 'utf-8'))
-    line = ser.readline()
-    # Remove all leading/trailing checksum characters
-    newstring = b''.join(bytes([byte]) for byte in line if byte  > 14)
+    Returns:
+        Tuple of the cleaned telegram (None if the CRC check failed) and the
+        dictionary of parsed values (None if the telegram is not valid)
+    """
+    metrics = stage_metrics(args)
+    with metrics.time("parse"):
+        # Remove all leading/trailing checksum characters
+        newstring = clean_telegram(line, crc=args.crc)
+        # Check for valid command
+        sample = parse_values(newstring) if newstring is not None else None
     # check for debug; output direct from the instrument
     if args.debug == True:
         print('Raw Output from WXT536:')
         print(datetime.fromtimestamp(timestamp / 1e9).strftime('%Y-%m-%d %H:%M:%S.%f'), line)
         print(newstring)
-    # Check for valid command
-    sample = parse_values(newstring)
+    if newstring is None:
+        print(f"CRC check failed, discarding {line}")
+        metrics.count("parse.crc_failures")
+        return None, None
+    if not sample:
+        metrics.count("parse.failures")
     if args.debug == True:
         print(f"Parsed Sample: {sample}")
+    return newstring, sample
+
+def merge_telegrams(args, telegrams, publish_names):
+    """
+    Parses the raw telegrams of one sampling tick and merges the responses
+    to different query commands (e.g. 0R1 wind and 0R2 PTU) into single
+    records. A new record is started whenever a command repeats.
+
+    Parameters:
+        telegrams: List of (timestamp, raw telegram) tuples
+
+    Returns:
+        List of (timestamp, merged dictionary of parsed values) tuples,
+        stamped with the read time (ns) of the first telegram of the record
+    """
+    records = []
+    merged = {}
+    commands = set()
+    started = None
+    for timestamp, line in telegrams:
+        newstring, sample = decode_telegram(args, timestamp, line)
+        if not sample:
+            continue
+        command = newstring[:3]
+        if command in commands:
+            records.append((started, merged))
+            merged = {}
+            commands.clear()
+        if not merged:
+            started = timestamp
+        merged.update(sample)
+        commands.add(command)
+    if merged:
+        records.append((started, merged))
+    return records
+
+def record_sample(sample, publish_names, timestamp=None, **kwargs):
+    """
+    Adds a parsed sample to the running average (accumulator keyword) and
+    writes it to the local file (writer keyword), if specified. The write
+    is timed by the wxt_metrics.StageMetrics (metrics keyword).
+
+    The row and the average are stamped with the read time of the sample
+    (timestamp, ns), not the time it is recorded: the asyncio engine may
+    record queued samples long after they were read. Defaults to now.
+
+    With a wxt_qc.QualityControl (qc keyword), the sample is checked first:
+    its flags are written with the values and flagged values are left out
+    of the running average. The accepted values also drive the
+    wxt_adaptive.AdaptiveRate (adaptive keyword), if specified.
+    """
+    row = sample
+    ## -- Quality Control of the Parsed Values ----
+    if kwargs.get('qc') is not None:
+        flags = kwargs['qc'].check(sample)
+        row = {**sample, **{key + QC_SUFFIX : flag for key, flag in flags.items()}}
+        if any(flags.values()):
+            sample = {key : value for key, value in sample.items() if not flags.get(key)}
+
+    ## -- Update the Running Average for Beehive Publishing ----
+    if kwargs.get('accumulator') is not None:
+        kwargs['accumulator'].update(sample, timestamp)
+
+    ## -- Update the Adaptive Query and Publish Rates ----
+    if kwargs.get('adaptive') is not None:
+        kwargs['adaptive'].update(sample)
+
+    ## -- Write to Local File if Specified ----
+    if kwargs.get('writer') is not None:
+        with (kwargs.get('metrics') or DISABLED).time("write"):
+            ts = (datetime.now(timezone.utc) if timestamp is None
+                  else datetime.fromtimestamp(timestamp / 1e9, timezone.utc))
+            out_values = [row.get(val) for val in publish_names.keys()]
+            kwargs['writer'].write_record(ts, out_values)
+
+def query(args, ser, publish_names, commands, **kwargs):
+    """
+    Sends the query commands due this tick to the WXT536 instrument, parses
+    the returned telegrams and merges them into one record.
+
+    Additionally, writes the record to a local file if specified (writer
+    keyword) and adds it to the running average (accumulator keyword).
+
+    Returns:
+        Merged dictionary of parsed values, None if no telegram was valid
+    """
+    ## -- Query the WXT and Parse the Returned Telegrams ----
+    metrics = stage_metrics(args)
+    telegrams = [read_telegram(ser, command, metrics) for command in commands]
+    sample = None
+    for timestamp, sample in merge_telegrams(args, telegrams, publish_names):
+        record_sample(sample, publish_names, timestamp, **kwargs)
+    return sample
+
+def local_file_writer(args, local_file, publish_names):
+    """Return the buffered writer of a local file, chosen by its suffix"""
+    storage = next(name for name, (suffix, _) in STORAGE_FORMATS.items()
+                   if Path(local_file).name.endswith(suffix))
+    if storage == "csv":
+        return BufferedCSVWriter(local_file,
+                                 flush_rows=args.flush_rows,
+                                 flush_interval=args.flush_interval)
+    writer_class = STORAGE_FORMATS[storage][1]
+    attrs = {"site" : args.site, "instrument" : "Vaisala WXT536"}
+    if getattr(args, "instrument", None) is not None:
+        attrs["instrument_name"] = args.instrument
+    return writer_class(local_file,
+                        publish_names,
+                        flush_rows=args.flush_rows,
+                        flush_interval=args.flush_interval,
+                        attrs=attrs)
+
+def open_local_file(args, publish_names, journal=None):
+    """
+    Initialize a new local file and return its buffered writer. If a
+    wxt_journal.SampleJournal is given, the samples are also journaled.
+    """
+    local_file = initialize_local_file(args.site, args.outdir, publish_names,
+                                       storage=args.storage,
+                                       instrument=getattr(args, "instrument", None))
+    writer = local_file_writer(args, local_file, publish_names)
+    if journal is not None:
+        return JournaledWriter(writer, journal)
+    return writer
+
+# Shortest time between streamed records in seconds: the WXT update
+# intervals are at least 1 second, and the wind, PTU, precipitation and
+# supervisor messages (0R1, 0R2, 0R3, 0R5) may each arrive as a record
+STREAM_SAMPLE_INTERVAL = 0.25
+
+def interval_samples(args):
+    """
+    Most samples a publish interval can hold: the longest publish interval
+    at the fastest sampling rate. With adaptive rates, the mode can change
+    in the middle of an interval, and streamed telegrams arrive at the rates
+    of the WXT rather than the query interval. Evaluated at start, before
+    adapt_rates changes the intervals in args.
+    """
+    fastest = query_interval(args)
+    longest = args.beehive_interval
+    if getattr(args, "adaptive", False):
+        fastest = min(fastest, args.quiet_query_interval)
+        longest = max(longest, args.quiet_publish_interval)
+    if getattr(args, "mode", "poll") == "stream":
+        fastest = min(fastest, STREAM_SAMPLE_INTERVAL)
+    return int(longest * 60 / fastest)
+
+def interval_accumulator(args):
+    """
+    Running average of a publish interval, keeping its wind statistics.
+    Streamed wind telegrams arrive at the wind update interval of the WXT
+    (e.g. 0WU,I=1), not the query interval: the gust window is then
+    measured on the spacing of the wind samples.
+    """
+    stream = getattr(args, "mode", "poll") == "stream"
+    wind = WindStatistics(interval_samples(args) + 64,
+                          gust_samples=round(args.gust_window / query_interval(args)),
+                          percentiles=args.wind_percentiles,
+                          gust_window=args.gust_window if stream else None)
+    return RunningAverage(wind=wind)
+
+def journal_capacity(args):
+    """Journal capacity covering a rotation interval of samples twice"""
+    return interval_samples(args) * 2 + 64
+
+def recover_interval(args, journal, publish_names, session, upload_queue):
+    """
+    Finish the interval interrupted by a restart from the sample journal.
+
+    The average of the journaled samples is published, the samples that had
+    not been written to the local file yet are appended (CSV), or the file
+    is rewritten from the journal (columnar files are only complete once
+    closed), and the file is queued for upload.
+    """
+    local_file = journal.local_file
+    if local_file is None:
+        journal.clear(journal_capacity(args))
+        return
+    times, values = journal.records()
+    print(f"Recovering {len(times)} samples of interrupted interval {local_file}")
+    keys = list(publish_names.keys())
+    if len(times):
+        accumulator = interval_accumulator(args)
+        for timestamp, row in zip(times.tolist(), values.tolist()):
+            # Values flagged by the quality control are not averaged
+            accumulator.update(accepted({key : value for key, value in zip(keys, row)
+                                         if not math.isnan(value)}),
+                               int(timestamp * 1e9))
+        publish_avg(args, accumulator, publish_names, session)
+    # The file may already be queued (and compressed) before the restart
+    if local_file.exists():
+        if local_file.suffix == ".csv":
+            times, values = journal.records(journal.flushed)
+        else:
+            local_file.unlink()
+        writer = local_file_writer(args, local_file, publish_names)
+        for timestamp, row in zip(times.tolist(), values.tolist()):
+            # Status codes and flags are journaled as floats, restore the integers
+            writer.write_record(datetime.fromtimestamp(timestamp, timezone.utc),
+                                [None if math.isnan(value)
+                                 else int(value) if key in STATUS_KEYS or key.endswith(QC_SUFFIX)
+                                 else value
+                                 for key, value in zip(keys, row)])
+        writer.close()
+        publish_file(str(local_file), upload_queue)
+    journal.clear(journal_capacity(args))
+
+def rotate_local_file(args, nfile_writer, accumulator, publish_names, session, upload_queue,
+                      clock=None, journal=None, backfill=None, connection=None, qc=None,
+                      adaptive=None, rotation=None):
+    """
+    Publish the interval average, close the current local file, queue it for
+    upload and initialize the next file. The average is labelled with the
+    length of the interval ended by the rotation boundary (rotation
+    keyword). Upload queue, backfill (backfill keyword), serial connection
+    (connection keyword), sampling statistics (clock keyword), quality
+    control flag counts (qc keyword) and adaptive rate savings (adaptive
+    keyword) are published as system metrics. The interval is cleared from
+    the sample journal (journal keyword) once the file is queued.
+
+    Returns:
+        Buffered writer of the new local file
+    """
+    stages = stage_metrics(args)
+    ## -- Publish Parsed Telegram to Beehive ---
+    with stages.time("publish_avg"):
+        publish_avg(args, accumulator, publish_names, session,
+                    minutes=None if rotation is None else rotation.length / 60)
+    accumulator.reset()
+    # Close the current file and create a new one
+    if nfile_writer:
+        print(f"Closing {nfile_writer.path}")
+        nfile_writer.close()
+        with stages.time("publish_file"):
+            publish_file(str(nfile_writer.path), upload_queue)
+    if journal is not None:
+        journal.clear()
+    metrics = upload_queue.metrics()
+    if backfill is not None:
+        metrics.update(backfill.metrics())
+    if connection is not None:
+        metrics.update(connection.metrics())
+    if clock is not None:
+        metrics.update(clock.stats())
+        clock.reset_stats()
+    if qc is not None:
+        metrics.update(qc.metrics())
+        qc.reset_counts()
+    if adaptive is not None:
+        metrics.update(adaptive.metrics())
+        adaptive.reset_counts()
+    metrics.update(stages.metrics())
+    stages.reset()
+    publish_metrics(metrics, session, meta=instrument_meta(args))
+    # Intialize a new local file
+    return open_local_file(args, publish_names, journal=journal)
+
+async def acquire_async(args, connection, publish_names, session, upload_queue,
+                        nfile_writer=None, accumulator=None, stream=None, journal=None,
+                        backfill=None, qc=None, adaptive=None):
+    """
+    Asyncio acquisition engine.
+
+    Serial I/O runs in a dedicated worker thread, while parsing, writing the
+    local file and rotation/publishing run as separate tasks connected by
+    queues. Queries are sent on absolute deadlines of the event loop clock,
+    so I/O time does not add to the sampling interval. If a TelegramStream
+    is given (stream keyword), pushed telegrams are read continuously
+    instead of polled. The sample journal (journal keyword) is cleared on
+    rotation. A lost wxt_serial.SerialConnection is reopened by the sampler.
+    The rates of a wxt_adaptive.AdaptiveRate (adaptive keyword) are applied
+    by the sampler, which wakes the rotator on a change.
+    """
+    loop = asyncio.get_running_loop()
+    telegrams = asyncio.Queue(maxsize=args.async_queue_size)
+    samples = asyncio.Queue(maxsize=args.async_queue_size)
+    files = {"writer" : nfile_writer}
+    # A single thread, serial reads and writes are never concurrent
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wxt-serial")
+    # Note: the event loop clock is time.monotonic
+    clock = SampleClock(query_interval(args), clock=loop.time)
+    schedule = QuerySchedule(args.query, clock.interval)
+    metrics = stage_metrics(args)
+    rotation = IntervalBoundary(args.beehive_interval) if args.beehive_interval > 0 else None
+    rates_changed = asyncio.Event()
+
+    def enqueue(queue, item):
+        """Hand an item to the next stage without ever blocking acquisition"""
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            print("Acquisition queue full, dropping sample")
+            metrics.count("samples.dropped")
+
+    async def sampler():
+        """Query the instrument on a drift-free clock"""
+        nonlocal schedule
+        while True:
+            if adaptive is not None and adaptive.pop_change():
+                schedule = adapt_rates(args, adaptive, clock, rotation=rotation,
+                                       accumulator=accumulator, qc=qc)
+                rates_changed.set()
+            # Reconnect with backoff if the connection was lost
+            if not await loop.run_in_executor(executor, connection.connect):
+                await asyncio.sleep(clock.delay())
+                continue
+            try:
+                if stream is not None:
+                    timestamp = get_timestamp()
+                    lines = await loop.run_in_executor(executor, stream.read)
+                    if lines:
+                        enqueue(telegrams, [(timestamp, line) for line in lines])
+                    continue
+                clock.tick()
+                tick = []
+                for command in schedule.due():
+                    tick.append(await loop.run_in_executor(executor, read_telegram,
+                                                           connection, command, metrics))
+                enqueue(telegrams, tick)
+            except serial.SerialException as err:
+                # The connection closed the port, reconnect on the next tick
+                print(f"Query failed: {err}")
+            await asyncio.sleep(clock.delay())
+
+    async def parser():
+        """Parse raw telegrams and merge them into records"""
+        while True:
+            tick = await telegrams.get()
+            for record in merge_telegrams(args, tick, publish_names):
+                enqueue(samples, record)
+
+    async def recorder():
+        """Write parsed samples and update the running average"""
+        while True:
+            timestamp, sample = await samples.get()
+            record_sample(sample,
+                          publish_names,
+                          timestamp,
+                          writer=files["writer"],
+                          accumulator=accumulator,
+                          metrics=metrics,
+                          qc=qc,
+                          adaptive=adaptive)
+
+    async def rotator():
+        """Publish averages and rotate the local file on the interval"""
+        while True:
+            # Wake up just after the next interval boundary, or when the
+            # adaptive rates changed the interval
+            try:
+                await asyncio.wait_for(rates_changed.wait(), rotation.remaining() + 0.01)
+            except asyncio.TimeoutError:
+                pass
+            rates_changed.clear()
+            if rotation.due():
+                files["writer"] = rotate_local_file(args,
+                                                    files["writer"],
+                                                    accumulator,
+                                                    publish_names,
+                                                    session,
+                                                    upload_queue,
+                                                    clock=clock,
+                                                    journal=journal,
+                                                    backfill=backfill,
+                                                    connection=connection,
+                                                    qc=qc,
+                                                    adaptive=adaptive,
+                                                    rotation=rotation)
+
+    tasks = [asyncio.create_task(sampler()),
+             asyncio.create_task(parser()),
+             asyncio.create_task(recorder())]
+    if rotation is not None:
+        tasks.append(asyncio.create_task(rotator()))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        if files["writer"]:
+            print(f"Closing {files['writer'].path}")
+            files["writer"].close()
+        executor.shutdown(wait=False)
+
+def query_interval(args):
+    """Return the validated query interval in seconds"""
+    if isinstance(args.query_interval, (int, float)) and args.query_interval > 0:
+        return args.query_interval
+    print("Invalid query interval, defaulting to 1 second")
+    return 1
+
+def handle_sigterm(signum, frame):
+    """Treat SIGTERM (e.g. docker stop) as an interrupt so files are closed"""
+    raise KeyboardInterrupt
+
+# Settings of the whole process, shared by all instruments
+PROCESS_SETTINGS = ("compress", "compress_level", "upload_queue_size", "backfill_rate",
+                    "retention_days", "engine", "outdir", "instruments")
+
+def instrument_args(args):
+    """
+    Return the command line arguments of each instrument.
 
-    # If valid parsed values, send to publishing
-    if sample:
-        ## -- Write to Local File if Specified ----
-        if 'local_file' in kwargs and kwargs['local_file']:
-            with open(kwargs['local_file'], mode='a', newline='', encoding="utf-8") as csvfile:
-                csv_writer = csv.writer(csvfile)
-                ts = datetime.now(timezone.utc).isoformat(timespec="seconds")
-                out_values = [str(sample.get(val, '-9999')) for val in publish_names.keys()]
-                csv_writer.writerow([ts, *out_values])
-                csvfile.flush()
+    Without --instruments, a single instrument is configured by the command
+    line. Otherwise each entry of the JSON list configures one instrument:
+    a unique name plus the settings, by their argument names (e.g. device,
+    site, query, query_interval, mode), that differ from the command line.
+    Several instruments each need their own explicit device, port discovery
+    could bind two of them to the same WXT (the ports are not opened
+    exclusively) and its 0XU probes would disturb the ports being polled.
+    The settings of the shared upload queue and backfill and of the engine
+    (PROCESS_SETTINGS) apply to the process and are rejected in an entry.
+    """
+    if not args.instruments:
+        instrument = argparse.Namespace(**vars(args))
+        instrument.instrument = None
+        instruments = [instrument]
+    else:
+        with open(args.instruments, encoding="utf-8") as config:
+            entries = json.load(config)
+        instruments = []
+        for entry in entries:
+            settings = dict(entry)
+            name = settings.pop("name", None)
+            unknown = set(settings) - set(vars(args))
+            if not name or unknown:
+                raise ValueError(f"Invalid instrument {entry}, a name and known settings"
+                                 f" are required (unknown: {sorted(unknown)})")
+            shared = set(settings) & set(PROCESS_SETTINGS)
+            if shared:
+                raise ValueError(f"Invalid instrument {entry}, {sorted(shared)} apply to"
+                                 f" all instruments and are only set on the command line")
+            instrument = argparse.Namespace(**{**vars(args), **settings})
+            instrument.instrument = name
+            for key in ("query", "stream_config"):
+                if isinstance(getattr(instrument, key), str):
+                    setattr(instrument, key, getattr(instrument, key).split())
+            instruments.append(instrument)
+        names = [instrument.instrument for instrument in instruments]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Instrument names must be unique: {names}")
+        devices = [instrument.device for instrument in instruments]
+        if len(instruments) > 1 and ("auto" in devices or len(set(devices)) != len(devices)):
+            raise ValueError(f"Each instrument needs its own device, auto discovery is only"
+                             f" available for a single instrument: {devices}")
+    for instrument in instruments:
+        instrument.stage_metrics = StageMetrics(enabled=instrument.profile)
+        if instrument.crc:
+            instrument.query = [crc_command(query) for query in instrument.query]
+            instrument.stream_config = [crc_command(command) for command in instrument.stream_config]
+    return instruments
+
+def backfill_min_age(instruments):
+    """
+    Seconds before the backfill indexes a local file: the files of the last
+    two (longest) publish intervals of any instrument are left alone.
+    """
+    return max([15] + [max(instrument.beehive_interval,
+                           instrument.quiet_publish_interval if instrument.adaptive else 0)
+                       for instrument in instruments]) * 120
+
+def stage_metrics(args):
+    """Stage timings and counters of the instrument, disabled unless --profile"""
+    return getattr(args, "stage_metrics", DISABLED)
+
+def instrument_meta(args):
+    """Publish metadata naming the instrument, empty for a single instrument"""
+    if getattr(args, "instrument", None) is None:
+        return {}
+    return {"instrument" : args.instrument}
+
+def state_file(args, name):
+    """Path of a state file of the instrument in the outdir (e.g. wxt536.journal)"""
+    if getattr(args, "instrument", None) is None:
+        return Path(args.outdir) / f"wxt536.{name}"
+    return Path(args.outdir) / f"wxt536.{args.instrument}.{name}"
+
+# Read timeout of the serial port in seconds
+SERIAL_TIMEOUT = 1
+
+def start_instrument(args, publish_names, session, upload_queue):
+    """
+    Set up the acquisition of an instrument: the serial connection, the
+    automatic message stream, the quality control, the adaptive rates, the
+    local file and its journal and the running average.
+
+    Returns:
+        SimpleNamespace of connection, stream, qc, adaptive, writer, journal,
+        accumulator and publish_names (with the QC flag columns)
+    """
+    unit = SimpleNamespace(connection=None, stream=None, qc=None, adaptive=None,
+                           writer=None, journal=None, accumulator=None)
+    # ---- Quality Control ----
+    # Flag columns are written after the variables
+    if args.qc:
+        limits = load_limits(args.qc_config)
+        limits = {key : value for key, value in limits.items() if key in publish_names}
+        publish_names = {**publish_names, **flag_names(publish_names, limits)}
+        unit.qc = QualityControl(limits, window=args.qc_window,
+                                 interval=query_interval(args))
+    unit.publish_names = publish_names
+
+    # ---- Adaptive Query and Publish Rates ----
+    # The configured rates are the active ones; streamed telegrams arrive
+    # at the rate of the WXT, only the publish interval adapts
+    if args.adaptive:
+        if args.quiet_query_interval <= 0 or args.quiet_publish_interval <= 0:
+            raise ValueError("Quiet query and publish intervals must be > 0")
+        quiet_query = args.quiet_query_interval if args.mode == "poll" else query_interval(args)
+        unit.adaptive = AdaptiveRate((query_interval(args), quiet_query),
+                                     (args.beehive_interval, args.quiet_publish_interval),
+                                     rain=args.adaptive_rain,
+                                     wind_std=args.adaptive_wind_std,
+                                     pressure=args.adaptive_pressure,
+                                     window=args.adaptive_window,
+                                     hold=args.adaptive_hold * 60)
+
+    # Serial port of the WXT, reopened (and rediscovered) after I/O errors
+    # A single missed reply must not be taken for a lost connection
+    slowest = query_interval(args)
+    if args.adaptive and args.mode == "poll":
+        slowest = max(slowest, args.quiet_query_interval)
+    if args.silence_timeout and args.silence_timeout <= slowest + SERIAL_TIMEOUT:
+        raise ValueError(f"Silence timeout must exceed the query interval plus the"
+                         f" {SERIAL_TIMEOUT} s read timeout ({slowest + SERIAL_TIMEOUT} s),"
+                         f" got {args.silence_timeout} s")
+    unit.connection = SerialConnection(args.device,
+                                       args.baud_rate,
+                                       timeout=SERIAL_TIMEOUT,
+                                       cache_path=state_file(args, "port.json"),
+                                       backoff_max=args.reconnect_max,
+                                       silence=args.silence_timeout)
+
+    # ---- Local File Initialization ----
+    # Check to see if data are written to local file for upload
+    if args.beehive_interval > 0:
+        print(f"Writing data to local file. New file generates every {args.beehive_interval} seconds")
+        # Finish the interval interrupted by a restart, then
+        # journal the samples of the new one
+        unit.journal = SampleJournal(state_file(args, "journal"),
+                                     publish_names,
+                                     journal_capacity(args))
+        recover_interval(args, unit.journal, publish_names, session, upload_queue)
+        # Define the filename
+        unit.writer = open_local_file(args, publish_names, journal=unit.journal)
+        # Running average of the parsed samples for publishing
+        unit.accumulator = interval_accumulator(args)
+
+    # ---- Automatic Message Streaming ----
+    # Configure the WXT to push telegrams instead of being polled,
+    # again after each reconnection
+    if args.mode == "stream":
+        unit.stream = TelegramStream(unit.connection)
+        def configure_stream():
+            print(f"Configuring automatic messages: {args.stream_config}")
+            unit.stream.configure(args.stream_config)
+        unit.connection.on_connect = configure_stream
+    unit.connection.connect()
+    return unit
+
+def adapt_rates(args, adaptive, clock, rotation=None, accumulator=None, qc=None):
+    """
+    Switch an instrument to the query and publish intervals of the current
+    mode of its wxt_adaptive.AdaptiveRate. The sampling clock, the rotation
+    boundary (rotation keyword), the wind gust samples (accumulator keyword)
+    and the QC rate of change (qc keyword) follow.
+
+    Returns:
+        QuerySchedule of the query commands at the new query interval
+    """
+    args.query_interval = adaptive.query_interval
+    clock.interval = args.query_interval
+    if rotation is not None:
+        args.beehive_interval = adaptive.publish_interval
+        rotation.set_period(args.beehive_interval)
+    if accumulator is not None and accumulator.wind is not None:
+        accumulator.wind.gust_samples = max(round(args.gust_window / args.query_interval), 1)
+    if qc is not None:
+        qc.interval = args.query_interval
+    print(f"Weather {'active' if adaptive.active else 'quiet'}: querying every"
+          f" {args.query_interval} s, publishing every {args.beehive_interval} min")
+    return QuerySchedule(args.query, clock.interval)
+
+def stop_instrument(unit):
+    """Close the local file and restore polling before closing the serial port"""
+    if unit.writer and not unit.writer.closed:
+        print(f"Closing {unit.writer.path}")
+        unit.writer.close()
+    if unit.journal is not None:
+        # Kept for the next start to finish the interval
+        unit.journal.close()
+    if unit.stream is not None and unit.connection.connected:
+        # Return the WXT to polling for the next run
+        try:
+            unit.stream.configure(POLL_CONFIG)
+        except serial.SerialException as err:
+            print(f"Unable to restore polling mode: {err}")
+    unit.connection.close()
+
+def acquire_sync(args, unit, publish_names, session, upload_queue, backfill=None):
+    """
+    Synchronous acquisition loop of a single instrument.
+
+    Queries are sent on absolute deadlines, rotation is aligned to the
+    wall-clock interval boundaries. Both follow the adaptive rates, if
+    enabled.
+    """
+    connection = unit.connection
+    metrics = stage_metrics(args)
+    clock = SampleClock(query_interval(args))
+    # Query commands due at each tick, at their individual rates
+    schedule = QuerySchedule(args.query, clock.interval)
+    rotation = IntervalBoundary(args.beehive_interval) if args.beehive_interval > 0 else None
+    while True:
+
+        # --- Apply a Change of the Adaptive Rates ----
+        if unit.adaptive is not None and unit.adaptive.pop_change():
+            schedule = adapt_rates(args, unit.adaptive, clock, rotation=rotation,
+                                   accumulator=unit.accumulator, qc=unit.qc)
+
+        # --- Check on Local File Creation Interval ----
+        if rotation is not None and rotation.due():
+            unit.writer = rotate_local_file(args,
+                                            unit.writer,
+                                            unit.accumulator,
+                                            publish_names,
+                                            session,
+                                            upload_queue,
+                                            clock=clock,
+                                            journal=unit.journal,
+                                            backfill=backfill,
+                                            connection=connection,
+                                            qc=unit.qc,
+                                            adaptive=unit.adaptive,
+                                            rotation=rotation)
+
+        ## --- Verify Serial Connection ----
+        # Reconnect with backoff if the connection was lost
+        if not connection.connect():
+            clock.wait()
+            continue
+
+        try:
+            ## --- Begin Data Publishing ----
+            # Streaming - parse the telegrams pushed by the WXT
+            if unit.stream is not None:
+                timestamp = get_timestamp()
+                lines = [(timestamp, line) for line in unit.stream.read()]
+                for timestamp, sample in merge_telegrams(args, lines, publish_names):
+                    record_sample(sample,
+                                  publish_names,
+                                  timestamp,
+                                  writer=unit.writer,
+                                  accumulator=unit.accumulator,
+                                  metrics=metrics,
+                                  qc=unit.qc,
+                                  adaptive=unit.adaptive,
+                    )
+                continue
+
+            # Begin - parse telegram
+            clock.tick()
+            query(args,
+                  connection,
+                  publish_names,
+                  schedule.due(),
+                  writer=unit.writer,
+                  accumulator=unit.accumulator,
+                  metrics=metrics,
+                  qc=unit.qc,
+                  adaptive=unit.adaptive,
+            )
+        except serial.SerialException as err:
+            # The connection closed the port, reconnect on the next tick
+            print(f"Query failed: {err}")
+
+        ## -- Query Interval Wait ---
+        clock.wait()
+
+async def acquire_instruments(instruments, units, publish_names, session, upload_queue,
+                              backfill=None):
+    """
+    Acquire several instruments concurrently in one event loop. Each runs
+    its own asyncio engine (serial worker thread, parser, recorder and
+    rotator); the Plugin session and upload queue are shared.
+    """
+    await asyncio.gather(*(acquire_async(args,
+                                         unit.connection,
+                                         unit.publish_names,
+                                         session,
+                                         upload_queue,
+                                         nfile_writer=unit.writer,
+                                         accumulator=unit.accumulator,
+                                         stream=unit.stream,
+                                         journal=unit.journal,
+                                         backfill=backfill,
+                                         qc=unit.qc,
+                                         adaptive=unit.adaptive)
+                           for args, unit in zip(instruments, units)))
 
 def main(args):
     """Main function for WXT536 interface and publishing"""
@@ -344,86 +1002,68 @@ def main(args):
                      "Jo" : ["wxt.heater.status", "Heater Status", "Unitless"]
                     }
 
-    with serial.Serial(args.device,
-					   args.baud_rate,
-					   parity=serial.PARITY_NONE,
-					   stopbits=serial.STOPBITS_ONE,
-					   bytesize=serial.EIGHTBITS,
-					   timeout=1) as ser:
-        try:
-            print(f"Serial connection to {args.device} is open")
-            last_timestamp = time.gmtime()
-
-            # ---- Local File Initialization ----
-            # Check to see if data are written to local file for upload
-            if args.beehive_interval > 0:
-                print(f"Writing data to local file. New file generates every {args.beehive_interval} seconds")
-                # Define the filename
-                nfile_writer = initialize_local_file(args.site, args.outdir, publish_names)
-
-            # if desired, check on current files and file sizes
-            if args.debug == True:
-                # check on the files
-                list_files(args.outdir)
-                print("\n")
-
-            # --- Main WXT Interface Loop ----
-            while True:
-
-                # --- Check on Local File Creation Interval ----
-                if args.beehive_interval > 0:
-                    current_timestamp = time.gmtime()
-
-                    if (current_timestamp.tm_min % args.beehive_interval == 0
-                            and current_timestamp.tm_min != last_timestamp.tm_min):
-                        ## -- Publish Parsed Telegram to Beehive ---
-                        if args.beehive_interval > 0:
-                            publish_avg(args, nfile_writer.name, publish_names)
-                        # Close the current file and create a new one
-                        if nfile_writer:
-                            print(f"Closing {nfile_writer.name}")
-                            publish_file(nfile_writer.name)
-                        # Intialize a new local file
-                        nfile_writer = initialize_local_file(args.site, args.outdir, publish_names)
-                        last_timestamp = current_timestamp
-
-                ## --- Verify Serial Connection ----
-                # Check the serial connection. If not defined, re-establish.
-                if ser is None:
-                    ser = serial.Serial(args.device,
-					                    args.baud_rate,
-					                    parity=serial.PARITY_NONE,
-					                    stopbits=serial.STOPBITS_ONE,
-					                    bytesize=serial.EIGHTBITS,
-					                    timeout=1)
-                    print(f"Reconnecting Serial Connection with {args.device}")
-
-                ## --- Begin Data Publishing ----
-                # Begin - parse telegram
-                if args.beehive_interval > 0:
-                    query(args,
-                          ser,
-                          publish_names,
-                          local_file=nfile_writer,
-                    )
-                else:
-                    query(args,
-                          ser,
-                          publish_names
-                    )
+    # Ensure buffered rows are written out when the container is stopped
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+    # Single Waggle Plugin session shared by all publishes and uploads
+    session = PluginSession()
+
+    # Rotated files are compressed by the upload worker, off the acquisition thread
+    if args.compress != "none":
+        prepare = functools.partial(compress_file, codec=args.compress, level=args.compress_level)
+    else:
+        prepare = None
+    # Background upload of the rotated files, resumes uploads left pending
+    upload_queue = UploadQueue(functools.partial(upload_file, session=session),
+                               prepare=prepare,
+                               state_path=Path(args.outdir) / "wxt536.uploads.json",
+                               maxsize=args.upload_queue_size)
+    instruments = instrument_args(args)
+    # Backlog of files left in the outdir (of every instrument and site),
+    # uploaded while the queue is idle
+    backfill = Backfill(upload_queue,
+                        sorted({instrument.outdir for instrument in instruments}),
+                        "*.wxt536.*",
+                        state_path=Path(args.outdir) / "wxt536.backfill.json",
+                        rate=args.backfill_rate,
+                        retention_days=args.retention_days,
+                        min_age=backfill_min_age(instruments))
+    upload_queue.on_complete = backfill.update
 
-                ## -- Query Interval Wait ---
-                if isinstance(args.query_interval, (int, float)) and args.query_interval > 0:
-                    time.sleep(args.query_interval)
-                else:
-                    print("Invalid query interval, defaulting to 1 second")
-                    time.sleep(1)
+    units = []
+    try:
+        for instrument in instruments:
+            units.append(start_instrument(instrument, publish_names, session, upload_queue))
+        # Note: started once every interrupted interval is recovered, the
+        # interrupted local files are rewritten (and queued) by the recovery
+        upload_queue.start()
+        backfill.start()
 
-        except KeyboardInterrupt:
-            print(f"Program interrupted, closing serial port {args.device}")
-        finally:
-            if ser:
-                ser.close()
+        # if desired, check on current files and file sizes
+        if args.debug == True:
+            # check on the files
+            list_files(args.outdir)
+            print("\n")
+
+        # --- Main WXT Interface Loop ----
+        if args.engine == "sync" and len(units) == 1:
+            acquire_sync(instruments[0], units[0], units[0].publish_names, session, upload_queue,
+                         backfill=backfill)
+        else:
+            # --- Asyncio WXT Interface ----
+            if args.engine == "sync":
+                print(f"Acquiring {len(units)} instruments with the asyncio engine")
+            asyncio.run(acquire_instruments(instruments, units, publish_names, session,
+                                            upload_queue, backfill=backfill))
+
+    except KeyboardInterrupt:
+        print("Program interrupted, closing serial ports")
+    finally:
+        for unit in units:
+            stop_instrument(unit)
+        backfill.stop()
+        upload_queue.stop()
+        session.close()
 
 if __name__ == '__main__':
 
@@ -448,9 +1088,20 @@ if __name__ == '__main__':
     parser.add_argument("--device",
                         type=str,
                         dest='device',
-                        default="/dev/ttyUSB7",
-                        help="[str|Default /dev/ttyUSB7] Serial Device to" +
-                             " Establish Serial Communication"
+                        default="auto",
+                        help="[str|Default auto] Serial Device to" +
+                             " Establish Serial Communication; auto probes the" +
+                             " serial ports for the WXT and caches the port found"
+                        )
+    parser.add_argument("--instruments",
+                        type=str,
+                        default=None,
+                        dest="instruments",
+                        help="[str|Default None] JSON file listing the WXTs acquired" +
+                             " by this process, e.g. [{\"name\": \"north\"," +
+                             " \"device\": \"/dev/ttyUSB0\"}, {\"name\": \"south\"," +
+                             " \"device\": \"/dev/ttyUSB1\", \"query\": [\"0R1\"]}];" +
+                             " settings not given default to the command line"
                         )
     parser.add_argument("--baudrate",
                         type=int,
@@ -458,19 +1109,172 @@ if __name__ == '__main__':
                         default=19200,
                         help="[int|Default 19200] Serial Communication Baudrate"
                         )
+    parser.add_argument("--reconnect-max",
+                        type=float,
+                        default=60,
+                        dest="reconnect_max",
+                        help="[float|Default 60 sec] Maximum wait between attempts" +
+                             " to reopen a lost serial connection"
+                        )
+    parser.add_argument("--silence-timeout",
+                        type=float,
+                        default=10,
+                        dest="silence_timeout",
+                        help="[float|Default 10 sec] Reopen the serial connection" +
+                             " when no data are received for this long (0 disables);" +
+                             " must exceed the query interval (quiet query interval with" +
+                             " --adaptive) plus 1 sec and the longest automatic message interval"
+                        )
     parser.add_argument("--query",
                         type=str,
-                        default="0R0",
+                        nargs="+",
+                        default=["0R0"],
                         dest="query",
-                        help="[str|Default 0R0] ASCII query command to send" +
-                             " to the instrument"
+                        help="[str|Default 0R0] ASCII query commands to send" +
+                             " to the instrument, as COMMAND or COMMAND:SECONDS" +
+                             " to query at an individual rate (e.g. 0R1 0R2:10" +
+                             " 0R3:60). Responses of one tick are merged."
                        )
+    parser.add_argument("--engine",
+                        type=str,
+                        default="sync",
+                        choices=["sync", "asyncio"],
+                        dest="engine",
+                        help="[str|Default sync] Acquisition engine; asyncio runs" +
+                             " serial I/O, parsing, writing and publishing as" +
+                             " concurrent tasks on a drift-free clock"
+                        )
+    parser.add_argument("--async-queue-size",
+                        type=int,
+                        default=600,
+                        dest="async_queue_size",
+                        help="[int|Default 600] Telegrams buffered between the" +
+                             " asyncio engine stages"
+                        )
+    parser.add_argument("--mode",
+                        type=str,
+                        default="poll",
+                        choices=["poll", "stream"],
+                        dest="mode",
+                        help="[str|Default poll] Poll the WXT with --query, or" +
+                             " stream the telegrams it pushes in automatic" +
+                             " message mode"
+                        )
+    parser.add_argument("--stream-config",
+                        type=str,
+                        nargs="+",
+                        default=STREAM_CONFIG,
+                        dest="stream_config",
+                        help="[str|Default 0XU,M=A] WXT commands sent to enable" +
+                             " automatic messages (e.g. 0XU,M=A 0WU,I=1)"
+                        )
+    parser.add_argument("--crc",
+                        action="store_true",
+                        dest="crc",
+                        help="Request telegrams with a CRC (0r0 polls, M=a" +
+                             " automatic messages) and discard telegrams that" +
+                             " fail the check"
+                        )
+    parser.add_argument("--profile",
+                        action="store_true",
+                        dest="profile",
+                        help="Time the serial, parse, write and publish stages and" +
+                             " count parse failures, timeouts and dropped samples," +
+                             " published as wxt.sys.* metrics at each rotation"
+                        )
     parser.add_argument("--query-interval",
                         type=int,
                         default=1,
                         dest="query_interval",
                         help="[int|Default 1sec] WXT Query Frequency in seconds "
                        )
+    parser.add_argument("--qc",
+                        action="store_true",
+                        dest="qc",
+                        help="Flag values failing the range, rate of change and spike" +
+                             " checks, write the flags as <variable>_qc columns and" +
+                             " leave flagged values out of the averages"
+                        )
+    parser.add_argument("--qc-config",
+                        type=str,
+                        default=None,
+                        dest="qc_config",
+                        help="[str|Default None] JSON file of QC limits updating the" +
+                             " defaults, e.g. {\"Ta\": {\"min\": -40, \"spike\": 2.0}}"
+                        )
+    parser.add_argument("--qc-window",
+                        type=int,
+                        default=5,
+                        dest="qc_window",
+                        help="[int|Default 5] Samples of the rolling median spike check"
+                        )
+    parser.add_argument("--gust-window",
+                        type=float,
+                        default=3,
+                        dest="gust_window",
+                        help="[float|Default 3 sec] Averaging window of the published wind gust"
+                        )
+    parser.add_argument("--wind-percentiles",
+                        type=float,
+                        nargs="+",
+                        default=[10, 50, 90],
+                        dest="wind_percentiles",
+                        help="[float|Default 10 50 90] Published wind speed percentiles"
+                        )
+    parser.add_argument("--adaptive",
+                        action="store_true",
+                        dest="adaptive",
+                        help="Back off to the quiet query and publish intervals while" +
+                             " no rain, wind variability or pressure tendency threshold" +
+                             " is crossed; --query-interval and --beehive-publish-interval" +
+                             " are used while one is"
+                        )
+    parser.add_argument("--quiet-query-interval",
+                        type=float,
+                        default=5,
+                        dest="quiet_query_interval",
+                        help="[float|Default 5 sec] Query interval of quiet weather"
+                        )
+    parser.add_argument("--quiet-publish-interval",
+                        type=int,
+                        default=60,
+                        dest="quiet_publish_interval",
+                        help="[int|Default 60 min] Publish interval of quiet weather"
+                        )
+    parser.add_argument("--adaptive-rain",
+                        type=float,
+                        default=0.1,
+                        dest="adaptive_rain",
+                        help="[float|Default 0.1 mm] Rain and hail accumulation within" +
+                             " the window that is active weather (0 disables)"
+                        )
+    parser.add_argument("--adaptive-wind-std",
+                        type=float,
+                        default=1.5,
+                        dest="adaptive_wind_std",
+                        help="[float|Default 1.5 m/s] Wind speed standard deviation" +
+                             " within the window that is active weather (0 disables)"
+                        )
+    parser.add_argument("--adaptive-pressure",
+                        type=float,
+                        default=1.0,
+                        dest="adaptive_pressure",
+                        help="[float|Default 1.0 hPa/h] Pressure tendency within the" +
+                             " window that is active weather (0 disables)"
+                        )
+    parser.add_argument("--adaptive-window",
+                        type=float,
+                        default=600,
+                        dest="adaptive_window",
+                        help="[float|Default 600 sec] Window of the adaptive rate thresholds"
+                        )
+    parser.add_argument("--adaptive-hold",
+                        type=float,
+                        default=30,
+                        dest="adaptive_hold",
+                        help="[float|Default 30 min] Time without a threshold crossed" +
+                             " before backing off to the quiet intervals"
+                        )
     parser.add_argument("--beehive-publish-interval",
                         default=15,
                         dest='beehive_interval',
@@ -485,6 +1289,67 @@ if __name__ == '__main__':
                         default=".",
                         help="[str| Default Current Working Directory] Directory where to output files to"
                         )
+    parser.add_argument("--storage",
+                        type=str,
+                        default="csv",
+                        choices=list(STORAGE_FORMATS),
+                        dest="storage",
+                        help="[str|Default csv] Local file format; parquet" +
+                             " (requires pyarrow) and nc (requires netCDF4)" +
+                             " store compressed float32 columns with NaN for" +
+                             " missing values"
+                        )
+    parser.add_argument("--compress",
+                        type=str,
+                        default="none",
+                        choices=["none", *CODECS],
+                        dest="compress",
+                        help="[str|Default none] Compress rotated files before" +
+                             " upload (zstd requires zstandard); mostly useful" +
+                             " with csv storage"
+                        )
+    parser.add_argument("--compress-level",
+                        type=int,
+                        default=6,
+                        dest="compress_level",
+                        help="[int|Default 6] Compression level of --compress"
+                        )
+    parser.add_argument("--flush-rows",
+                        type=int,
+                        default=60,
+                        dest="flush_rows",
+                        help="[int|Default 60] Number of buffered samples written to" +
+                             " the local file at once"
+                        )
+    parser.add_argument("--flush-interval",
+                        type=float,
+                        default=60,
+                        dest="flush_interval",
+                        help="[float|Default 60 sec] Maximum time samples are buffered" +
+                             " before being written to the local file"
+                        )
+    parser.add_argument("--upload-queue-size",
+                        type=int,
+                        default=100,
+                        dest="upload_queue_size",
+                        help="[int|Default 100] Maximum number of files waiting" +
+                             " for upload to Beehive"
+                        )
+    parser.add_argument("--backfill-rate",
+                        type=float,
+                        default=60,
+                        dest="backfill_rate",
+                        help="[float|Default 60] Maximum number of files left in" +
+                             " --outdir by failed uploads or restarts that are" +
+                             " uploaded per hour while idle (0 disables)"
+                        )
+    parser.add_argument("--retention-days",
+                        type=float,
+                        default=30,
+                        dest="retention_days",
+                        help="[float|Default 30] Delete files in --outdir older" +
+                             " than this, uploaded or not (0 keeps all files)"
+                        )
     parser.add_argument("--site",
                         type=str,
                         default="atmos",
@@ -492,6 +1357,15 @@ if __name__ == '__main__':
                         help="[str | Default atmos] Site Identifer for Deployment location"
                         )
     args = parser.parse_args()
+    # Reject an invalid --instruments file or a missing optional module
+    # before opening anything
+    try:
+        for instrument in instrument_args(args):
+            check_storage(instrument.storage)
+        if args.compress != "none":
+            check_codec(args.compress)
+    except (OSError, ValueError, ImportError) as err:
+        parser.error(str(err))
 
 
     main(args)
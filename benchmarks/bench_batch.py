@@ -0,0 +1,62 @@
+"""
+Benchmark of the columnar batch parser (wxt_parse.parse_many) against
+the per-line path of app.py (wxt_serial.clean_telegram then parse_values),
+over synthetic pollsave-style lines.
+
+Usage:
+python benchmarks/bench_batch.py --lines 2600000
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from wxt_parse import parse_values, parse_many
+from wxt_serial import clean_telegram
+from bench_parse import TELEGRAMS
+
+def synthetic_lines(nlines):
+    """Generate timestamped lines as written by read_wxt530.py:pollsave"""
+    block = b''.join(b'20231010T12:%02d:%02d.000000,' % (i // 60 % 60, i % 60)
+                     + TELEGRAMS[i % len(TELEGRAMS)] + b'\r\n' for i in range(3600))
+    return block * max(nlines // 3600, 1)
+
+def main(args):
+    """Time per-line and batch parsing of the same buffer"""
+    data = synthetic_lines(args.lines)
+    nlines = data.count(b'\n')
+    print(f"Parsing {nlines} lines ({len(data) / 1e6:.1f} MB)")
+
+    start = time.perf_counter()
+    result = parse_many(data)
+    batch = time.perf_counter() - start
+    print(f"parse_many: {batch:8.2f} s, {int(result['valid'].sum())} valid telegrams")
+
+    # Per-line parsing is slow, time a subset and extrapolate
+    subset = data.splitlines()[:args.sample]
+    start = time.perf_counter()
+    for line in subset:
+        parse_values(clean_telegram(line.split(b',', 1)[1]))
+    per_line = (time.perf_counter() - start) / len(subset) * nlines
+    print(f"parse_values per line (extrapolated from {len(subset)}): {per_line:8.2f} s")
+    print(f"speedup: {per_line / batch:.1f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark batch telegram parsing")
+    parser.add_argument("--lines",
+                        type=int,
+                        default=2592000,
+                        dest="lines",
+                        help="[int|Default 2592000] Number of lines, one month at 1 Hz"
+                        )
+    parser.add_argument("--sample",
+                        type=int,
+                        default=100000,
+                        dest="sample",
+                        help="[int|Default 100000] Lines used to time the per-line parser"
+                        )
+    args = parser.parse_args()
+
+    main(args)
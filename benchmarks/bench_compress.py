@@ -0,0 +1,99 @@
+"""
+Benchmark of the compression of rotated files: bytes uploaded per day and
+CPU time spent compressing, for a day of simulated 1 Hz samples rotated
+into files of --file-minutes. Codecs whose library is not installed are
+skipped.
+
+Usage:
+python benchmarks/bench_compress.py --storage csv --file-minutes 15
+"""
+
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from wxt_storage import STORAGE_FORMATS, CODECS, compress_file
+from bench_storage import VARIABLES, synthetic_records
+
+def write_files(records, storage, file_rows, outdir):
+    """Write the records into rotated files, returns their paths"""
+    suffix, writer_class = STORAGE_FORMATS[storage]
+    paths = []
+    for start in range(0, len(records), file_rows):
+        path = Path(outdir) / f"bench.{len(paths):04d}{suffix}"
+        if storage == 'csv':
+            writer = writer_class(path, flush_rows=file_rows)
+        else:
+            writer = writer_class(path, VARIABLES, flush_rows=file_rows)
+        for timestamp, values in records[start:start + file_rows]:
+            writer.write_record(timestamp, values)
+        writer.close()
+        paths.append(path)
+    return paths
+
+def main(args):
+    """Compress a day of rotated files with every available codec"""
+    records = synthetic_records(args.samples)
+    file_rows = int(args.file_minutes * 60 / args.interval)
+    days = args.samples * args.interval / 86400
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = write_files(records, args.storage, file_rows, tmpdir)
+        raw = sum(path.stat().st_size for path in paths)
+        print(f"{len(paths)} {args.storage} files, {args.samples} samples")
+        print(f"{'none':6s} {raw / days / 1e6:8.2f} MB/day")
+        for codec in CODECS:
+            for level in args.levels:
+                start = time.process_time()
+                try:
+                    compressed = [compress_file(path, codec=codec, level=level) for path in paths]
+                except ImportError as err:
+                    print(f"{codec:6s} skipped: {err}")
+                    break
+                cpu = time.process_time() - start
+                size = sum(path.stat().st_size for path in compressed)
+                print(f"{codec:6s} level {level:2d} {size / days / 1e6:8.2f} MB/day"
+                      f" ({raw / size:5.1f}x), {cpu / days:6.2f} CPU s/day,"
+                      f" {cpu / len(paths) * 1e3:7.1f} ms/file")
+                for path in compressed:
+                    path.unlink()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark compression of rotated files")
+    parser.add_argument("--samples",
+                        type=int,
+                        default=86400,
+                        dest="samples",
+                        help="[int|Default 86400] Number of samples"
+                        )
+    parser.add_argument("--interval",
+                        type=float,
+                        default=1.0,
+                        dest="interval",
+                        help="[float|Default 1 sec] Sampling interval"
+                        )
+    parser.add_argument("--file-minutes",
+                        type=float,
+                        default=15,
+                        dest="file_minutes",
+                        help="[float|Default 15 min] Rotation interval"
+                        )
+    parser.add_argument("--storage",
+                        type=str,
+                        default="csv",
+                        choices=list(STORAGE_FORMATS),
+                        dest="storage",
+                        help="[str|Default csv] Local file format"
+                        )
+    parser.add_argument("--levels",
+                        type=int,
+                        nargs="+",
+                        default=[1, 6, 9],
+                        dest="levels",
+                        help="[int|Default 1 6 9] Compression levels"
+                        )
+    args = parser.parse_args()
+
+    main(args)
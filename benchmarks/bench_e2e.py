@@ -0,0 +1,266 @@
+"""
+End-to-end benchmark of app.py against the simulated WXT536.
+
+The simulator runs in a subprocess on a pty, so its CPU time is not
+counted, and Beehive is replaced by the FakePlugin stand-in. Two phases:
+
+- poll: app.query() back to back on a SerialConnection for --seconds,
+  giving the maximum sustainable poll rate and the CPU time per sample
+- run: app.main() with --profile for --duration seconds, sampling the
+  RSS and the number of allocated Python blocks to report memory growth,
+  and timing every rotation (the stall of the acquisition loop) along
+  with the published stage latencies
+
+Usage:
+python benchmarks/bench_e2e.py --seconds 10 --duration 300 --query-interval 0.2
+"""
+
+import os
+import sys
+import time
+import signal
+import argparse
+import tempfile
+import functools
+import threading
+import subprocess
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+import app
+from wxt_serial import SerialConnection, STREAM_CONFIG
+from wxt_storage import BufferedCSVWriter
+from wxt_stats import RunningAverage
+from wxt_uplink import PluginSession
+from fake_plugin import FakePlugin
+from bench_storage import VARIABLES
+
+def start_simulator(args):
+    """Start the simulator subprocess, returns the process and its pty device"""
+    command = [sys.executable, str(ROOT / "wxt_simulator.py"),
+               "--latency", str(args.latency),
+               "--jitter", str(args.jitter),
+               "--heater", args.heater,
+               "--garbage", str(args.garbage),
+               "--seed", "1"]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    device = process.stdout.readline().split()[-1]
+    return process, device
+
+def stop_simulator(process):
+    """Interrupt the simulator and wait for it to close the pty"""
+    process.send_signal(signal.SIGINT)
+    process.wait(5)
+
+def app_args(args, device, outdir):
+    """Command line arguments of app.py for the benchmark"""
+    return SimpleNamespace(debug=False, device=device, instruments=None, baud_rate=19200,
+                           reconnect_max=60, silence_timeout=10,
+                           query=args.query, engine=args.engine, async_queue_size=600,
+                           mode="poll", stream_config=STREAM_CONFIG, crc=False,
+                           profile=True, query_interval=args.query_interval,
+                           beehive_interval=args.rotate_minutes, outdir=outdir,
+                           storage=args.storage, compress="none", compress_level=6,
+                           flush_rows=60, flush_interval=60, upload_queue_size=100,
+                           backfill_rate=60, retention_days=30, site="bench",
+                           gust_window=3, wind_percentiles=[10, 50, 90],
+                           qc=args.qc, qc_config=None, qc_window=5,
+                           adaptive=args.adaptive, quiet_query_interval=args.query_interval * 5,
+                           quiet_publish_interval=args.rotate_minutes * 4, adaptive_rain=0.1,
+                           adaptive_wind_std=1.5, adaptive_pressure=1.0, adaptive_window=600,
+                           adaptive_hold=30)
+
+def poll(args, device, outdir):
+    """Query the simulator back to back, report the rate and CPU per sample"""
+    run_args = app.instrument_args(app_args(args, device, outdir))[0]
+    writer = BufferedCSVWriter(Path(outdir) / "poll.csv")
+    accumulator = RunningAverage()
+    samples = 0
+    queries = 0
+    with SerialConnection(device, cache_path=None) as connection:
+        connection.connect()
+        start = time.perf_counter()
+        cpu = time.process_time()
+        while time.perf_counter() - start < args.seconds:
+            queries += 1
+            if app.query(run_args, connection, VARIABLES, run_args.query,
+                         writer=writer, accumulator=accumulator):
+                samples += 1
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+    writer.close()
+    print(f"poll: {queries / elapsed:8.1f} queries/s, {samples / elapsed:8.1f} samples/s"
+          f" ({queries - samples} invalid), {cpu / max(samples, 1) * 1e6:7.1f} CPU us/sample")
+
+def rss():
+    """Resident set size of this process in bytes"""
+    with open("/proc/self/statm", encoding="ascii") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def run(args, device, outdir):
+    """Run app.main() for the duration, report memory growth and rotation stalls"""
+    memory = []
+    stalls = []
+    records = []
+    stop = threading.Event()
+
+    def sample_memory():
+        while not stop.wait(1.0):
+            memory.append((time.monotonic(), rss(), sys.getallocatedblocks()))
+
+    rotate = app.rotate_local_file
+    def timed_rotate(*rotate_args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return rotate(*rotate_args, **kwargs)
+        finally:
+            stalls.append(time.perf_counter() - start)
+
+    record = app.record_sample
+    def counted_record(sample, *record_args, **kwargs):
+        records.append(None)
+        return record(sample, *record_args, **kwargs)
+
+    FakePlugin.clear()
+    session = functools.partial(PluginSession, factory=functools.partial(FakePlugin, 0, 0))
+    sampler = threading.Thread(target=sample_memory, daemon=True)
+    timer = threading.Timer(args.duration, os.kill, (os.getpid(), signal.SIGTERM))
+    cpu = time.process_time()
+    with mock.patch.object(app, "PluginSession", session), \
+         mock.patch.object(app, "rotate_local_file", timed_rotate), \
+         mock.patch.object(app, "record_sample", counted_record):
+        sampler.start()
+        timer.start()
+        app.main(app_args(args, device, outdir))
+    cpu = time.process_time() - cpu
+    stop.set()
+    timer.cancel()
+
+    rows = len(records)
+    print(f"run: {rows} samples in {args.duration:.0f} s, {cpu / max(rows, 1) * 1e6:7.1f}"
+          f" CPU us/sample (incl. rotation and upload threads)")
+    # Skip the first tenth of the run while buffers and caches fill
+    warm = memory[len(memory) // 10:]
+    if len(warm) > 1:
+        hours = (warm[-1][0] - warm[0][0]) / 3600
+        print(f"memory: RSS {warm[0][1] / 1e6:.1f} -> {warm[-1][1] / 1e6:.1f} MB"
+              f" ({(warm[-1][1] - warm[0][1]) / 1e6 / hours:+.2f} MB/h),"
+              f" allocated blocks {warm[0][2]} -> {warm[-1][2]}"
+              f" ({(warm[-1][2] - warm[0][2]) / hours:+.0f}/h)")
+    if stalls:
+        print(f"rotation: {len(stalls)} stalls, mean {sum(stalls) / len(stalls) * 1e3:.1f} ms,"
+              f" max {max(stalls) * 1e3:.1f} ms")
+    stages = {}
+    for name, value, *_ in FakePlugin.messages:
+        if name.startswith("wxt.sys.stage.") and name.endswith("max_ms"):
+            stage = name[len("wxt.sys.stage."):-len(".max_ms")]
+            stages[stage] = max(stages.get(stage, 0.0), value)
+        elif name.startswith("wxt.sys.adaptive.") and name.endswith("_saved"):
+            stages[name[len("wxt.sys."):]] = stages.get(name[len("wxt.sys."):], 0) + value
+        elif name in ("wxt.sys.sample.missed", "wxt.sys.serial.timeouts",
+                      "wxt.sys.parse.failures", "wxt.sys.samples.dropped"):
+            stages[name[len("wxt.sys."):]] = stages.get(name[len("wxt.sys."):], 0) + value
+    for name, value in stages.items():
+        unit = " ms max" if "." not in name else ""
+        print(f"  {name:20s} {value}{unit}")
+
+def main(args):
+    """Run the benchmark phases against one simulator"""
+    process, device = start_simulator(args)
+    try:
+        with tempfile.TemporaryDirectory() as outdir:
+            if args.seconds > 0:
+                poll(args, device, outdir)
+            if args.duration > 0:
+                run(args, device, outdir)
+    finally:
+        stop_simulator(process)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="End-to-end benchmark against the WXT simulator")
+    parser.add_argument("--seconds",
+                        type=float,
+                        default=10,
+                        dest="seconds",
+                        help="[float|Default 10 sec] Duration of the back to back polling, 0 to skip"
+                        )
+    parser.add_argument("--duration",
+                        type=float,
+                        default=300,
+                        dest="duration",
+                        help="[float|Default 300 sec] Duration of the app.main() run, 0 to skip"
+                        )
+    parser.add_argument("--query",
+                        type=str,
+                        nargs="+",
+                        default=["0R0"],
+                        dest="query",
+                        help="[str|Default 0R0] Query commands"
+                        )
+    parser.add_argument("--query-interval",
+                        type=float,
+                        default=0.2,
+                        dest="query_interval",
+                        help="[float|Default 0.2 sec] Query interval of the app.main() run"
+                        )
+    parser.add_argument("--rotate-minutes",
+                        type=int,
+                        default=1,
+                        dest="rotate_minutes",
+                        help="[int|Default 1 min] Rotation interval of the app.main() run"
+                        )
+    parser.add_argument("--engine",
+                        type=str,
+                        default="sync",
+                        choices=["sync", "asyncio"],
+                        dest="engine",
+                        help="[str|Default sync] Acquisition engine"
+                        )
+    parser.add_argument("--storage",
+                        type=str,
+                        default="csv",
+                        choices=["csv", "parquet", "nc"],
+                        dest="storage",
+                        help="[str|Default csv] Local file format"
+                        )
+    parser.add_argument("--qc",
+                        action="store_true",
+                        dest="qc",
+                        help="Enable the quality control stage"
+                        )
+    parser.add_argument("--adaptive",
+                        action="store_true",
+                        dest="adaptive",
+                        help="Enable the adaptive query and publish rates (quiet rates" +
+                             " 5 times the query interval and 4 times the rotation interval)"
+                        )
+    parser.add_argument("--latency",
+                        type=float,
+                        default=0.0,
+                        dest="latency",
+                        help="[float|Default 0 sec] Simulated reply latency"
+                        )
+    parser.add_argument("--jitter",
+                        type=float,
+                        default=0.0,
+                        dest="jitter",
+                        help="[float|Default 0 sec] Simulated random extra latency"
+                        )
+    parser.add_argument("--heater",
+                        type=str,
+                        default="NVWF",
+                        dest="heater",
+                        help="[str|Default NVWF] Simulated heater voltage suffixes"
+                        )
+    parser.add_argument("--garbage",
+                        type=float,
+                        default=0.0,
+                        dest="garbage",
+                        help="[float|Default 0] Probability of a corrupted reply"
+                        )
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,114 @@
+"""
+Benchmark of telegram framing and cleaning: the former byte-by-byte
+generator that stripped control characters against the translate path of
+wxt_serial.clean_telegram, with and without CRC validation.
+
+Telegrams are taken from a raw capture of the serial port (--input, e.g.
+recorded with read_wxt530.py) or synthesized with the WXT simulator, and
+framed with TelegramStream from an in-memory serial port. Both paths copy
+each telegram: framing copies it out of the buffer and cleaning returns a
+new bytes object, the translate path just does so in one pass instead of
+one Python iteration per byte. Time per telegram and the tracemalloc peak
+of each path are reported; CPython release builds do not expose a count
+of malloc calls.
+
+Usage:
+python benchmarks/bench_framing.py --telegrams 100000
+"""
+
+import sys
+import time
+import argparse
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from wxt_serial import TelegramStream, clean_telegram
+from wxt_simulator import WXTSimulator
+
+def legacy_clean(line):
+    """Former app.py:clean_telegram"""
+    return b''.join(bytes([byte]) for byte in line if byte  > 14)
+
+class BufferSerial:
+    """Serial port stand-in returning a byte buffer in fixed size reads"""
+    def __init__(self, data, chunk=256):
+        self.data = memoryview(data)
+        self.chunk = chunk
+        self.position = 0
+
+    @property
+    def in_waiting(self):
+        return min(self.chunk, len(self.data) - self.position)
+
+    def read(self, size=1):
+        data = bytes(self.data[self.position:self.position + size])
+        self.position += len(data)
+        return data
+
+def synthetic_stream(ntelegrams, crc=False):
+    """Generate a raw automatic message stream with the simulator"""
+    simulator = WXTSimulator(seed=1)
+    commands = ('0r1', '0r2', '0r3', '0r5') if crc else ('0R1', '0R2', '0R3', '0R5')
+    return b''.join(simulator.telegram(commands[i % len(commands)])
+                    for i in range(ntelegrams))
+
+def frame(data):
+    """Frame all telegrams of a raw stream"""
+    stream = TelegramStream(BufferSerial(data))
+    telegrams = []
+    while True:
+        lines = stream.read()
+        if not lines:
+            return telegrams
+        telegrams.extend(lines)
+
+def measure(label, function, lines):
+    """Time and trace the allocations of cleaning every line"""
+    start = time.perf_counter()
+    for line in lines:
+        function(line)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    for line in lines:
+        function(line)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:24s} {elapsed / len(lines) * 1e6:8.2f} us/telegram,"
+          f" peak {peak / 1024:8.1f} KiB")
+    return elapsed
+
+def main(args):
+    """Frame the stream, then time the legacy and translate cleaning paths"""
+    data = Path(args.input).read_bytes() if args.input else synthetic_stream(args.telegrams)
+    crc_data = synthetic_stream(args.telegrams, crc=True)
+
+    start = time.perf_counter()
+    lines = frame(data)
+    elapsed = time.perf_counter() - start
+    print(f"Framed {len(lines)} telegrams ({len(data) / 1e6:.1f} MB) in"
+          f" {elapsed / len(lines) * 1e6:.2f} us/telegram")
+    crc_lines = frame(crc_data)
+
+    legacy = measure("legacy generator", legacy_clean, lines)
+    translate = measure("translate", clean_telegram, lines)
+    measure("translate + CRC", lambda line: clean_telegram(line, crc=True), crc_lines)
+    print(f"speedup: {legacy / translate:.1f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark telegram framing and cleaning")
+    parser.add_argument("--input",
+                        type=str,
+                        default=None,
+                        dest="input",
+                        help="[str|Default None] Raw serial capture, synthesized if not given"
+                        )
+    parser.add_argument("--telegrams",
+                        type=int,
+                        default=100000,
+                        dest="telegrams",
+                        help="[int|Default 100000] Number of synthesized telegrams"
+                        )
+    args = parser.parse_args()
+
+    main(args)
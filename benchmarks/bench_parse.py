@@ -0,0 +1,157 @@
+"""
+Micro-benchmark of the single-pass telegram parser in app.py against the
+original parse.search implementation.
+
+Usage:
+python benchmarks/bench_parse.py --number 20000
+"""
+
+import sys
+import timeit
+import argparse
+from pathlib import Path
+
+import parse
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from wxt_parse import parse_values
+
+# Representative telegrams, with the checksum characters already removed
+TELEGRAMS = [b'0R0,Dm=166D,Sm=4.9M,Ta=20.4C,Ua=64.9P,Pa=989.5H,Rc=13.84M,Hc=0.0M,Th=25.4C,Vh=12.1N,Vs=12.2V,Vr=3.498V',
+             b'0R0,Dm=166D,Sm=4.9M,Ta=20.4C,Ua=64.9P,Pa=989.5H,Rc=13.84M,Th=25.4C,Vh=0.0#',
+             b'0R1,Dn=160D,Dm=166D,Dx=172D,Sn=3.1M,Sm=4.9M,Sx=6.2M',
+             b'0R2,Ta=20.4C,Ua=64.9P,Pa=989.5H',
+             b'0R3,Rc=13.84M,Rd=120S,Ri=2.4M,Hc=0.0M,Hd=0S,Hi=0.0M',
+             ]
+
+def parse_values_legacy(sample, **kwargs):
+    """Original parse.search implementation of app.parse_values"""
+    ndict = None
+    if sample.startswith(b'0R0'):
+        data = parse.search("Dm={:d}D," +
+                    "Sm={:f}M," +
+                    "Ta={:f}C," +
+                    "Ua={:f}P," +
+                    "Pa={:f}H," +
+                    "Rc={:f}M," +
+                    "Hc={:f}M," +
+                    "Th={:f}C," +
+                    "Vh={:f}",
+                    sample.decode('utf-8')
+        )
+        if data:
+            parms = ['Dm', 'Sm', 'Ta', 'Ua', 'Pa', 'Rc', 'Hc', 'Th', 'Vh']
+            strip = [float(var) for var in data]
+            ndict = dict(zip(parms, strip))
+            if parse.search("Vs={:f}V,", sample.decode('utf-8')):
+                ndict.update({'Vs' : [float(var) for var in parse.search("Vs={:f}V", sample.decode('utf-8'))][0]})
+            if parse.search("Vr={:f}V,", sample.decode('utf-8')):
+                ndict.update({'Vr' : [float(var) for var in parse.search("Vr={:f}V", sample.decode('utf-8'))][0]})
+            if parse.search("Vh={:f}N", sample.decode('utf-8')):
+                ndict.update({'Jo' : 1})
+            elif parse.search("Vh={:f}V", sample.decode('utf-8')):
+                ndict.update({'Jo' : 2})
+            elif parse.search("Vh={:f}W", sample.decode('utf-8')):
+                ndict.update({'Jo' : 3})
+            elif parse.search("Vh={:f}F", sample.decode('utf-8')):
+                ndict.update({'Jo' : 5})
+            else:
+                ndict.update({'Jo' : 0})
+        else:
+            data = parse.search("Dm={:d}D," +
+                                "Sm={:f}M," +
+                                "Ta={:f}C," +
+                                "Ua={:f}P," +
+                                "Pa={:f}H," +
+                                "Rc={:f}M," +
+                                "Th={:f}C," +
+                                "Vh={:f}",
+                                sample.decode('utf-8')[:-1]
+            )
+            if data:
+                parms = ['Dm', 'Sm', 'Ta', 'Ua', 'Pa', 'Rc', 'Th', 'Vh']
+                strip = [float(var) for var in data]
+                ndict = dict(zip(parms, strip))
+                if sample.decode('utf-8')[-1] == 'N':
+                    ndict.update({'Jo' : 1})
+                elif sample.decode('utf-8')[-1] == 'V':
+                    ndict.update({'Jo' : 2})
+                elif sample.decode('utf-8')[-1] == 'W':
+                    ndict.update({'Jo' : 3})
+                elif sample.decode('utf-8')[-1] == 'F':
+                    ndict.update({'Jo' : 5})
+                else:
+                    ndict.update({'Jo' : 0})
+    elif sample.startswith(b'0R1'):
+        parms = ['Dn', 'Dm', 'Dx', 'Sn', 'Sm', 'Sx']
+        data = parse.search("Dn={:d}D," +
+                            "Dm={:d}D," +
+                            "Dx={:d}D," +
+                            "Sn={:f}M," +
+                            "Sm={:f}M," +
+                            "Sx={:f}M",
+                            sample.decode('utf-8')
+                            )
+        if data:
+            strip = [float(var) for var in data]
+            ndict = dict(zip(parms, strip))
+    elif sample.startswith(b'0R2'):
+        parms = ['Ta', 'Ua', 'Pa']
+        data = parse.search("Ta={:f}C," +
+                            "Ua={:f}P," +
+                            "Pa={:f}H",
+                            sample.decode('utf-8')
+                            )
+        if data:
+            strip = [float(var) for var in data]
+            ndict = dict(zip(parms, strip))
+    elif sample.startswith(b'0R3'):
+        parms = ['Rc', 'Rd', 'Ri', 'Hc', 'Hd', 'Hi']
+        data = parse.search("Rc={:f}M," +
+                            "Rd={:f}S," +
+                            "Ri={:f}M," +
+                            "Hc={:f}M," +
+                            "Hd={:f}S," +
+                            "Hi={:f}M",
+                            sample.decode('utf-8')
+                            )
+        if data:
+            strip = [float(var) for var in data]
+            ndict = dict(zip(parms, strip))
+    return ndict
+
+def main(args):
+    """Verify both parsers agree, then time each over the telegram set"""
+    for telegram in TELEGRAMS:
+        legacy = parse_values_legacy(telegram) or {}
+        current = parse_values(telegram) or {}
+        # Note: the legacy patterns miss a trailing Vr field and integer
+        #   Rd/Hd durations, so only require the legacy values to be kept.
+        if any(current.get(key) != value for key, value in legacy.items()):
+            print(f"Mismatch for {telegram}:\n  legacy:  {legacy}\n  current: {current}")
+
+    print(f"{'telegram':<8} {'legacy [us]':>12} {'current [us]':>13} {'speedup':>8}")
+    for telegram in TELEGRAMS:
+        legacy = min(timeit.repeat(lambda: parse_values_legacy(telegram),
+                                   number=args.number, repeat=args.repeat)) / args.number
+        current = min(timeit.repeat(lambda: parse_values(telegram),
+                                    number=args.number, repeat=args.repeat)) / args.number
+        print(f"{telegram[:3].decode():<8} {legacy * 1e6:>12.2f} {current * 1e6:>13.2f} {legacy / current:>7.1f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the WXT telegram parser")
+    parser.add_argument("--number",
+                        type=int,
+                        default=2000,
+                        dest="number",
+                        help="[int|Default 2000] Parser calls per timing repeat"
+                        )
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=5,
+                        dest="repeat",
+                        help="[int|Default 5] Number of timing repeats"
+                        )
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,110 @@
+"""
+Benchmark of the publish latency saved by sharing one Plugin session.
+
+Publishes the averaged variables with a new Plugin per publish (the
+previous behaviour of app.publish_avg) and through a shared
+wxt_uplink.PluginSession, timing the whole publish_avg call including
+entering and closing the Plugin. A real waggle.plugin.Plugin is used: it
+enters and exits without a broker (messages are queued in memory), and
+its close waits for the publisher thread, about 1 s, which the shared
+session pays once instead of at every publish. --fake uses the FakePlugin
+stand-in with the simulated --connect-latency and --close-latency.
+
+Usage:
+python benchmarks/bench_plugin.py --publishes 5
+"""
+
+import sys
+import time
+import argparse
+import functools
+import contextlib
+from types import SimpleNamespace
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app import publish_avg
+from wxt_parse import parse_values
+from wxt_stats import RunningAverage
+from waggle.plugin import Plugin
+from wxt_uplink import PluginSession
+from fake_plugin import FakePlugin
+
+PUBLISH_NAMES = {"Dm" : ["wxt.wind.direction", "Mean Wind Direction", "degrees"],
+                 "Sm" : ["wxt.wind.speed", "Mean Wind Speed", "m/s"],
+                 "Ta" : ["wxt.env.temp", "Air Temperature", "C"],
+                 "Ua" : ["wxt.env.humidity", "Relative Humidity", "%"],
+                 "Pa" : ["wxt.env.pressure", "Atmospheric Static Air Pressure", "hPa"],
+                 "Rc" : ["wxt.rain.accumulation", "Rain Accumulation", "mm"],
+                 "Th" : ["wxt.heater.temp", "Heater Temperature", "C"],
+                 "Vh" : ["wxt.heater.volt", "Heater Voltage", "V"],
+                 "Jo" : ["wxt.heater.status", "Heater Status", "Unitless"]
+                }
+
+def run(sessions, publishes):
+    """
+    Publish the averaged sample publishes times, return seconds per publish.
+
+    sessions is called once per publish and returns the context manager
+    providing the Plugin session for that publish.
+    """
+    args = SimpleNamespace(beehive_interval=15)
+    accumulator = RunningAverage()
+    accumulator.update(parse_values(b'0R0,Dm=166D,Sm=4.9M,Ta=20.4C,Ua=64.9P,'
+                                    b'Pa=989.5H,Rc=13.84M,Th=25.4C,Vh=0.0#'))
+    start = time.perf_counter()
+    for _ in range(publishes):
+        with sessions() as session:
+            publish_avg(args, accumulator, PUBLISH_NAMES, session)
+    return (time.perf_counter() - start) / publishes
+
+def main(args):
+    """Compare a new Plugin per publish against the shared session"""
+    if args.fake:
+        factory = functools.partial(FakePlugin,
+                                    connect_latency=args.connect_latency,
+                                    close_latency=args.close_latency)
+    else:
+        factory = Plugin
+    # Previous behaviour, a new Plugin is entered and closed for every publish
+    legacy = run(lambda: PluginSession(factory), args.publishes)
+    # The shared session is entered once and closed after the last publish,
+    # its setup and teardown are spread over the publishes
+    start = time.perf_counter()
+    with PluginSession(factory) as shared_session:
+        steady = run(lambda: contextlib.nullcontext(shared_session), args.publishes)
+    shared = (time.perf_counter() - start) / args.publishes
+    print(f"{'FakePlugin' if args.fake else 'waggle.plugin.Plugin'}, {args.publishes} publishes")
+    print(f"New Plugin per publish: {legacy * 1e3:8.2f} ms per publish_avg")
+    print(f"Shared PluginSession:   {shared * 1e3:8.2f} ms per publish_avg"
+          f" (including one setup and close), {steady * 1e3:.2f} ms once open")
+    print(f"Latency saved:          {(legacy - shared) * 1e3:8.2f} ms per publish_avg")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark shared Plugin session publishing")
+    parser.add_argument("--publishes",
+                        type=int,
+                        default=5,
+                        dest="publishes",
+                        help="[int|Default 5] Number of publish_avg calls"
+                        )
+    parser.add_argument("--fake",
+                        action="store_true",
+                        dest="fake",
+                        help="Use the FakePlugin stand-in instead of waggle.plugin.Plugin"
+                        )
+    parser.add_argument("--connect-latency",
+                        type=float,
+                        default=0.05,
+                        dest="connect_latency",
+                        help="[float|Default 0.05 sec] Simulated FakePlugin connection setup"
+                        )
+    parser.add_argument("--close-latency",
+                        type=float,
+                        default=0.05,
+                        dest="close_latency",
+                        help="[float|Default 0.05 sec] Simulated FakePlugin flush and teardown"
+                        )
+    args = parser.parse_args()
+
+    main(args)
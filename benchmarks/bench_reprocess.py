@@ -0,0 +1,91 @@
+"""
+Benchmark of wxt_reprocess.py: reprocessing time of a synthetic archive of
+1 Hz local CSV files (15 minute files of the app.py columns), for a number
+of worker processes.
+
+Usage:
+python benchmarks/bench_reprocess.py --days 7 --interval 15min --workers 1 4
+"""
+
+import csv
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import wxt_reprocess
+from bench_storage import VARIABLES
+
+FILE_SECONDS = 900
+
+def write_archive(outdir, days, seed=1):
+    """Write days of 15 minute 1 Hz local CSV files, returns the total size in bytes"""
+    rng = np.random.default_rng(seed)
+    start = int(datetime(2023, 10, 10, tzinfo=timezone.utc).timestamp())
+    keys = list(VARIABLES)
+    size = 0
+    for first in range(start, start + days * 86400, FILE_SECONDS):
+        times = np.arange(first, first + FILE_SECONDS)
+        values = rng.normal(50, 10, (FILE_SECONDS, len(keys))).round(1)
+        values[:, keys.index('Jo')] = 1
+        name = f"bench.wxt536.{datetime.fromtimestamp(first, timezone.utc):%Y%m%d.%H%M%S}.csv"
+        path = Path(outdir) / name
+        with open(path, mode='w', newline='', encoding="utf-8") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['Timestamp'] + [info[1] for info in VARIABLES.values()])
+            writer.writerow(['UTC seconds'] + [info[2] for info in VARIABLES.values()])
+            writer.writerow(['Timestamp'] + [info[0] for info in VARIABLES.values()])
+            writer.writerow(['time'] + keys)
+            stamps = np.datetime_as_string(times.astype('datetime64[s]'))
+            writer.writerows([f"{stamp}+00:00", *row] for stamp, row in zip(stamps, values.tolist()))
+        size += path.stat().st_size
+    return size
+
+def main(args):
+    """Reprocess the same archive with each number of workers"""
+    interval = wxt_reprocess.parse_interval(args.interval)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        start = time.perf_counter()
+        size = write_archive(tmpdir, args.days)
+        paths = wxt_reprocess.find_local_files(tmpdir)[("bench", None)]
+        print(f"{len(paths)} files, {size / 1e6:.0f} MB, {args.days * 86400} samples"
+              f" (written in {time.perf_counter() - start:.0f} s)")
+        for workers in args.workers:
+            start = time.perf_counter()
+            variables, sums, _ = wxt_reprocess.reprocess(paths, interval, workers=workers)
+            wxt_reprocess.write_averages(Path(tmpdir) / "out.parquet", "parquet", variables,
+                                         sums, interval, {})
+            elapsed = time.perf_counter() - start
+            print(f"workers {workers:3d}: {elapsed:7.1f} s, {size / 1e6 / elapsed:6.1f} MB/s,"
+                  f" {args.days * 86400 / elapsed / 1e6:5.2f} M samples/s,"
+                  f" a year in {elapsed * 365 / args.days / 60:5.1f} min")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark of the offline reprocessing")
+    parser.add_argument("--days",
+                        type=int,
+                        default=7,
+                        dest="days",
+                        help="[int|Default 7] Days of 1 Hz samples in the synthetic archive"
+                        )
+    parser.add_argument("--interval",
+                        type=str,
+                        default="15min",
+                        dest="interval",
+                        help="[str|Default 15min] Averaging interval"
+                        )
+    parser.add_argument("--workers",
+                        type=int,
+                        nargs="+",
+                        default=[1],
+                        dest="workers",
+                        help="[int|Default 1] Numbers of worker processes to benchmark"
+                        )
+    args = parser.parse_args()
+
+    main(args)
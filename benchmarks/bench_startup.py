@@ -0,0 +1,68 @@
+"""
+Startup-time and peak-RSS benchmark of the plugin runtime imports.
+
+Compares importing app.py as shipped against the previous runtime, which
+additionally loaded pandas and xarray at module import. Each measurement
+runs in a fresh interpreter.
+
+Usage:
+python benchmarks/bench_startup.py --repeat 5
+"""
+
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+MODES = {"lightweight" : "import app",
+         "pandas/xarray" : "import app; import pandas; import xarray",
+         }
+
+CHILD = """
+import sys, time, resource
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def measure(statement):
+    """Run the import statement in a fresh interpreter, return wall/import time and RSS"""
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", CHILD.format(root=str(ROOT), statement=statement)],
+                            check=True,
+                            capture_output=True,
+                            text=True).stdout
+    wall = time.perf_counter() - start
+    elapsed, maxrss = output.split()
+    # Note: ru_maxrss is reported in kilobytes on Linux
+    return wall, float(elapsed), int(maxrss) / 1024
+
+def main(args):
+    """Measure each import mode and print the median results"""
+    print(f"{'mode':<15} {'process [s]':>12} {'imports [s]':>12} {'peak RSS [MB]':>14}")
+    for mode, statement in MODES.items():
+        try:
+            results = [measure(statement) for _ in range(args.repeat)]
+        except subprocess.CalledProcessError as err:
+            print(f"{mode:<15} unavailable ({err.stderr.strip().splitlines()[-1]})")
+            continue
+        wall, imports, rss = (statistics.median(values) for values in zip(*results))
+        print(f"{mode:<15} {wall:>12.3f} {imports:>12.3f} {rss:>14.1f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark plugin startup time and memory")
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=5,
+                        dest="repeat",
+                        help="[int|Default 5] Number of fresh interpreters per mode"
+                        )
+    args = parser.parse_args()
+
+    main(args)
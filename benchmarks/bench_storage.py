@@ -0,0 +1,110 @@
+"""
+Benchmark of the local file formats: file size, write and read time of a
+day of simulated 1 Hz samples for CSV, Parquet and NetCDF. Formats whose
+library (pyarrow, netCDF4) is not installed are skipped.
+
+Usage:
+python benchmarks/bench_storage.py --samples 86400
+"""
+
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from wxt_storage import STORAGE_FORMATS
+from wxt_simulator import WXTSimulator
+from wxt_parse import parse_values
+
+# Columns written by app.py
+VARIABLES = {"Dm" : ["wxt.wind.direction", "Mean Wind Direction", "degrees"],
+             "Sm" : ["wxt.wind.speed", "Mean Wind Speed", "m/s"],
+             "Ta" : ["wxt.env.temp", "Air Temperature", "C"],
+             "Ua" : ["wxt.env.humidity", "Relative Humidity", "%"],
+             "Pa" : ["wxt.env.pressure", "Atmospheric Static Air Pressure", "hPa"],
+             "Rc" : ["wxt.rain.accumulation", "Rain Accumulation", "mm"],
+             "Rd" : ["wxt.rain.duration", "Rain Duration", "s"],
+             "Ri" : ["wxt.rain.intensity", "Rain Intensity", "mm/h"],
+             "Rp" : ["wxt.rain.peak", "Rain Peak Intensity", "mm/h"],
+             "Hc" : ["wxt.hail.accumulation", "Hail Accumulation", "mm"],
+             "Hd" : ["wxt.hail.duration", "Hail Duration", "s"],
+             "Hi" : ["wxt.hail.intensity", "Hail Intensity", "mm/h"],
+             "Hp" : ["wxt.hail.peak", "Hail Peak Intensity", "mm/h"],
+             "Th" : ["wxt.heater.temp", "Heater Temperature", "C"],
+             "Vh" : ["wxt.heater.volt", "Heater Voltage", "V"],
+             "Vs" : ["wxt.voltage.supply", "Supply Voltage", "V"],
+             "Vr" : ["wxt.voltage.reference", "Reference Voltage", "V"],
+             "Jo" : ["wxt.heater.status", "Heater Status", "Unitless"]
+            }
+
+def synthetic_records(nsamples):
+    """Simulated 0R0 samples as (timestamp, values) records"""
+    simulator = WXTSimulator(seed=1)
+    start = datetime(2023, 10, 10, tzinfo=timezone.utc)
+    records = []
+    for i in range(nsamples):
+        sample = parse_values(simulator.telegram('0R0')[:-2])
+        records.append((start + timedelta(seconds=i), [sample.get(key) for key in VARIABLES]))
+    return records
+
+def read_back(storage, path):
+    """Read all columns of a file"""
+    if storage == 'csv':
+        import pandas
+        return pandas.read_csv(path, header=None)
+    if storage == 'parquet':
+        import pyarrow.parquet
+        return pyarrow.parquet.read_table(path)
+    import netCDF4
+    with netCDF4.Dataset(path) as dataset:
+        return {name : dataset[name][:] for name in dataset.variables}
+
+def main(args):
+    """Write and read the same records in every available format"""
+    records = synthetic_records(args.samples)
+    print(f"{args.samples} samples")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for storage, (suffix, writer_class) in STORAGE_FORMATS.items():
+            path = Path(tmpdir) / ('bench' + suffix)
+            start = time.perf_counter()
+            try:
+                if storage == 'csv':
+                    writer = writer_class(path, flush_rows=args.flush_rows)
+                else:
+                    writer = writer_class(path, VARIABLES, flush_rows=args.flush_rows)
+            except ImportError as err:
+                print(f"{storage:8s} skipped: {err}")
+                continue
+            for timestamp, values in records:
+                writer.write_record(timestamp, values)
+            writer.close()
+            write = time.perf_counter() - start
+            start = time.perf_counter()
+            try:
+                read_back(storage, path)
+                read = f"{time.perf_counter() - start:6.3f} s"
+            except ImportError:
+                read = "   n/a"
+            print(f"{storage:8s} {path.stat().st_size / 1e6:8.2f} MB,"
+                  f" write {write:6.2f} s, read {read}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the local file formats")
+    parser.add_argument("--samples",
+                        type=int,
+                        default=86400,
+                        dest="samples",
+                        help="[int|Default 86400] Number of samples, one day at 1 Hz"
+                        )
+    parser.add_argument("--flush-rows",
+                        type=int,
+                        default=900,
+                        dest="flush_rows",
+                        help="[int|Default 900] Records per flush (row group)"
+                        )
+    args = parser.parse_args()
+
+    main(args)
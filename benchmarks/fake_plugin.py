@@ -0,0 +1,65 @@
+"""
+Local stand-in for the Waggle Plugin interface.
+
+Records published messages and uploaded files in memory and models the
+cost of setting up and tearing down a Plugin connection, so the publishing
+code in app.py can be exercised without a Waggle node.
+"""
+
+import time
+import threading
+
+class FakePlugin:
+    """
+    Stand-in for waggle.plugin.Plugin.
+
+    Parameters:
+        connect_latency: Seconds spent entering the Plugin (connection setup)
+        close_latency: Seconds spent exiting the Plugin (flush and teardown)
+        fail_after: Raise ConnectionError on every fail_after-th call to
+            publish/upload_file, None to never fail
+    """
+    # Messages and uploads of all instances, shared like the Beehive would be
+    messages = []
+    uploads = []
+    _lock = threading.Lock()
+
+    def __init__(self, connect_latency=0.05, close_latency=0.05, fail_after=None):
+        self.connect_latency = connect_latency
+        self.close_latency = close_latency
+        self.fail_after = fail_after
+        self.calls = 0
+        self.open = False
+
+    def __enter__(self):
+        time.sleep(self.connect_latency)
+        self.open = True
+        return self
+
+    def __exit__(self, *exc):
+        time.sleep(self.close_latency)
+        self.open = False
+
+    def _check(self):
+        if not self.open:
+            raise RuntimeError("Plugin can only be used inside a with block!")
+        self.calls += 1
+        if self.fail_after and self.calls % self.fail_after == 0:
+            raise ConnectionError("simulated connection loss")
+
+    def publish(self, name, value, meta={}, timestamp=None, scope="all", timeout=None):
+        self._check()
+        with self._lock:
+            self.messages.append((name, value, dict(meta), timestamp, scope))
+
+    def upload_file(self, path, meta={}, timestamp=None, keep=False):
+        self._check()
+        with self._lock:
+            self.uploads.append((str(path), dict(meta), timestamp))
+
+    @classmethod
+    def clear(cls):
+        """Forget all recorded messages and uploads"""
+        with cls._lock:
+            cls.messages.clear()
+            cls.uploads.clear()
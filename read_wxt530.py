@@ -1,14 +1,17 @@
 import serial
 import time
 import argparse
-import csv
+import signal
 
-from datetime import datetime
+from datetime import datetime, timezone
+
+from wxt_storage import BufferedCSVWriter, NetCDFWriter
+from wxt_serial import clean_telegram, discover_port
+from wxt_parse import parse_values, FIELD_KEYS
 
 # To display current ports:
 # python -m serial.tools.list_ports
-
-## needs a search ports functionality
+# or use --device auto to probe the ports for the WXT
     
 def pollsave(ser, args):
     # check if you need to poll the data
@@ -30,7 +33,27 @@ def pollsave(ser, args):
 
     return datatime
 
+def netcdf_variables():
+    """Variables of the NetCDF file, every telegram field and heater status"""
+    variables = {key : [key, key, ''] for key in FIELD_KEYS.values()}
+    variables['Jo'] = ['Jo', 'Heater Status', 'Unitless']
+    return variables
+
+def handle_sigterm(signum, frame):
+    # stop the acquisition loop so buffered rows are written out
+    raise KeyboardInterrupt
+
 def main(args):
+    # write out buffered rows when the process is stopped
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    # search the serial ports for the WXT if requested
+    if args.device == 'auto':
+        port = discover_port(args.baud_rate)
+        if port is None:
+            print('No WXT found on the serial ports')
+            return
+        print('Found the WXT on ', port.device)
+        args.device = port.device
     # start serial connection:
     with serial.Serial(args.device, args.baud_rate, timeout = 1) as ser:
         # create a file to write data to
@@ -38,26 +61,40 @@ def main(args):
         # check desired output from user. supports netcdf or csv
         if args.output == 'nc' or args.output == 'netcdf':
             filename = nfile + '.nc'
+            # parsed values are stored as compressed float32 columns
+            variables = netcdf_variables()
+            writer = NetCDFWriter(filename,
+                                  variables,
+                                  flush_rows=args.flush_rows,
+                                  attrs={'site' : args.site, 'query' : args.query})
         else:
             filename = nfile + '.csv'
-        # While Serial connection is valid
-        while True:
-            # query the instrument
-            ndata = pollsave(ser, args)
-            # check to see if anything is returned
-            ### Add debug line here? -> check how to store values
-            if ndata:
-                if args.output == 'nc' or args.output == 'netcdf':
-                    print("Needs support... switch to csv")
-                else:
-                    # Append to the file. 
-                    with open(filename, "a") as myfile:
+            # keep the file open and write rows in batches
+            writer = BufferedCSVWriter(filename, flush_rows=args.flush_rows)
+        try:
+            # While Serial connection is valid
+            while True:
+                # query the instrument
+                ndata = pollsave(ser, args)
+                # check to see if anything is returned
+                ### Add debug line here? -> check how to store values
+                if ndata:
+                    if args.output == 'nc' or args.output == 'netcdf':
+                        sample = parse_values(clean_telegram(ndata.split(',', 1)[1].encode('utf-8')))
+                        if sample:
+                            writer.write_record(datetime.now(timezone.utc),
+                                                [sample.get(key) for key in variables])
+                    else:
+                        # Append to the file.
                         try:
-                            writer = csv.writer(myfile, delimiter=",")
                             writer.writerow(ndata.strip().split(','))
-                        except:
+                        except OSError:
                             print('Unable to write to file: ', filename)
-            time.sleep(args.freq)
+                time.sleep(args.freq)
+        except KeyboardInterrupt:
+            print('Program interrupted, closing ', filename)
+        finally:
+            writer.close()
  
 if __name__ == '__main__':
      parser = argparse.ArgumentParser(
@@ -72,7 +109,8 @@ if __name__ == '__main__':
                          type=str,
                          dest='device',
                          default="/dev/ttyUSB0",
-                         help="Specific Serial Port for Device Communication"
+                         help="Specific Serial Port for Device Communication" +
+                              " (auto to search the ports for the WXT)"
                          )
      parser.add_argument("--baudrate",
                          type=int,
@@ -102,6 +140,12 @@ if __name__ == '__main__':
                          default="atmos",
                          help="Site Identifier for Filename"
                          )
+     parser.add_argument("--flush-rows",
+                         type=int,
+                         default=60,
+                         dest="flush_rows",
+                         help="Number of samples buffered before writing to file"
+                         )
      parser.add_argument("--frequency",
                          type=int,
                          default=1,
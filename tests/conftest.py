@@ -0,0 +1,28 @@
+"""
+Shared fixtures of the tests. The plugin modules live in the repository
+root and the FakePlugin stand-in in benchmarks/, both are importable here.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from wxt_simulator import WXTSimulator
+from fake_plugin import FakePlugin
+
+@pytest.fixture
+def simulator():
+    """WXT simulator with a fixed seed, telegrams are built without the pty"""
+    return WXTSimulator(seed=1, heater='#NVWF')
+
+@pytest.fixture
+def fake_plugin():
+    """FakePlugin class with its recorded messages and uploads cleared"""
+    FakePlugin.clear()
+    yield FakePlugin
+    FakePlugin.clear()
@@ -0,0 +1,72 @@
+"""Tests of the adaptive query and publish rates"""
+
+import pytest
+
+from wxt_adaptive import AdaptiveRate
+
+class FakeClock:
+    """Clock set by the test"""
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def controller(clock, **kwargs):
+    settings = dict(rain=0.1, wind_std=1.5, pressure=1.0, window=600.0, hold=1800.0)
+    return AdaptiveRate((1, 10), (5, 30), clock=clock, **{**settings, **kwargs})
+
+def feed(adaptive, clock, seconds, sample):
+    """Add a sample every 10 s for seconds"""
+    for _ in range(int(seconds // 10)):
+        clock.now += 10
+        adaptive.update(sample(clock.now) if callable(sample) else sample)
+
+def test_backs_off_when_quiet():
+    clock = FakeClock(0.0)
+    adaptive = controller(clock)
+    assert adaptive.active and adaptive.query_interval == 1 and adaptive.publish_interval == 5
+    feed(adaptive, clock, 1700, {'Sm' : 3.0, 'Rc' : 1.0, 'Pa' : 990.0})
+    assert adaptive.active
+    feed(adaptive, clock, 200, {'Sm' : 3.0, 'Rc' : 1.0, 'Pa' : 990.0})
+    assert not adaptive.active
+    assert adaptive.query_interval == 10 and adaptive.publish_interval == 30
+    assert adaptive.pop_change() and not adaptive.pop_change()
+
+@pytest.mark.parametrize("sample", [
+    # Rain
+    lambda now: {'Rc' : now / 1000},
+    # Gusty wind
+    lambda now: {'Sm' : 10.0 if now % 20 else 2.0},
+    # Falling pressure, 3 hPa/h
+    lambda now: {'Pa' : 1000.0 - now * 3 / 3600}])
+def test_drivers_switch_to_active(sample):
+    clock = FakeClock(0.0)
+    adaptive = controller(clock)
+    feed(adaptive, clock, 1900, {'Sm' : 3.0, 'Rc' : 0.0, 'Pa' : 1000.0})
+    assert not adaptive.active and adaptive.pop_change()
+    feed(adaptive, clock, 600, sample)
+    assert adaptive.active and adaptive.pop_change()
+
+def test_accumulation_reset_not_rain():
+    clock = FakeClock(0.0)
+    adaptive = controller(clock, hold=600.0)
+    feed(adaptive, clock, 700, {'Rc' : 5.0})
+    assert not adaptive.active
+    feed(adaptive, clock, 600, {'Rc' : 0.0})
+    assert not adaptive.active
+
+def test_metrics():
+    clock = FakeClock(0.0)
+    adaptive = controller(clock, hold=600.0)
+    feed(adaptive, clock, 620, {'Sm' : 3.0})
+    assert not adaptive.active
+    adaptive.reset_counts()
+    # An hour quiet: 10 s instead of 1 s queries, 30 instead of 5 minute publishes
+    feed(adaptive, clock, 3600, {'Sm' : 3.0})
+    metrics = adaptive.metrics()
+    assert metrics["adaptive.active"] == 0
+    assert metrics["adaptive.active_fraction"] == 0.0
+    assert metrics["adaptive.queries_saved"] == 3600 - 360
+    assert metrics["adaptive.publishes_saved"] == 10.0
+    assert metrics["adaptive.wind_std"] == 0.0
@@ -0,0 +1,100 @@
+"""Tests of the acquisition pipeline of app.py"""
+
+import argparse
+import functools
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+import app
+from wxt_stats import RunningAverage
+from wxt_uplink import PluginSession
+
+PUBLISH_NAMES = {"Ta" : ["wxt.env.temp", "Air Temperature", "degree Celsius"],
+                 "Ua" : ["wxt.env.humidity", "Relative Humidity", "percent"]}
+
+READ_TIME = 1_700_000_000_123_000_000
+
+def decode_args():
+    return argparse.Namespace(crc=False, debug=False, beehive_interval=1, gust_window=3,
+                              instrument=None)
+
+class RecordingWriter:
+    """Writer keeping the written records in memory"""
+    def __init__(self):
+        self.records = []
+
+    def write_record(self, timestamp, values):
+        self.records.append((timestamp, values))
+
+def test_merge_stamps_read_time():
+    telegrams = [(READ_TIME, b'0R2,Ta=20.0C,Ua=60.0P,Pa=990.0H\r\n'),
+                 (READ_TIME + 5, b'0R5,Th=20.0C,Vh=0.0#,Vs=12.0V,Vr=3.500V\r\n'),
+                 (READ_TIME + 10, b'0R2,Ta=21.0C,Ua=61.0P,Pa=990.0H\r\n')]
+    records = app.merge_telegrams(decode_args(), telegrams, PUBLISH_NAMES)
+    # A repeated command starts a new record stamped with its own read time
+    assert [timestamp for timestamp, _ in records] == [READ_TIME, READ_TIME + 10]
+    assert records[0][1]['Jo'] == 0 and records[1][1]['Ta'] == 21.0
+
+def test_record_and_publish_stamped_with_read_time(fake_plugin):
+    writer = RecordingWriter()
+    accumulator = RunningAverage()
+    # Recorded long after the read, e.g. queued by the asyncio engine
+    app.record_sample({"Ta" : 20.0, "Ua" : 60.0}, PUBLISH_NAMES, READ_TIME,
+                      writer=writer, accumulator=accumulator)
+    read_at = datetime.fromtimestamp(READ_TIME / 1e9, timezone.utc)
+    assert writer.records == [(read_at, [20.0, 60.0])]
+    with PluginSession(functools.partial(fake_plugin, 0, 0)) as session:
+        app.publish_avg(decode_args(), accumulator, PUBLISH_NAMES, session)
+    assert [message[3] for message in fake_plugin.messages] == [READ_TIME, READ_TIME]
+
+@pytest.mark.parametrize("silence, valid", [(10, False), (11, False), (11.5, True), (0, True)])
+def test_silence_exceeds_query_interval(silence, valid):
+    args = argparse.Namespace(qc=False, adaptive=False, mode="poll", query_interval=10,
+                              silence_timeout=silence, device="/dev/null", baud_rate=19200,
+                              reconnect_max=60, outdir="/nonexistent", instrument=None,
+                              beehive_interval=0)
+    if valid:
+        # Fails later, opening /dev/null as a serial port
+        unit = app.start_instrument(args, PUBLISH_NAMES, None, None)
+        assert not unit.connection.connected
+    else:
+        with pytest.raises(ValueError, match="Silence timeout"):
+            app.start_instrument(args, PUBLISH_NAMES, None, None)
+
+def cli_args(tmp_path, instruments, **settings):
+    """Command line arguments with an --instruments file of the given entries"""
+    path = tmp_path / "instruments.json"
+    path.write_text(json.dumps(instruments), encoding="utf-8")
+    defaults = dict(instruments=str(path), device="auto", site="W1", query=["0R0"],
+                    query_interval=1, mode="poll", stream_config=["0XU,M=A"], crc=False,
+                    profile=False, beehive_interval=1, adaptive=False, quiet_publish_interval=30,
+                    outdir=str(tmp_path), engine="sync", compress="none", compress_level=None,
+                    upload_queue_size=100, backfill_rate=60, retention_days=30)
+    return argparse.Namespace(**{**defaults, **settings})
+
+def test_instrument_args(tmp_path):
+    args = cli_args(tmp_path, [{"name" : "north", "device" : "/dev/ttyUSB0"},
+                               {"name" : "south", "device" : "/dev/ttyUSB1", "crc" : True,
+                                "query" : "0R1 0R2", "beehive_interval" : 20}])
+    north, south = app.instrument_args(args)
+    assert (north.instrument, north.device, north.query) == ("north", "/dev/ttyUSB0", ["0R0"])
+    assert (south.instrument, south.query, south.stream_config) == \
+        ("south", ["0r1", "0r2"], ["0XU,M=a"])
+    assert north.site == south.site == "W1"
+    # The backfill leaves the files of the slowest instrument alone
+    assert app.backfill_min_age([north, south]) == 20 * 120
+    assert app.backfill_min_age([north]) == 15 * 120
+
+@pytest.mark.parametrize("entries, match", [
+    ([{"device" : "/dev/ttyUSB0"}], "a name"),
+    ([{"name" : "north", "device" : "/dev/ttyUSB0", "color" : "red"}], "unknown"),
+    ([{"name" : "north", "device" : "/dev/ttyUSB0"},
+      {"name" : "north", "device" : "/dev/ttyUSB1"}], "unique"),
+    ([{"name" : "north"}, {"name" : "south", "device" : "/dev/ttyUSB1"}], "own device"),
+    ([{"name" : "north", "device" : "/dev/ttyUSB0", "retention_days" : 1}], "command line"),
+    ([{"name" : "north", "device" : "/dev/ttyUSB0", "outdir" : "/data"}], "command line")])
+def test_invalid_instruments(tmp_path, entries, match):
+    with pytest.raises(ValueError, match=match):
+        app.instrument_args(cli_args(tmp_path, entries))
@@ -0,0 +1,101 @@
+"""Tests of the sample journal and its recovery after an unclean stop"""
+
+import csv
+import math
+import functools
+from types import SimpleNamespace
+from datetime import datetime, timezone
+
+import numpy as np
+
+import app
+from wxt_journal import SampleJournal, JournaledWriter
+from wxt_storage import BufferedCSVWriter
+from wxt_uplink import PluginSession, UploadQueue
+
+KEYS = ['Dm', 'Sm', 'Ta']
+
+def test_recovery_after_unclean_stop(tmp_path):
+    path = tmp_path / "wxt536.journal"
+    local_file = tmp_path / "W000.wxt536.20231010.120000.csv"
+    journal = SampleJournal(path, KEYS, 16)
+    writer = JournaledWriter(BufferedCSVWriter(local_file, flush_rows=3), journal)
+    for i in range(5):
+        writer.write_record(datetime.fromtimestamp(1696939200 + i, timezone.utc),
+                            [180.0 + i, None, 20.0])
+    # The process dies without closing: the mapping, shared with the page
+    # cache, is what the next start finds
+    recovered = SampleJournal(path, KEYS, 64)
+    assert recovered.local_file == local_file
+    assert recovered.capacity == 16
+    assert recovered.head == 5
+    assert recovered.flushed == 3
+    times, values = recovered.records()
+    np.testing.assert_array_equal(times, 1696939200 + np.arange(5))
+    np.testing.assert_array_equal(values[:, 0], 180.0 + np.arange(5))
+    assert np.isnan(values[:, 1]).all()
+    # Samples not yet written to the local file
+    times, _ = recovered.records(recovered.flushed)
+    np.testing.assert_array_equal(times, 1696939200 + np.arange(3, 5))
+
+    recovered.clear(64)
+    assert recovered.local_file is None
+    assert recovered.capacity == 64
+    assert recovered.head == 0
+    writer.writer.close(sync=False)
+    recovered.close()
+    journal.close()
+
+def test_ring_keeps_latest_samples(tmp_path):
+    journal = SampleJournal(tmp_path / "wxt536.journal", KEYS, 4)
+    journal.start(tmp_path / "file.csv")
+    for i in range(6):
+        journal.append(float(i), [i, i, i])
+    times, values = journal.records()
+    np.testing.assert_array_equal(times, [2.0, 3.0, 4.0, 5.0])
+    np.testing.assert_array_equal(values[:, 2], [2.0, 3.0, 4.0, 5.0])
+    journal.close()
+
+def test_changed_keys_start_new_journal(tmp_path):
+    path = tmp_path / "wxt536.journal"
+    journal = SampleJournal(path, KEYS, 8)
+    journal.start(tmp_path / "file.csv")
+    journal.append(0.0, [1.0, math.nan, 2.0])
+    journal.close()
+    journal = SampleJournal(path, KEYS + ['Pa'], 8)
+    assert journal.local_file is None
+    assert journal.head == 0
+    journal.close()
+
+def test_recover_interval(tmp_path, fake_plugin):
+    args = SimpleNamespace(beehive_interval=15, query_interval=1, adaptive=False, mode="poll",
+                           gust_window=3, wind_percentiles=[50], flush_rows=3,
+                           flush_interval=60, site="W000", instrument=None)
+    publish_names = {"Dm" : ["wxt.wind.direction", "Mean Wind Direction", "degrees"],
+                     "Sm" : ["wxt.wind.speed", "Mean Wind Speed", "m/s"],
+                     "Ta" : ["wxt.env.temp", "Air Temperature", "C"]}
+    local_file = tmp_path / "W000.wxt536.20231010.120000.csv"
+    journal = SampleJournal(tmp_path / "wxt536.journal", KEYS, app.journal_capacity(args))
+    writer = JournaledWriter(BufferedCSVWriter(local_file, flush_rows=3), journal)
+    for i in range(5):
+        writer.write_record(datetime.fromtimestamp(1696939200 + i, timezone.utc),
+                            [180.0, 2.0, 20.0 + i])
+    # The process dies, the two buffered rows never reach the file
+    writer.writer._file.close()
+
+    recovered = SampleJournal(tmp_path / "wxt536.journal", KEYS, app.journal_capacity(args))
+    upload_queue = UploadQueue(upload=lambda path: None)
+    factory = functools.partial(fake_plugin, connect_latency=0, close_latency=0)
+    with PluginSession(factory) as session:
+        app.recover_interval(args, recovered, publish_names, session, upload_queue)
+
+    published = {name : (value, meta) for name, value, meta, _, _ in fake_plugin.messages}
+    assert published["wxt.env.temp"][0] == 22.0
+    assert published["wxt.env.temp"][1]["avg_frequency"] == "15min"
+    with open(local_file, newline='', encoding="utf-8") as csvfile:
+        rows = list(csv.reader(csvfile))
+    assert [row[3] for row in rows] == ["20.0", "21.0", "22.0", "23.0", "24.0"]
+    assert upload_queue.depth == 1
+    assert recovered.local_file is None and recovered.head == 0
+    recovered.close()
+    journal.close()
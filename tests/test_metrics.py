@@ -0,0 +1,52 @@
+"""Tests of the stage latency histograms and counters"""
+
+import pytest
+
+from wxt_metrics import LatencyHistogram, StageMetrics, DISABLED
+
+class StepClock:
+    """Clock advancing by the given steps at each call"""
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += self.steps.pop(0)
+        return self.now
+
+def test_histogram_quantiles():
+    histogram = LatencyHistogram()
+    assert histogram.quantile(0.5) is None
+    for _ in range(90):
+        histogram.add(0.0007)
+    for _ in range(10):
+        histogram.add(0.2)
+    # Interpolated within the (0.5, 1] ms and (100, 250] ms buckets
+    assert 0.0005 < histogram.quantile(0.5) <= 0.001
+    assert 0.1 < histogram.quantile(0.95) <= 0.2
+    assert histogram.quantile(0.99) <= histogram.max == 0.2
+    # Beyond the last bucket, the maximum
+    histogram.add(10.0)
+    assert histogram.quantile(1.0) == 10.0
+
+def test_stage_metrics():
+    # Each stage timing reads the clock twice
+    metrics = StageMetrics(clock=StepClock([0.0, 0.002, 0.0, 0.004]))
+    for _ in range(2):
+        with metrics.time("parse"):
+            pass
+    metrics.count("parse.failures")
+    metrics.count("parse.failures", 2)
+    out = metrics.metrics()
+    assert out["stage.parse.count"] == 2
+    assert out["stage.parse.mean_ms"] == pytest.approx(3.0)
+    assert out["stage.parse.max_ms"] == pytest.approx(4.0)
+    assert out["parse.failures"] == 3
+    metrics.reset()
+    assert metrics.metrics() == {"stage.parse.count" : 0, "parse.failures" : 0}
+
+def test_disabled():
+    with DISABLED.time("serial"):
+        pass
+    DISABLED.count("serial.timeouts")
+    assert DISABLED.metrics() == {}
@@ -0,0 +1,102 @@
+"""Tests of the telegram parsers"""
+
+import numpy as np
+import pytest
+
+from wxt_parse import parse_values, parse_many, parse_file, FIELD_KEYS
+from wxt_serial import clean_telegram
+from wxt_simulator import DEFAULT_FIELDS
+
+def test_summary():
+    sample = parse_values(b'0R0,Dm=166D,Sm=4.9M,Ta=20.4C,Ua=64.9P,Pa=989.5H,'
+                          b'Rc=13.84M,Th=25.4C,Vh=0.0#')
+    assert sample == {'Dm' : 166.0, 'Sm' : 4.9, 'Ta' : 20.4, 'Ua' : 64.9, 'Pa' : 989.5,
+                      'Rc' : 13.84, 'Th' : 25.4, 'Vh' : 0.0, 'Jo' : 0}
+
+@pytest.mark.parametrize("suffix, status", [(b'#', 0), (b'N', 1), (b'V', 2), (b'W', 3),
+                                            (b'F', 5)])
+def test_heater_status(suffix, status):
+    sample = parse_values(b'0R5,Th=25.4C,Vh=12.0' + suffix + b',Vs=12.1V,Vr=3.500V')
+    assert sample['Jo'] == status
+
+def test_reordered_and_unknown_fields():
+    sample = parse_values(b'0R2,Pa=990.0H,Xx=1.0Q,Ta=-3.5C,Ua=60.0P')
+    assert sample == {'Pa' : 990.0, 'Ta' : -3.5, 'Ua' : 60.0}
+
+def test_user_defined_summary():
+    assert parse_values(b'0R0,Ta=20.4C') == {'Ta' : 20.4, 'Jo' : 0}
+    assert parse_values(b'0R0,Ta=#.#C') is None
+
+@pytest.mark.parametrize("line", [b'0R2,Ta=20.0C,Ua=60.0P',
+                                  b'0R2,Ta=20.0C,Ua=60.0P,Pa=###.#H',
+                                  b'0R1,Dn=1D,Dm=2D,Dx=3D,Sn=1.0M,Sm=2.0M',
+                                  b'0R4,Ta=20.0C', b'', b'0XU,M=P'])
+def test_incomplete_or_unsupported(line):
+    assert parse_values(line) is None
+
+def test_accepts_bytearray():
+    assert parse_values(bytearray(b'0R2,Ta=20.0C,Ua=60.0P,Pa=990.0H'))['Ta'] == 20.0
+
+# Timestamp prefix written by read_wxt530.py:pollsave
+POLLSAVE_PREFIX = b'20231010T12:00:00.000000,'
+
+def simulated_telegrams(simulator, count, garbage=0.0):
+    """Cleaned telegrams of all the default messages, garbled at the given rate"""
+    simulator.garbage = garbage
+    commands = list(DEFAULT_FIELDS)
+    return [clean_telegram(simulator._garble(simulator.telegram(commands[i % len(commands)])))
+            for i in range(count)]
+
+def assert_parsers_agree(lines, batch):
+    """parse_many returns the samples of parse_values for each line"""
+    keys = list(FIELD_KEYS.values()) + ['Jo']
+    for i, line in enumerate(lines):
+        sample = parse_values(line)
+        assert (sample is not None) == bool(batch['valid'][i]), line
+        if sample is None:
+            continue
+        for key in keys:
+            np.testing.assert_equal(batch[key][i], sample.get(key, np.nan), err_msg=str(line))
+
+@pytest.mark.parametrize("prefix", [b'', POLLSAVE_PREFIX])
+@pytest.mark.parametrize("garbage", [0.0, 0.3])
+def test_parse_values_matches_parse_many(simulator, garbage, prefix):
+    lines = simulated_telegrams(simulator, 2000, garbage=garbage)
+    batch = parse_many([prefix + line for line in lines])
+    assert_parsers_agree(lines, batch)
+    assert batch['valid'].sum() > (1500 if garbage else 1999)
+    if prefix:
+        assert (batch['time'] == np.datetime64('2023-10-10T12:00:00')).all()
+    else:
+        assert np.isnat(batch['time']).all()
+
+@pytest.mark.parametrize("line", [b'\xfe,0R2,Ta=20.0C,Ua=60.0P,Pa=990.0H',
+                                  b'noise,0R0,Ta=20.0C',
+                                  b'20231010T12:00:00.000000',
+                                  b'0R2,Ta=20.0C,Ua=60.0P,Pa=990.0H'])
+def test_start_of_telegram(line):
+    assert_parsers_agree([line], parse_many([line]))
+
+@pytest.mark.parametrize("value", [b'###', b'inf', b'nan', b'1e3', b'1_0', b'--1',
+                                   b'1.2.3', b'-', b'', b'123456789'])
+def test_invalid_values_rejected_by_both(value):
+    line = b'0R2,Ta=' + value + b'C,Ua=60.0P,Pa=990.0H'
+    assert parse_values(line) is None
+    assert not parse_many([line])['valid'][0]
+
+def test_lost_comma_rejects_field():
+    # A flipped byte turned the comma before Vh into a control character
+    line = clean_telegram(b'0R0,Dm=157D,Sm=5.2M,Th=22.0C\x0cVh=12.0F\r\n')
+    sample = parse_values(line)
+    batch = parse_many([line])
+    assert 'Th' not in sample and 'Vh' not in sample
+    assert np.isnan(batch['Th'][0]) and np.isnan(batch['Vh'][0])
+    assert batch['Jo'][0] == sample['Jo'] == 0
+
+def test_parse_file(tmp_path):
+    path = tmp_path / "WXT536_atmos_20231010.120000.csv"
+    path.write_bytes(POLLSAVE_PREFIX + b'0R2,Ta=20.0C,Ua=60.0P,Pa=990.0H\r\n'
+                     + POLLSAVE_PREFIX + b'0R2,Ta=#.#C,Ua=60.0P,Pa=990.0H\r\n')
+    data = parse_file(path)
+    assert data['valid'].tolist() == [True, False]
+    assert data['Ta'][0] == 20.0 and np.isnan(data['Ta'][1])
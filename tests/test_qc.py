@@ -0,0 +1,65 @@
+"""Tests of the range, rate of change and spike checks"""
+
+from wxt_qc import QualityControl, QC_RANGE, QC_RATE, QC_SPIKE, accepted, load_limits
+
+LIMITS = {"Ta" : {"min" : -52, "max" : 60, "rate" : 1.0, "spike" : 3.0},
+          "Pa" : {"min" : 600, "max" : 1100, "rate" : None, "spike" : None}}
+
+def test_range():
+    qc = QualityControl(LIMITS, window=3)
+    assert qc.check({"Ta" : 20.0, "Pa" : 990.0}, now=0.0) == {"Ta" : 0, "Pa" : 0}
+    assert qc.check({"Ta" : 70.0, "Pa" : 500.0}, now=100.0) == {"Ta" : QC_RANGE, "Pa" : QC_RANGE}
+    # Missing values are not checked
+    assert qc.check({"Pa" : 990.0}, now=101.0) == {"Pa" : 0}
+    assert qc.metrics() == {"qc.range" : 2, "qc.rate" : 0, "qc.spike" : 0,
+                            "qc.Ta" : 1, "qc.Pa" : 1}
+    qc.reset_counts()
+    assert qc.metrics() == {"qc.range" : 0, "qc.rate" : 0, "qc.spike" : 0}
+
+def test_rate():
+    qc = QualityControl(LIMITS, window=3)
+    qc.check({"Ta" : 20.0}, now=0.0)
+    assert qc.check({"Ta" : 22.0}, now=1.0) == {"Ta" : QC_RATE}
+    # Compared to the last accepted value, over the time since it
+    assert qc.check({"Ta" : 22.0}, now=3.0) == {"Ta" : 0}
+
+def test_rate_interval():
+    # Samples checked back to back are assumed one interval apart
+    qc = QualityControl(LIMITS, window=3, interval=5.0)
+    qc.check({"Ta" : 20.0}, now=0.0)
+    assert qc.check({"Ta" : 24.0}, now=0.01) == {"Ta" : 0}
+
+def test_spike():
+    qc = QualityControl(LIMITS, window=3)
+    for now, value in enumerate([20.0, 20.5, 21.0]):
+        assert qc.check({"Ta" : value}, now=float(now)) == {"Ta" : 0}
+    # Within the rate limit after a gap, but far from the median 20.5
+    assert qc.check({"Ta" : 25.0}, now=100.0) == {"Ta" : QC_SPIKE}
+    assert qc.check({"Ta" : 21.0}, now=101.0) == {"Ta" : 0}
+
+def test_persistent_change_accepted():
+    qc = QualityControl(LIMITS, window=3)
+    for now in range(3):
+        qc.check({"Ta" : 20.0}, now=float(now))
+    # A step that persists for more than window samples becomes the reference
+    flags = [qc.check({"Ta" : 30.0}, now=float(now))["Ta"] for now in range(3, 8)]
+    assert flags == [QC_RATE | QC_SPIKE, QC_RATE | QC_SPIKE, QC_RATE | QC_SPIKE, 0, 0]
+    assert qc.last[qc.keys.index("Ta")] == 30.0
+    # The spike check restarts once the window is refilled
+    assert qc.check({"Ta" : 30.5}, now=8.0) == {"Ta" : 0}
+
+def test_persistent_range_failure_not_accepted():
+    qc = QualityControl(LIMITS, window=2)
+    flags = [qc.check({"Ta" : 80.0}, now=float(now))["Ta"] for now in range(5)]
+    assert all(flag & QC_RANGE for flag in flags)
+
+def test_accepted():
+    sample = {"Ta" : 80.0, "Ta_qc" : QC_RANGE, "Pa" : 990.0, "Pa_qc" : 0, "Sm" : 2.0}
+    assert accepted(sample) == {"Pa" : 990.0, "Sm" : 2.0}
+
+def test_load_limits(tmp_path):
+    path = tmp_path / "qc.json"
+    path.write_text('{"Ta": {"spike": 2.0}, "Tp": {"max": 50}}', encoding="utf-8")
+    limits = load_limits(path)
+    assert limits["Ta"] == {"min" : -52, "max" : 60, "rate" : 1.0, "spike" : 2.0}
+    assert limits["Tp"] == {"min" : None, "max" : 50, "rate" : None, "spike" : None}
@@ -0,0 +1,69 @@
+"""Tests of the interval sums of the offline reprocessing"""
+
+import numpy as np
+import pytest
+
+from wxt_reprocess import BinnedSums, parse_interval
+from wxt_stats import RunningAverage
+
+KEYS = ['Dm', 'Ta', 'Rc', 'Jo']
+
+def samples(count, seed=1):
+    """Samples every 10 s, with missing values"""
+    rng = np.random.default_rng(seed)
+    times = 1696939200 + 10 * np.arange(count)
+    values = np.column_stack([rng.uniform(0, 360, count),
+                              rng.normal(20, 2, count),
+                              np.cumsum(rng.uniform(0, 0.1, count)),
+                              rng.choice([0.0, 3.0], count)])
+    values[rng.random(values.shape) < 0.1] = np.nan
+    return times, values
+
+def running_means(times, values, interval):
+    """Averages of each interval by wxt_stats.RunningAverage"""
+    bins = times // interval
+    out = []
+    for number in np.unique(bins):
+        average = RunningAverage()
+        for row in values[bins == number]:
+            average.update({key : value for key, value in zip(KEYS, row.tolist())})
+        means = average.mean()
+        out.append([means.get(key, np.nan) for key in KEYS])
+    return np.array(out)
+
+def test_sums_match_running_average():
+    times, values = samples(500)
+    binned = BinnedSums.from_samples(times, KEYS, values, 900)
+    np.testing.assert_allclose(binned.means(KEYS), running_means(times, values, 900))
+    np.testing.assert_array_equal(binned.nsamples, np.bincount(times // 900 - times[0] // 900))
+
+@pytest.mark.parametrize("splits", [[137], [50, 51, 300], [250]])
+def test_merge_across_files(splits):
+    times, values = samples(500)
+    whole = BinnedSums.from_samples(times, KEYS, values, 900)
+    # Files ending within an interval, merged out of order
+    parts = [BinnedSums.from_samples(file_times, KEYS, file_values, 900)
+             for file_times, file_values in zip(np.split(times, splits),
+                                                np.split(values, splits))]
+    merged = BinnedSums.merge(parts[::-1])
+    np.testing.assert_array_equal(merged.bins, whole.bins)
+    np.testing.assert_array_equal(merged.nsamples, whole.nsamples)
+    np.testing.assert_allclose(merged.means(KEYS), whole.means(KEYS))
+
+def test_merge_keeps_last_accumulation():
+    # The later file has no valid accumulation in the shared interval
+    first = BinnedSums.from_samples(np.array([0, 10]), ['Rc'], np.array([[1.0], [2.0]]), 900)
+    second = BinnedSums.from_samples(np.array([20, 30]), ['Rc', 'Ta'],
+                                     np.array([[np.nan, 20.0], [np.nan, 21.0]]), 900)
+    merged = BinnedSums.merge([second, first])
+    np.testing.assert_array_equal(merged.means(['Rc', 'Ta']), [[2.0, 20.5]])
+    assert merged.nsamples.tolist() == [4]
+
+def test_merge_nothing():
+    merged = BinnedSums.merge([])
+    assert len(merged.bins) == 0
+
+@pytest.mark.parametrize("interval, seconds", [("30s", 30), ("15min", 900), ("1h", 3600),
+                                               ("1d", 86400), (60, 60)])
+def test_parse_interval(interval, seconds):
+    assert parse_interval(interval) == seconds
@@ -0,0 +1,88 @@
+"""Tests of the sampling clock, the query schedule and the interval boundaries"""
+
+import pytest
+
+from wxt_schedule import SampleClock, QuerySchedule, IntervalBoundary
+
+class FakeClock:
+    """Clock set by the test"""
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_sample_clock_drift_free():
+    clock = FakeClock(100.0)
+    sampling = SampleClock(1.0, clock=clock)
+    sampling.tick()
+    # The sample took 0.3 s, the next one still starts on the 1 s grid
+    clock.now = 100.3
+    assert sampling.delay() == pytest.approx(0.7)
+    clock.now = 101.05
+    sampling.tick()
+    assert sampling.jitter_max == pytest.approx(0.05)
+
+def test_sample_clock_skips_missed_ticks():
+    clock = FakeClock(100.0)
+    sampling = SampleClock(1.0, clock=clock)
+    sampling.tick()
+    # Stalled for 2.5 s: the ticks at 101 and 102 are skipped, not run back to back
+    clock.now = 102.5
+    assert sampling.delay() == pytest.approx(0.5)
+    assert sampling.missed == 2
+    clock.now = 103.0
+    sampling.tick()
+    stats = sampling.stats()
+    assert stats["sample.missed"] == 2
+    assert stats["sample.rate"] == pytest.approx(2 / 3)
+
+def test_query_schedule_rates():
+    schedule = QuerySchedule(["0R1", "0R2:10", "0R3:3"], 1.0)
+    assert schedule.commands == [("0R1", 1), ("0R2", 10), ("0R3", 3)]
+    ticks = [schedule.due() for _ in range(11)]
+    assert ticks[0] == ["0R1", "0R2", "0R3"]
+    assert ticks[1] == ["0R1"]
+    assert ticks[3] == ["0R1", "0R3"]
+    assert ticks[10] == ["0R1", "0R2"]
+    assert sum("0R2" in tick for tick in ticks) == 2
+
+def test_query_schedule_rounding():
+    # Rates are rounded to whole ticks, and at least every tick
+    schedule = QuerySchedule(["0R0", "0R2:10", "0R5:0.1"], 0.5)
+    assert schedule.commands == [("0R0", 1), ("0R2", 20), ("0R5", 1)]
+
+def test_interval_boundary():
+    clock = FakeClock(36000.0 + 60)
+    rotation = IntervalBoundary(15, clock=clock)
+    assert not rotation.due()
+    assert rotation.remaining() == 14 * 60
+    clock.now = 36000.0 + 15 * 60 + 1
+    assert rotation.due()
+    assert not rotation.due()
+    # Several boundaries crossed rotate once
+    clock.now = 36000.0 + 50 * 60
+    assert rotation.due()
+    assert rotation.length == 30 * 60
+    assert not rotation.due()
+
+def test_set_period():
+    # 10:12, in the 10:00 interval of 30 minutes
+    clock = FakeClock(36000.0 + 12 * 60)
+    rotation = IntervalBoundary(30, clock=clock)
+    rotation.set_period(5)
+    assert not rotation.due()
+    assert rotation.remaining() == 3 * 60
+    clock.now = 36000.0 + 15 * 60
+    assert rotation.due()
+    assert rotation.length == 15 * 60
+    # 10:17, back to 30 minutes, the interval ends at 10:30
+    clock.now = 36000.0 + 17 * 60
+    rotation.set_period(30)
+    assert not rotation.due()
+    clock.now = 36000.0 + 30 * 60
+    assert rotation.due()
+    assert rotation.length == 15 * 60
+    clock.now = 36000.0 + 60 * 60
+    assert rotation.due()
+    assert rotation.length == 30 * 60
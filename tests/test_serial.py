@@ -0,0 +1,156 @@
+"""Tests of the serial helpers: CRC handling, telegram framing and the reconnecting connection"""
+
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+import serial
+
+from wxt_parse import parse_values
+import wxt_serial
+from wxt_serial import (SerialConnection, TelegramStream, clean_telegram, crc_command, wxt_crc,
+                        STREAM_CONFIG)
+from wxt_simulator import DEFAULT_FIELDS, WXTSimulator
+
+def test_clean_telegram():
+    assert clean_telegram(b'\x020R2,Ta=20.0C,Ua=60.0P,Pa=990.0H\r\n') == \
+        b'0R2,Ta=20.0C,Ua=60.0P,Pa=990.0H'
+
+def test_crc_command():
+    assert crc_command('0R0') == '0r0'
+    assert crc_command('0R2') == '0r2'
+    assert crc_command('0XU,M=A') == '0XU,M=a'
+    assert crc_command('0WU,I=1') == '0WU,I=1'
+
+@pytest.mark.parametrize("command", list(DEFAULT_FIELDS))
+def test_crc_round_trip(simulator, command):
+    line = simulator.telegram(crc_command(command))
+    telegram = clean_telegram(line, crc=True)
+    assert telegram.startswith(command.encode('ascii') + b',')
+    assert parse_values(telegram) is not None
+    # The CRC covers the telegram as sent, with the lowercase command
+    sent = b'0r' + telegram[2:]
+    assert line == sent + wxt_crc(sent) + b'\r\n'
+
+def test_crc_mismatch(simulator):
+    line = bytearray(simulator.telegram('0r2'))
+    line[6] ^= 0x01
+    assert clean_telegram(bytes(line), crc=True) is None
+    assert clean_telegram(b'0r\r\n', crc=True) is None
+
+def test_crc_required(simulator):
+    # A telegram without CRC fails the check when a CRC is expected
+    assert clean_telegram(simulator.telegram('0R2'), crc=True) is None
+
+class ChunkedPort:
+    """serial.Serial stand-in returning the given chunks, one per read"""
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    @property
+    def in_waiting(self):
+        return len(self.chunks[0]) if self.chunks else 0
+
+    def read(self, size=1):
+        return self.chunks.pop(0) if self.chunks else b''
+
+def test_stream_framing():
+    stream = TelegramStream(ChunkedPort([b'0R1,Dm=1D\r\n0R2,Ta=2', b'0.0C\r', b'\n0R5,Vh=1',
+                                         b'2.0N\r\n']))
+    assert stream.read() == [b'0R1,Dm=1D\r\n']
+    assert stream.read() == []
+    # A telegram split across reads is returned once complete
+    assert stream.read() == [b'0R2,Ta=20.0C\r\n']
+    assert stream.read() == [b'0R5,Vh=12.0N\r\n']
+    assert stream.read() == []
+
+def test_stream_discards_garbage():
+    stream = TelegramStream(ChunkedPort([b'\xff' * 40, b'\xff' * 40, b'0R2,Ta=20.0C\r\n']),
+                            max_length=64)
+    assert stream.read() == []
+    # Bytes beyond max_length without a line terminator are dropped
+    assert stream.read() == []
+    assert stream.discarded == 80
+    assert stream.read() == [b'0R2,Ta=20.0C\r\n']
+
+def test_stream_from_simulator():
+    with WXTSimulator(interval=0.1, seed=1) as simulator, \
+         serial.Serial(simulator.device, 19200, timeout=0.2) as ser:
+        stream = TelegramStream(ser)
+        stream.configure(STREAM_CONFIG, settle=0.05)
+        telegrams = []
+        deadline = time.monotonic() + 5
+        while len(telegrams) < 8 and time.monotonic() < deadline:
+            telegrams += stream.read()
+        stream.configure(["0XU,M=P"], settle=0.05)
+    # Whole telegrams of the wind, PTU, precipitation and supervisor messages;
+    # the first may have been cut by the reset of the input buffer
+    assert len(telegrams) >= 8
+    assert {telegram[:3] for telegram in telegrams[1:]} == {b'0R1', b'0R2', b'0R3', b'0R5'}
+    assert all(parse_values(clean_telegram(telegram)) is not None
+               for telegram in telegrams[1:])
+
+def poll(connection, command):
+    connection.write(bytearray(command + '\r\n', 'utf-8'))
+    return connection.readline()
+
+def test_poll_gap_is_not_silence():
+    with WXTSimulator(seed=1) as simulator, \
+         SerialConnection(simulator.device, timeout=0.2, silence=0.5) as connection:
+        assert connection.connect()
+        assert poll(connection, '0R2').startswith(b'0R2,')
+        # Waiting longer than the silence between polls, 0R9 is not answered:
+        # the silence counts from the first unanswered query
+        time.sleep(0.6)
+        assert poll(connection, '0R9') == b''
+        assert poll(connection, '0R9') == b''
+        assert connection.connected
+        with pytest.raises(serial.SerialException, match="read timeout"):
+            poll(connection, '0R9')
+        assert not connection.connected
+        assert connection.metrics() == {"serial.connected" : 0, "serial.connects" : 1,
+                                        "serial.disconnects" : 1}
+
+def comports(*simulators):
+    """list_ports.comports stand-in listing the simulator ptys as USB ports"""
+    return lambda: [SimpleNamespace(device=simulator.device, hwid="USB VID:PID=0403:6001",
+                                    serial_number=f"WXT{i}")
+                    for i, simulator in enumerate(simulators)]
+
+def test_discovery_cached(tmp_path, monkeypatch):
+    cache_path = tmp_path / "port.json"
+    with WXTSimulator(seed=1) as simulator:
+        monkeypatch.setattr(wxt_serial.list_ports, "comports", comports(simulator))
+        with SerialConnection('auto', timeout=0.2, cache_path=cache_path) as connection:
+            assert connection.connect()
+            assert connection.device == simulator.device
+        assert json.loads(cache_path.read_text(encoding="utf-8")) == \
+            {"device" : simulator.device, "serial_number" : "WXT0"}
+        # The next start tries the cached port first, without searching
+        monkeypatch.setattr(wxt_serial.list_ports, "comports", comports())
+        with SerialConnection('auto', timeout=0.2, cache_path=cache_path) as connection:
+            assert connection.connect()
+            assert connection.device == simulator.device
+
+def test_reconnect_after_lost_device(tmp_path, monkeypatch):
+    first = WXTSimulator(seed=1)
+    first.start()
+    monkeypatch.setattr(wxt_serial.list_ports, "comports", comports(first))
+    connection = SerialConnection('auto', timeout=0.2, cache_path=tmp_path / "port.json",
+                                  backoff=0.05, silence=0)
+    assert connection.connect()
+    # Unplugged: the pty is hung up and the WXT comes back on another port
+    first.stop()
+    with pytest.raises(serial.SerialException):
+        poll(connection, '0R2')
+    assert not connection.connected
+    with WXTSimulator(seed=2) as second:
+        monkeypatch.setattr(wxt_serial.list_ports, "comports", comports(second))
+        deadline = time.monotonic() + 5
+        while not connection.connect() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert connection.device == second.device
+        assert poll(connection, '0R2').startswith(b'0R2,')
+    connection.close()
+    assert (connection.connects, connection.disconnects) == (2, 1)
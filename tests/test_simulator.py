@@ -0,0 +1,31 @@
+"""Tests of the WXT simulator the other tests take their telegrams from"""
+
+import pytest
+
+from wxt_parse import parse_values
+from wxt_serial import clean_telegram
+from wxt_simulator import WXTSimulator, DEFAULT_FIELDS
+
+@pytest.mark.parametrize("command", list(DEFAULT_FIELDS))
+def test_telegrams_parse(simulator, command):
+    sample = parse_values(clean_telegram(simulator.telegram(command)))
+    assert set(DEFAULT_FIELDS[command]) <= set(sample)
+
+def test_configured_fields():
+    simulator = WXTSimulator(seed=1, fields={'0R0' : ('Ta', 'Pa')})
+    assert simulator.telegram('0R0').startswith(b'0R0,Ta=')
+    assert simulator.telegram('0R9') is None
+
+def test_same_seed_same_telegrams():
+    first, second = WXTSimulator(seed=3), WXTSimulator(seed=3)
+    assert [first.telegram('0R0') for _ in range(5)] == [second.telegram('0R0') for _ in range(5)]
+
+def test_garbage():
+    simulator = WXTSimulator(seed=1, garbage=1.0)
+    telegrams = [simulator._garble(simulator.telegram('0R2')) for _ in range(50)]
+    assert simulator.corrupted == 50
+    assert sum(parse_values(clean_telegram(telegram)) is None for telegram in telegrams) > 10
+
+def test_invalid_heater():
+    with pytest.raises(ValueError):
+        WXTSimulator(heater='X')
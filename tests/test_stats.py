@@ -0,0 +1,84 @@
+"""Tests of the running average and the wind statistics of the publish interval"""
+
+import math
+
+import pytest
+
+from wxt_stats import RunningAverage, WindStatistics
+
+def test_running_average():
+    average = RunningAverage()
+    for sample in ({'Ta' : 20.0, 'Rc' : 1.0, 'Rd' : 10.0, 'Hd' : 0.0, 'Jo' : 0},
+                   {'Ta' : 22.0, 'Rc' : 1.5, 'Rd' : 20.0, 'Hd' : 0.0, 'Jo' : 3},
+                   {'Ta' : None, 'Rc' : 2.0, 'Rd' : 30.0, 'Hd' : 10.0, 'Jo' : 3}):
+        average.update(sample)
+    assert average.nsamples == 3
+    # Mean of the valid values, last accumulated amount and duration, most frequent status
+    assert average.mean() == {'Ta' : 21.0, 'Rc' : 2.0, 'Rd' : 30.0, 'Hd' : 10.0, 'Jo' : 3}
+    average.reset()
+    assert average.mean() == {} and average.nsamples == 0
+
+@pytest.mark.parametrize("directions, expected", [((350.0, 10.0), 0.0),
+                                                  ((90.0, 180.0), 135.0),
+                                                  ((270.0, 300.0, 330.0), 300.0)])
+def test_direction_vector_mean(directions, expected):
+    average = RunningAverage()
+    for direction in directions:
+        average.update({'Dm' : direction, 'Dn' : direction, 'Dx' : direction})
+    means = average.mean()
+    for key in ('Dn', 'Dm', 'Dx'):
+        # Across the 0/360 wrap, not the arithmetic mean (180)
+        assert (means[key] - expected + 180) % 360 - 180 == pytest.approx(0, abs=1e-9)
+
+def test_opposing_directions_undefined():
+    average = RunningAverage()
+    average.update({'Dm' : 90.0, 'Sm' : 2.0})
+    average.update({'Dm' : 270.0, 'Sm' : 4.0})
+    assert average.mean() == {'Sm' : 3.0}
+
+def test_nan_skipped():
+    average = RunningAverage()
+    average.update({'Ta' : float('nan'), 'Ua' : 50.0})
+    assert average.mean() == {'Ua' : 50.0}
+
+def wind_statistics(speeds, directions, times=None, **kwargs):
+    wind = WindStatistics(len(speeds), **kwargs)
+    for i, (speed, direction) in enumerate(zip(speeds, directions)):
+        wind.update({'Sm' : speed, 'Dm' : direction},
+                    None if times is None else int(times[i] * 1e9))
+    return wind.stats()
+
+def test_yamartino_direction_std():
+    # Constant direction, no spread
+    assert wind_statistics([2.0] * 4, [10.0] * 4)['direction_std'] == pytest.approx(0, abs=1e-6)
+    # Two directions 20 degrees apart across north: epsilon = sin(10 degrees)
+    epsilon = math.sin(math.radians(10))
+    expected = math.degrees(math.asin(epsilon) * (1 + (2 / math.sqrt(3) - 1) * epsilon ** 3))
+    stats = wind_statistics([2.0, 2.0], [350.0, 10.0])
+    assert stats['direction_std'] == pytest.approx(expected)
+    assert stats['direction_std'] == pytest.approx(10.0, abs=0.05)
+
+def test_speed_weighted_vector():
+    stats = wind_statistics([1.0, 3.0], [90.0, 180.0])
+    # Mean of (1, 0) and (0, -3) east/north components
+    assert stats['speed_vector'] == pytest.approx(math.hypot(0.5, 1.5))
+    assert stats['direction_vector'] == pytest.approx(math.degrees(math.atan2(0.5, -1.5)))
+    assert stats['speed_max'] == 3.0
+
+def test_gust_over_consecutive_samples():
+    speeds = [1.0, 5.0, 6.0, 7.0, 1.0, 9.0]
+    assert wind_statistics(speeds, [0.0] * 6, gust_samples=3)['gust'] == pytest.approx(6.0)
+    # A window with a missing speed is skipped
+    assert wind_statistics([1.0, None, 6.0, 7.0], [0.0] * 4, gust_samples=3) \
+        .get('gust') is None
+
+def test_gust_window_from_sample_spacing():
+    speeds = [1.0, 5.0, 6.0, 7.0, 1.0, 1.0]
+    # 3 s window at one wind telegram every 1.5 s: 2 samples, whatever gust_samples
+    stats = wind_statistics(speeds, [0.0] * 6, times=[1.5 * i for i in range(6)],
+                            gust_samples=12, gust_window=3)
+    assert stats['gust'] == pytest.approx(6.5)
+    # Telegrams read together share a timestamp
+    stats = wind_statistics(speeds, [0.0] * 6, times=[0, 0, 1.5, 3, 3, 4.5],
+                            gust_samples=12, gust_window=3)
+    assert stats['gust'] == pytest.approx(6.5)
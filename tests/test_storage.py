@@ -0,0 +1,135 @@
+"""Tests of the local file writers and the compression of rotated files"""
+
+import csv
+import gzip
+import lzma
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from wxt_storage import (BufferedCSVWriter, ParquetWriter, NetCDFWriter, ColumnarWriter,
+                         compress_file, file_codec, check_codec)
+
+VARIABLES = {"Ta" : ["wxt.env.temp", "Air Temperature", "C"],
+             "Ua" : ["wxt.env.humidity", "Relative Humidity", "%"]}
+
+START = 1696939200
+
+def timestamp(seconds):
+    return datetime.fromtimestamp(START + seconds, timezone.utc)
+
+def read_rows(path):
+    with open(path, newline='', encoding="utf-8") as csvfile:
+        return list(csv.reader(csvfile))
+
+def test_csv_rows_buffered(tmp_path):
+    path = tmp_path / "W1.wxt536.20231010.120000.csv"
+    writer = BufferedCSVWriter(path, flush_rows=3, flush_interval=3600)
+    writer.writerow(["time", "Ta", "Ua"])
+    writer.write_record(timestamp(0), [20.0, None])
+    assert read_rows(path) == []
+    writer.write_record(timestamp(1), [20.5, 60.0])
+    # Written out once flush_rows rows are buffered
+    assert len(read_rows(path)) == 3 and writer.rows_written == 3
+    writer.write_record(timestamp(2), [21.0, 61.0])
+    writer.close()
+    assert writer.closed
+    assert read_rows(path) == [["time", "Ta", "Ua"],
+                               ["2023-10-10T12:00:00+00:00", "20.0", "-9999"],
+                               ["2023-10-10T12:00:01+00:00", "20.5", "60.0"],
+                               ["2023-10-10T12:00:02+00:00", "21.0", "61.0"]]
+    # Closing again is a no-op
+    writer.close()
+
+def test_csv_flush_interval(tmp_path):
+    path = tmp_path / "W1.wxt536.20231010.120000.csv"
+    with BufferedCSVWriter(path, flush_rows=100, flush_interval=0) as writer:
+        writer.write_record(timestamp(0), [20.0])
+        assert len(read_rows(path)) == 1
+
+def test_csv_appends(tmp_path):
+    path = tmp_path / "W1.wxt536.20231010.120000.csv"
+    for seconds in (0, 1):
+        with BufferedCSVWriter(path) as writer:
+            writer.write_record(timestamp(seconds), [20.0])
+    assert len(read_rows(path)) == 2
+
+def read_parquet(path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    table = pq.read_table(path)
+    assert table.schema.field("wxt.env.temp").metadata[b"units"] == b"C"
+    return (table.column("time").cast("int64").to_numpy() / 1000,
+            np.column_stack([table.column(info[0]).to_numpy() for info in VARIABLES.values()]),
+            pq.ParquetFile(path).metadata.num_row_groups)
+
+def read_netcdf(path):
+    netCDF4 = pytest.importorskip("netCDF4")
+    with netCDF4.Dataset(path) as dataset:
+        assert dataset["Ta"].waggle_name == "wxt.env.temp"
+        assert dataset.site == "W1"
+        return (dataset["time"][:].filled(np.nan),
+                np.column_stack([dataset[name][:].filled(np.nan) for name in VARIABLES]),
+                None)
+
+@pytest.mark.parametrize("writer_class, read", [(ParquetWriter, read_parquet),
+                                                (NetCDFWriter, read_netcdf)])
+def test_columnar_round_trip(tmp_path, writer_class, read):
+    path = tmp_path / "W1.wxt536.20231010.120000.data"
+    with writer_class(path, VARIABLES, flush_rows=2, flush_interval=3600,
+                      attrs={"site" : "W1"}) as writer:
+        writer.write_record(timestamp(0), [20.0, None])
+        writer.write_record(timestamp(1), [20.5, 60.0])
+        writer.write_record(timestamp(2), [21.0, 61.0])
+        # A block of records, e.g. rewritten from the journal
+        writer.write_records(START + np.array([3.0, 4.0]), [[21.5, 62.0], [22.0, np.nan]])
+    assert writer.closed and writer.rows_written == 5
+    times, values, row_groups = read(path)
+    np.testing.assert_array_equal(times, START + np.arange(5))
+    np.testing.assert_array_equal(values, np.array([[20.0, np.nan], [20.5, 60.0], [21.0, 61.0],
+                                                    [21.5, 62.0], [22.0, np.nan]],
+                                                   dtype=np.float32))
+    if row_groups is not None:
+        # One row group per flush: the two buffered records, the last one and the block
+        assert row_groups == 3
+
+def test_columnar_writer_is_abstract(tmp_path):
+    with pytest.raises(TypeError):
+        ColumnarWriter(tmp_path / "file", VARIABLES)
+
+def decompress(path):
+    codec = file_codec(path)
+    if codec == 'gzip':
+        return gzip.decompress(path.read_bytes())
+    if codec == 'xz':
+        return lzma.decompress(path.read_bytes())
+    zstandard = pytest.importorskip("zstandard")
+    return zstandard.ZstdDecompressor().stream_reader(path.read_bytes()).read()
+
+@pytest.mark.parametrize("codec, suffix", [('gzip', '.gz'), ('xz', '.xz'), ('zstd', '.zst')])
+def test_compress_file(tmp_path, codec, suffix):
+    check_codec(codec)
+    path = tmp_path / "W1.wxt536.20231010.120000.csv"
+    data = b"2023-10-10T12:00:00+00:00,20.0,60.0\r\n" * 1000
+    path.write_bytes(data)
+    compressed = compress_file(path, codec=codec, level=3)
+    assert compressed == tmp_path / ("W1.wxt536.20231010.120000.csv" + suffix)
+    assert file_codec(compressed) == codec
+    assert decompress(compressed) == data
+    assert compressed.stat().st_size < len(data)
+    # The original is kept and no temporary file is left
+    assert path.exists()
+    assert sorted(p.name for p in tmp_path.iterdir()) == [path.name, compressed.name]
+    # Compressed files are not compressed again
+    assert compress_file(compressed, codec=codec) == compressed
+
+def test_failed_compression_leaves_no_file(tmp_path):
+    path = tmp_path / "W1.wxt536.20231010.120000.csv"
+    path.write_bytes(b"data")
+    with pytest.raises(ValueError):
+        compress_file(path, codec='gzip', level=42)
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]
+
+def test_file_codec():
+    assert file_codec("W1.wxt536.20231010.120000.csv") is None
+    assert file_codec("W1.wxt536.20231010.120000.parquet.zst") == 'zstd'
@@ -0,0 +1,192 @@
+"""Tests of the shared Plugin session, the background upload queue and the backfill"""
+
+import os
+import json
+import time
+import functools
+import threading
+
+import pytest
+
+from wxt_uplink import PluginSession, UploadQueue, Backfill
+
+def completions():
+    """on_complete callback recording the outcomes, released once per outcome"""
+    outcomes = []
+    done = threading.Semaphore(0)
+    def on_complete(file_path, uploaded):
+        outcomes.append((file_path, uploaded))
+        done.release()
+    return outcomes, done, on_complete
+
+def failing_upload(failures):
+    """Upload callable raising ConnectionError for its first failures calls"""
+    calls = []
+    def upload(file_path):
+        calls.append(file_path)
+        if len(calls) <= failures:
+            raise ConnectionError("simulated upload failure")
+    return upload, calls
+
+def test_retry_with_backoff(tmp_path):
+    path = tmp_path / "a.csv"
+    path.write_text("data", encoding="utf-8")
+    outcomes, done, on_complete = completions()
+    upload, calls = failing_upload(2)
+    with UploadQueue(upload, on_complete=on_complete, backoff=0.01) as queue:
+        queue.submit(path)
+        assert done.acquire(timeout=5)
+    assert outcomes == [(str(path), True)]
+    assert len(calls) == 3
+    assert queue.metrics() == {"upload.queue_depth" : 0, "upload.uploaded" : 1,
+                               "upload.failed" : 0, "upload.retries" : 2,
+                               "upload.dropped" : 0}
+
+def test_give_up_after_max_retries(tmp_path):
+    path = tmp_path / "a.csv"
+    path.write_text("data", encoding="utf-8")
+    state_path = tmp_path / "uploads.json"
+    outcomes, done, on_complete = completions()
+    upload, calls = failing_upload(10)
+    with UploadQueue(upload, on_complete=on_complete, state_path=state_path,
+                     max_retries=3, backoff=0.01) as queue:
+        queue.submit(path)
+        assert done.acquire(timeout=5)
+    assert outcomes == [(str(path), False)]
+    assert len(calls) == 3
+    assert queue.failed == 1
+    assert json.loads(state_path.read_text(encoding="utf-8")) == []
+    # The file is left on disk for the backfill
+    assert path.exists()
+
+def test_prepare_replaces_file(tmp_path):
+    path = tmp_path / "a.csv"
+    path.write_text("data", encoding="utf-8")
+    prepared = tmp_path / "a.csv.gz"
+    def prepare(file_path):
+        prepared.write_text("compressed", encoding="utf-8")
+        return prepared
+    uploaded = []
+    outcomes, done, on_complete = completions()
+    with UploadQueue(uploaded.append, prepare=prepare, on_complete=on_complete) as queue:
+        queue.submit(path)
+        assert done.acquire(timeout=5)
+    assert uploaded == [str(prepared)]
+    assert not path.exists()
+
+def test_queue_full(tmp_path):
+    queue = UploadQueue(lambda file_path: None, maxsize=1)
+    assert queue.submit(tmp_path / "a.csv")
+    assert queue.submit(tmp_path / "a.csv")
+    assert not queue.submit(tmp_path / "b.csv")
+    assert queue.depth == 1
+    assert queue.dropped == 1
+
+def test_pending_uploads_persisted(tmp_path):
+    state_path = tmp_path / "uploads.json"
+    paths = [tmp_path / name for name in ("a.csv", "b.csv", "c.csv")]
+    for path in paths:
+        path.write_text("data", encoding="utf-8")
+    # Stopped before the worker ran, e.g. the node restarted
+    queue = UploadQueue(lambda file_path: None, state_path=state_path)
+    for path in paths:
+        queue.submit(path)
+    assert json.loads(state_path.read_text(encoding="utf-8")) == [str(path) for path in paths]
+    paths[2].unlink()
+
+    uploaded = []
+    outcomes, done, on_complete = completions()
+    queue = UploadQueue(uploaded.append, on_complete=on_complete, state_path=state_path)
+    # Files removed since are not resumed
+    assert queue.depth == 2
+    with queue:
+        assert done.acquire(timeout=5) and done.acquire(timeout=5)
+    assert uploaded == [str(paths[0]), str(paths[1])]
+    assert outcomes == [(str(paths[0]), True), (str(paths[1]), True)]
+    assert json.loads(state_path.read_text(encoding="utf-8")) == []
+
+def test_session_shared(fake_plugin):
+    factory = functools.partial(fake_plugin, connect_latency=0, close_latency=0)
+    with PluginSession(factory) as session:
+        for value in range(3):
+            session.publish("wxt.env.temp", value=value)
+        session.upload_file("a.csv", meta={"codec" : "none"})
+    assert [message[1] for message in fake_plugin.messages] == [0, 1, 2]
+    assert [upload[0] for upload in fake_plugin.uploads] == ["a.csv"]
+    assert session.connects == 1
+
+def test_session_reconnects(fake_plugin):
+    factory = functools.partial(fake_plugin, connect_latency=0, close_latency=0, fail_after=2)
+    with PluginSession(factory) as session:
+        for value in range(3):
+            session.publish("wxt.env.temp", value=value)
+    # Every second call of a Plugin fails, each is retried on a new Plugin
+    assert [message[1] for message in fake_plugin.messages] == [0, 1, 2]
+    assert session.connects == 3
+    assert session.reconnects == 2
+
+def test_session_invalid_message_not_retried(fake_plugin):
+    class Rejecting(fake_plugin):
+        def publish(self, *args, **kwargs):
+            raise ValueError("invalid value")
+    with PluginSession(functools.partial(Rejecting, connect_latency=0, close_latency=0)) as session:
+        with pytest.raises(ValueError):
+            session.publish("wxt.env.temp", value="x")
+    assert session.reconnects == 0
+
+def test_backfill_scans_every_outdir(tmp_path):
+    outdirs = [tmp_path / "north", tmp_path / "south"]
+    for outdir in outdirs:
+        outdir.mkdir()
+        (outdir / "W1.wxt536.20231010.120000.csv").write_text("data", encoding="utf-8")
+    backfill = Backfill(UploadQueue(lambda file_path: None), outdirs, "*.wxt536.*", min_age=0)
+    backfill.scan()
+    assert backfill.metrics()["backfill.pending"] == 2
+
+def local_file(outdir, name, age_days):
+    """Local file last modified age_days ago"""
+    path = outdir / name
+    path.write_text("data", encoding="utf-8")
+    mtime = time.time() - age_days * 86400
+    os.utime(path, (mtime, mtime))
+    return path
+
+def test_backfill_prunes_after_retention(tmp_path):
+    old = local_file(tmp_path, "W1.wxt536.20230101.000000.csv", 40)
+    recent = local_file(tmp_path, "W1.wxt536.20231010.120000.csv", 2)
+    state_path = tmp_path / "wxt536.backfill.json"
+    backfill = Backfill(UploadQueue(lambda file_path: None), tmp_path, "*.wxt536.*",
+                        state_path=state_path, retention_days=30, min_age=0)
+    backfill.scan()
+    backfill.prune()
+    assert not old.exists() and recent.exists()
+    assert list(json.loads(state_path.read_text(encoding="utf-8"))) == [str(recent)]
+    assert backfill.metrics()["backfill.pruned"] == 1
+
+def test_failed_upload_pruned_by_file_age(tmp_path):
+    # A failed upload of a file never scanned keeps the age of the file
+    old = local_file(tmp_path, "W1.wxt536.20230101.000000.csv", 40)
+    backfill = Backfill(UploadQueue(lambda file_path: None), tmp_path, "*.wxt536.*",
+                        retention_days=30, min_age=0)
+    backfill.update(str(old), False)
+    assert backfill.metrics()["backfill.failed"] == 1
+    backfill.prune()
+    assert not old.exists()
+
+def test_backfill_submits_pending(tmp_path):
+    path = local_file(tmp_path, "W1.wxt536.20231010.120000.csv", 1)
+    local_file(tmp_path, "W1.wxt536.20231010.130000.csv", 0)
+    uploaded = []
+    outcomes, done, on_complete = completions()
+    queue = UploadQueue(uploaded.append, on_complete=on_complete)
+    # The file of the current interval is too recent to be indexed
+    backfill = Backfill(queue, tmp_path, "*.wxt536.*", min_age=3600)
+    queue.on_complete = lambda file_path, ok: (backfill.update(file_path, ok),
+                                               on_complete(file_path, ok))
+    with queue:
+        backfill.step()
+        assert done.acquire(timeout=5)
+        backfill.step()
+    assert uploaded == [str(path)]
+    assert backfill.metrics() == {"backfill.pending" : 0, "backfill.failed" : 0,
+                                  "backfill.submitted" : 1, "backfill.pruned" : 0}
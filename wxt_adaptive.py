@@ -0,0 +1,190 @@
+"""
+Adaptive query and publish rates driven by the weather.
+
+The accepted samples are summarized in a few time buckets covering a short
+window, from which three drivers are evaluated: the rain and hail
+accumulation (Rc + Hc), the variability of the wind speed and the pressure
+tendency. While any driver crosses its threshold the instrument is queried
+and averages are published at the configured (active) rates; once the
+weather has been quiet for a hold time, both back off to the slower quiet
+rates. The time spent quiet is reported as the queries and publishes saved.
+"""
+
+import math
+import time
+from collections import deque
+
+# Number of buckets the driver window is split into
+WINDOW_BUCKETS = 10
+
+class AdaptiveRate:
+    """
+    Two-rate controller of the query and publish intervals.
+
+    update() adds an accepted sample to the current bucket in O(1). The
+    drivers are evaluated over the window each time a bucket is started:
+
+    - rain: increase of the Rc + Hc accumulation over the window in mm
+      (a decrease, i.e. an accumulation reset, restarts the window)
+    - wind_std: standard deviation of the mean wind speed Sm in m/s
+    - pressure_tendency: absolute change of Pa over the window in hPa/h,
+      once the window is at least half full
+
+    Crossing a threshold switches to the active rates at once; the quiet
+    rates are resumed after hold seconds without a threshold crossed. The
+    controller starts active.
+
+    Parameters:
+        query_intervals: (active, quiet) query intervals in seconds
+        publish_intervals: (active, quiet) publish intervals in minutes
+        rain: Accumulation threshold in mm, 0 disables the driver
+        wind_std: Wind speed standard deviation threshold in m/s, 0 disables
+        pressure: Pressure tendency threshold in hPa/h, 0 disables
+        window: Seconds of the driver window
+        hold: Seconds the active rates are kept after the last crossing
+        clock: Monotonic clock in seconds
+    """
+    def __init__(self, query_intervals, publish_intervals, rain=0.1, wind_std=1.5,
+                 pressure=1.0, window=600.0, hold=1800.0, clock=time.monotonic):
+        self.query_intervals = tuple(query_intervals)
+        self.publish_intervals = tuple(publish_intervals)
+        self.thresholds = {"rain" : rain, "wind_std" : wind_std, "pressure_tendency" : pressure}
+        self.window = window
+        self.bucket_seconds = window / WINDOW_BUCKETS
+        self.hold = hold
+        self.clock = clock
+        # Buckets of [start, speed count, sum, sum of squares,
+        #             first accumulation, first (time, pressure)]
+        self.buckets = deque()
+        self.accumulation = None
+        self.pressure = None
+        self.drivers = {}
+        self.active = True
+        self.changed = False
+        now = clock()
+        self.last_trigger = now
+        self.marked = now
+        self.active_seconds = 0.0
+        self.quiet_seconds = 0.0
+        self.switches = 0
+
+    @property
+    def query_interval(self):
+        """Query interval of the current mode in seconds"""
+        return self.query_intervals[0 if self.active else 1]
+
+    @property
+    def publish_interval(self):
+        """Publish interval of the current mode in minutes"""
+        return self.publish_intervals[0 if self.active else 1]
+
+    def reset_counts(self):
+        """Clear the time and switch counters for the next interval"""
+        self.marked = self.clock()
+        self.active_seconds = 0.0
+        self.quiet_seconds = 0.0
+        self.switches = 0
+
+    def _mark(self, now):
+        """Add the time since the last mark to the current mode"""
+        if self.active:
+            self.active_seconds += now - self.marked
+        else:
+            self.quiet_seconds += now - self.marked
+        self.marked = now
+
+    def update(self, sample, now=None):
+        """Add an accepted sample (values failing QC removed)"""
+        now = self.clock() if now is None else now
+        if not self.buckets or now - self.buckets[-1][0] >= self.bucket_seconds:
+            self._evaluate(now)
+            while self.buckets and now - self.buckets[0][0] >= self.window:
+                self.buckets.popleft()
+            self.buckets.append([now, 0, 0.0, 0.0, None, None])
+        bucket = self.buckets[-1]
+
+        speed = sample.get('Sm')
+        if speed is not None:
+            bucket[1] += 1
+            bucket[2] += speed
+            bucket[3] += speed * speed
+        rain = sample.get('Rc')
+        hail = sample.get('Hc')
+        if rain is not None or hail is not None:
+            self.accumulation = (rain or 0.0) + (hail or 0.0)
+            if bucket[4] is None:
+                bucket[4] = self.accumulation
+        pressure = sample.get('Pa')
+        if pressure is not None:
+            self.pressure = (now, pressure)
+            if bucket[5] is None:
+                bucket[5] = self.pressure
+
+    def _evaluate(self, now):
+        """Evaluate the drivers over the window and switch the mode"""
+        count = sum(bucket[1] for bucket in self.buckets)
+        drivers = {}
+        if count > 1:
+            mean = sum(bucket[2] for bucket in self.buckets) / count
+            variance = sum(bucket[3] for bucket in self.buckets) / count - mean * mean
+            drivers["wind_std"] = math.sqrt(max(variance, 0.0))
+        first = next((bucket[4] for bucket in self.buckets if bucket[4] is not None), None)
+        if first is not None:
+            if self.accumulation < first:
+                # Accumulation reset (e.g. aR command), start over
+                for bucket in self.buckets:
+                    bucket[4] = None
+            else:
+                drivers["rain"] = self.accumulation - first
+        first = next((bucket[5] for bucket in self.buckets if bucket[5] is not None), None)
+        if first is not None and self.pressure[0] - first[0] >= self.window / 2:
+            drivers["pressure_tendency"] = (abs(self.pressure[1] - first[1]) * 3600
+                                            / (self.pressure[0] - first[0]))
+        self.drivers = drivers
+
+        if any(threshold and drivers.get(name, 0.0) >= threshold
+               for name, threshold in self.thresholds.items()):
+            self.last_trigger = now
+            if not self.active:
+                self._switch(now, True)
+        elif self.active and now - self.last_trigger >= self.hold:
+            self._switch(now, False)
+
+    def _switch(self, now, active):
+        """Change the mode, the new rates are picked up with pop_change()"""
+        self._mark(now)
+        self.active = active
+        self.changed = True
+        self.switches += 1
+
+    def pop_change(self):
+        """True once after each change of mode"""
+        changed = self.changed
+        self.changed = False
+        return changed
+
+    def metrics(self):
+        """
+        Return the metrics of the interval as a dictionary: the current mode
+        (adaptive.active), the active time fraction, the number of switches,
+        the queries and publishes saved compared to staying active, and the
+        current driver values (adaptive.rain, adaptive.wind_std,
+        adaptive.pressure_tendency).
+        """
+        self._mark(self.clock())
+        elapsed = self.active_seconds + self.quiet_seconds
+        query_active, query_quiet = self.query_intervals
+        publish_active, publish_quiet = self.publish_intervals
+        out = {"adaptive.active" : int(self.active),
+               "adaptive.active_fraction" : (round(self.active_seconds / elapsed, 3)
+                                             if elapsed > 0 else float(self.active)),
+               "adaptive.switches" : self.switches,
+               "adaptive.queries_saved" : round(self.quiet_seconds *
+                                                (1 / query_active - 1 / query_quiet)),
+               }
+        if publish_active > 0:
+            out["adaptive.publishes_saved"] = round(self.quiet_seconds / 60 *
+                                                    (1 / publish_active - 1 / publish_quiet), 2)
+        for name, value in self.drivers.items():
+            out[f"adaptive.{name}"] = round(value, 3)
+        return out
@@ -0,0 +1,223 @@
+"""
+Crash-safe journal of the samples of the current rotation interval.
+
+Every sample written to the local file is also written to a fixed-size
+memory-mapped ring buffer next to it. The mapping lives in the page cache,
+so the samples survive a crash or restart of the container (but not a
+power loss between msyncs). On startup the journal tells which local file
+was interrupted and holds its samples, so the interval average can be
+published and the file completed and uploaded without rescanning the
+output directory.
+"""
+
+import os
+import mmap
+import math
+from pathlib import Path
+
+import numpy as np
+
+JOURNAL_MAGIC = b'WXTJ'
+JOURNAL_VERSION = 1
+
+# File header: column keys, the local file of the interval, number of
+# samples appended and number of samples already written to the local file
+HEADER_DTYPE = np.dtype([('magic', 'S4'),
+                         ('version', '<u4'),
+                         ('capacity', '<u8'),
+                         ('head', '<u8'),
+                         ('flushed', '<u8'),
+                         ('keys', 'S256'),
+                         ('path', 'S1024'),
+                         ])
+
+class SampleJournal:
+    """
+    Memory-mapped ring buffer of the samples of the current interval.
+
+    The samples are stored as float64 with NaN for missing values, so they
+    are written back to the local file unchanged. Once more than capacity
+    samples are appended, the oldest are overwritten.
+
+    Parameters:
+        path: Path of the journal file
+        keys: Column keys of the samples (e.g. the publish_names keys)
+        capacity: Number of samples held, should cover a rotation interval;
+            an existing journal with the same keys keeps its capacity until
+            it is cleared, so it can be recovered first
+    """
+    def __init__(self, path, keys, capacity):
+        self.path = Path(path)
+        self.keys = list(keys)
+        self._keys = ','.join(self.keys).encode('ascii')
+        self._record_dtype = np.dtype([('time', '<f8'), ('values', '<f8', (len(self.keys),))])
+        self._file = None
+        self._mmap = None
+        if not self._open():
+            self._create(capacity)
+
+    def _map(self, capacity):
+        """Map the header and records of the open file"""
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        self._header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self._mmap)
+        self._records = np.ndarray((capacity,), dtype=self._record_dtype,
+                                   buffer=self._mmap, offset=HEADER_DTYPE.itemsize)
+        self.capacity = capacity
+
+    def _size(self, capacity):
+        return HEADER_DTYPE.itemsize + capacity * self._record_dtype.itemsize
+
+    def _open(self):
+        """Map an existing journal, False if missing or not compatible"""
+        if not self.path.exists():
+            return False
+        self._file = open(self.path, mode='r+b')
+        size = os.fstat(self._file.fileno()).st_size
+        header = np.frombuffer(self._file.read(HEADER_DTYPE.itemsize), dtype=HEADER_DTYPE)
+        if (len(header) == 1 and header['magic'][0] == JOURNAL_MAGIC
+                and header['version'][0] == JOURNAL_VERSION
+                and header['keys'][0] == self._keys
+                and size == self._size(int(header['capacity'][0]))):
+            self._map(int(header['capacity'][0]))
+            return True
+        print(f"Discarding incompatible sample journal {self.path}")
+        self._file.close()
+        self._file = None
+        return False
+
+    def _create(self, capacity):
+        """Create an empty journal file of the capacity and map it"""
+        self.close()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, mode='w+b')
+        self._file.truncate(self._size(capacity))
+        self._map(capacity)
+        self._header['magic'] = JOURNAL_MAGIC
+        self._header['version'] = JOURNAL_VERSION
+        self._header['capacity'] = capacity
+        self._header['keys'] = self._keys
+        self._mmap.flush()
+
+    def close(self):
+        """Unmap and close the journal file"""
+        if self._mmap is not None:
+            # Note: the numpy views must be released before the mmap closes
+            self._header = self._records = None
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def local_file(self):
+        """Path of the local file of the journaled interval, None if cleared"""
+        path = self._header['path'].item().decode('utf-8')
+        return Path(path) if path else None
+
+    @property
+    def head(self):
+        """Number of samples appended in the interval"""
+        return int(self._header['head'])
+
+    @property
+    def flushed(self):
+        """Number of samples of the interval already written to the local file"""
+        return int(self._header['flushed'])
+
+    def start(self, local_file):
+        """Start journaling the interval of a new local file"""
+        self._header['head'] = 0
+        self._header['flushed'] = 0
+        self._header['path'] = str(local_file).encode('utf-8')
+        self._mmap.flush()
+
+    def clear(self, capacity=None):
+        """
+        Mark the interval as completed, resizing the journal if a different
+        capacity is given.
+        """
+        if capacity is not None and capacity != self.capacity:
+            self._create(capacity)
+            return
+        self._header['head'] = 0
+        self._header['flushed'] = 0
+        self._header['path'] = b''
+        self._mmap.flush()
+
+    def append(self, timestamp, values):
+        """
+        Append a sample.
+
+        Parameters:
+            timestamp: Sample time in seconds since the epoch
+            values: Sequence of values in key order, None if missing
+        """
+        head = int(self._header['head'])
+        slot = head % self.capacity
+        self._records['time'][slot] = timestamp
+        self._records['values'][slot] = [math.nan if value is None else value for value in values]
+        # Note: the head is advanced last, a torn append is never recovered
+        self._header['head'] = head + 1
+
+    def mark_flushed(self, count):
+        """Record the number of samples written to the local file"""
+        self._header['flushed'] = count
+
+    def records(self, start=0):
+        """
+        Return the journaled samples from index start of the interval on.
+
+        Returns:
+            Tuple of the times (float64) and values (float64, NaN if missing)
+            arrays; samples already overwritten in the ring are omitted
+        """
+        head = self.head
+        start = max(start, head - self.capacity, 0)
+        slots = np.arange(start, head) % self.capacity
+        records = self._records[slots]
+        return records['time'], records['values']
+
+class JournaledWriter:
+    """
+    Local file writer that also appends every record to a SampleJournal.
+
+    Starts the journal interval of the writer's file on creation and keeps
+    track of the records the writer has written out to the file.
+
+    Parameters:
+        writer: Local file writer (wxt_storage.BufferedCSVWriter or
+            ColumnarWriter)
+        journal: SampleJournal of the interval
+    """
+    def __init__(self, writer, journal):
+        self.writer = writer
+        self.journal = journal
+        journal.start(writer.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def path(self):
+        """Path of the local file"""
+        return self.writer.path
+
+    @property
+    def closed(self):
+        """True once the local file has been closed"""
+        return self.writer.closed
+
+    def write_record(self, timestamp, values):
+        """Journal and buffer a sample record, see BufferedCSVWriter.write_record"""
+        self.journal.append(timestamp.timestamp(), values)
+        self.writer.write_record(timestamp, values)
+        self.journal.mark_flushed(self.writer.rows_written)
+
+    def close(self, sync=True):
+        """Close the local file, the journal is kept until the interval is cleared"""
+        self.writer.close(sync=sync)
+        self.journal.mark_flushed(self.writer.rows_written)
@@ -0,0 +1,151 @@
+"""
+Lightweight instrumentation of the acquisition hot path.
+
+Stages (serial query, parsing, local file write, publishing) are timed with
+the monotonic performance counter and folded into fixed-bucket histograms,
+events (parse failures, serial timeouts, dropped samples) into counters.
+Both are published as wxt.sys.* metrics at each rotation. When disabled,
+timing a stage costs a method call returning a shared no-op context.
+"""
+
+import bisect
+import time
+from contextlib import nullcontext
+
+# Upper bounds of the latency buckets in seconds, the last bucket is open
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Quantiles estimated from the buckets for publishing
+QUANTILES = (0.5, 0.95, 0.99)
+
+_NULL_TIMER = nullcontext()
+
+class LatencyHistogram:
+    """
+    Fixed-bucket histogram of stage latencies, O(1) memory.
+
+    Quantiles are interpolated linearly within the bucket holding the rank
+    (and capped at the maximum observed latency).
+    """
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Clear the histogram"""
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        """Add a latency in seconds"""
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Estimated q-quantile in seconds, None if empty"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index == len(LATENCY_BUCKETS):
+                    return self.max
+                lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+                upper = LATENCY_BUCKETS[index]
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+class _StageTimer:
+    """Reusable context manager adding its elapsed time to a histogram"""
+    __slots__ = ('histogram', 'clock', 'start')
+
+    def __init__(self, histogram, clock):
+        self.histogram = histogram
+        self.clock = clock
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = self.clock()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.add(self.clock() - self.start)
+        return False
+
+class StageMetrics:
+    """
+    Per-stage latency histograms and event counters of an instrument.
+
+    A stage or counter must only be updated from one thread (the stages of
+    the asyncio engine each run in a single thread), nothing is locked.
+    New stages and counters may be added by that thread while another one
+    reads or resets the metrics, which therefore iterate over snapshots of
+    the dictionaries.
+
+    Parameters:
+        enabled: False to make timing and counting no-ops
+        clock: Monotonic clock in seconds
+    """
+    def __init__(self, enabled=True, clock=time.perf_counter):
+        self.enabled = enabled
+        self.clock = clock
+        self.histograms = {}
+        self.counters = {}
+        self._timers = {}
+
+    def time(self, stage):
+        """
+        Return a context manager timing a stage, e.g.
+        with metrics.time("parse"): ...
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        timer = self._timers.get(stage)
+        if timer is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+            timer = self._timers[stage] = _StageTimer(histogram, self.clock)
+        return timer
+
+    def count(self, name, n=1):
+        """Increment an event counter"""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        """Clear the histograms and counters for the next interval"""
+        # Note: list() copies the dictionaries without releasing the GIL,
+        # iterating them directly fails if a stage is added meanwhile
+        for histogram in list(self.histograms.values()):
+            histogram.reset()
+        for name in list(self.counters):
+            self.counters[name] = 0
+
+    def metrics(self):
+        """
+        Return the metrics of the interval as a dictionary: for each stage
+        stage.<name>.count, .mean_ms, .max_ms and estimated .p50_ms, .p95_ms,
+        .p99_ms, and the counters by name. Empty if disabled.
+        """
+        out = {}
+        for stage, histogram in list(self.histograms.items()):
+            prefix = f"stage.{stage}"
+            out[f"{prefix}.count"] = histogram.count
+            if not histogram.count:
+                continue
+            out[f"{prefix}.mean_ms"] = round(histogram.total / histogram.count * 1e3, 3)
+            out[f"{prefix}.max_ms"] = round(histogram.max * 1e3, 3)
+            for q in QUANTILES:
+                out[f"{prefix}.p{round(q * 100)}_ms"] = round(histogram.quantile(q) * 1e3, 3)
+        out.update(dict(self.counters))
+        return out
+
+# Shared disabled instance for callers without instrumentation
+DISABLED = StageMetrics(enabled=False)
@@ -0,0 +1,303 @@
+"""
+Parsers for the ASCII telegrams returned by the Vaisala WXT536.
+
+parse_values decodes a single telegram into a dictionary and is used by
+app.py on every query. parse_many and parse_file tokenize whole buffers of
+telegrams at once (e.g. the timestamped lines written by
+read_wxt530.py:pollsave) and return columnar NumPy arrays for reprocessing
+archives of raw data.
+"""
+
+import re
+
+import numpy as np
+
+# Field tables for the WXT ASCII query commands. Each table lists the
+# telegram fields expected for the query; fields outside of the table
+# are still accepted (the 0R0 summary is user-defined), the table only
+# defines what is required for a telegram to be considered valid.
+QUERY_FIELDS = {b'0R0' : ('Dm', 'Sm', 'Ta', 'Ua', 'Pa', 'Rc', 'Th', 'Vh'),
+                b'0R1' : ('Dn', 'Dm', 'Dx', 'Sn', 'Sm', 'Sx'),
+                b'0R2' : ('Ta', 'Ua', 'Pa'),
+                b'0R3' : ('Rc', 'Rd', 'Ri', 'Hc', 'Hd', 'Hi'),
+                b'0R5' : ('Th', 'Vh', 'Vs', 'Vr'),
+                }
+
+# Precompiled lookup of telegram field keys (bytes) to dictionary keys.
+FIELD_KEYS = {key.encode('ascii') : key for key in
+              ('Dn', 'Dm', 'Dx', 'Sn', 'Sm', 'Sx',
+               'Ta', 'Tp', 'Ua', 'Pa',
+               'Rc', 'Rd', 'Ri', 'Rp', 'Hc', 'Hd', 'Hi', 'Hp',
+               'Th', 'Vh', 'Vs', 'Vr')
+              }
+
+# ASCII sting changes voltage heater character if
+# voltage is supplied or not.
+#   - '#' for voltage not supplied
+#          - assigned value - 0
+#   - 'N' for supplied voltage and above heating temp
+#          - assigned value - 1
+#   - 'V' heating is on at 50% duty cycle, between high and middle control
+#          - assigned value - 2
+#   - 'W' heating is on 100% duty cycle, between low and middle control temps
+#          - assigned value - 3
+#   - 'F' heating is on at 50% duty cycle, heating temp below low control temp
+#          - assigned value - 5
+HEATER_STATUS = {ord('N') : 1, ord('V') : 2, ord('W') : 3, ord('F') : 5}
+
+# Widest field value converted in bulk; WXT values are at most 7
+# characters wide (e.g. '-1013.5').
+VALUE_WIDTH = 8
+
+# Field values accepted by both parsers: a plain decimal number of at most
+# VALUE_WIDTH characters with an optional leading sign. float() alone would
+# also accept e.g. 'inf', 'nan', '1_0', '1e3' or leading spaces.
+VALID_VALUE = re.compile(rb'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)')
+
+def parse_values(sample, **kwargs):
+    """
+    Parse a WXT ASCII telegram into a dictionary of floats.
+
+    The telegram is split into its comma-separated 'Key=valueUnit' fields
+    in a single pass over the bytes. Fields are matched against the
+    precompiled tables above, so reordered or user-defined field sets
+    (e.g. the 0R0 summary) are handled without a per-layout pattern.
+    Values must match VALID_VALUE, the rule applied by parse_many, so both
+    parsers return the same samples.
+
+    Parameters:
+        sample: Telegram bytes with the checksum/control characters removed,
+            e.g. b'0R0,Dm=166D,Sm=4.9M,...,Vh=0.0#'
+
+    Returns:
+        Dictionary of parsed values, or None if the telegram is not a
+        supported query response or is missing required fields.
+    """
+    fields = bytes(sample).split(b',')
+    required = QUERY_FIELDS.get(fields[0])
+    if required is None:
+        return None
+
+    ndict = {}
+    heater = 0
+    for field in fields[1:]:
+        key = FIELD_KEYS.get(field[:2])
+        # Skip unknown fields and anything that is not 'Key=valueUnit'
+        if key is None or field[2:3] != b'=':
+            continue
+        value = field[3:-1]
+        # Invalid data are flagged by the WXT with '#' characters
+        if len(value) > VALUE_WIDTH or VALID_VALUE.fullmatch(value) is None:
+            continue
+        ndict[key] = float(value)
+        if key == 'Vh':
+            heater = HEATER_STATUS.get(field[-1], 0)
+
+    if fields[0] == b'0R0':
+        # The WXT summary command is user-defined.
+        # Thus, WXT may not have same summary configuration as the CROCUS nodes.
+        # Accept any summary that contains at least one known field.
+        if not ndict:
+            return None
+    else:
+        for key in required:
+            if key not in ndict:
+                return None
+
+    # Apply the heater status to the dictionary (summary and supervisor)
+    if fields[0] == b'0R0' or 'Vh' in ndict:
+        ndict['Jo'] = heater
+
+    return ndict
+
+def _field_code(key):
+    """Pack a two character field key into a single integer"""
+    return (ord(key[0]) << 8) | ord(key[1])
+
+def _bytes_to_float(buf, start, length):
+    """
+    Convert the byte spans buf[start:start + length] to float64 in bulk.
+
+    Digits are accumulated one character column at a time across all spans,
+    so no per-value Python objects are created. Spans that are empty, too
+    wide or not a plain decimal number (e.g. '###' for invalid WXT data)
+    are returned as NaN.
+    """
+    # Note: VALUE_WIDTH digits always fit within int32
+    mantissa = np.zeros(len(start), dtype=np.int32)
+    decimals = np.zeros(len(start), dtype=np.int8)
+    ndigits = np.zeros(len(start), dtype=np.int8)
+    seen_dot = np.zeros(len(start), dtype=bool)
+    negative = np.zeros(len(start), dtype=bool)
+    good = (length > 0) & (length <= VALUE_WIDTH)
+    for col in range(VALUE_WIDTH):
+        inside = col < length
+        char = buf[np.minimum(start + col, len(buf) - 1)]
+        digit = inside & (char >= ord('0')) & (char <= ord('9'))
+        dot = inside & (char == ord('.'))
+        sign = inside & ((char == ord('-')) | (char == ord('+')))
+        mantissa = np.where(digit, mantissa * 10 + (char - ord('0')).astype(np.int32), mantissa)
+        decimals += digit & seen_dot
+        ndigits += digit
+        # A second '.', a sign after the first character or any other
+        # character invalidates the value
+        good &= ~(dot & seen_dot) & ~(sign & (col > 0)) & (~inside | digit | dot | sign)
+        seen_dot |= dot
+        negative |= inside & (char == ord('-'))
+    good &= ndigits > 0
+    # Exact integer divided by a power of ten rounds identically to float()
+    values = mantissa / 10.0 ** decimals
+    values[negative] *= -1
+    values[~good] = np.nan
+    return values
+
+def _timestamps(buf, starts, stops):
+    """
+    Convert the pollsave timestamp prefix of each line to datetime64[us].
+
+    read_wxt530.py:pollsave writes timestamps as '%Y%m%dT%H:%M:%S.%f'; lines
+    without a prefix in that format are returned as NaT.
+    """
+    times = np.full(len(starts), np.datetime64('NaT'), dtype='datetime64[us]')
+    # Source offsets in the pollsave string for each ISO 8601 character;
+    # -1 marks the inserted '-' date separators.
+    order = np.array([0, 1, 2, 3, -1, 4, 5, -1, 6, 7, 8, 9, 10, 11, 12, 13,
+                      14, 15, 16, 17, 18, 19, 20, 21, 22, 23])
+    good = (stops - starts == 24) & (buf[np.minimum(starts + 8, len(buf) - 1)] == ord('T'))
+    if good.any():
+        index = np.minimum(starts[good, None] + np.maximum(order, 0), len(buf) - 1)
+        chars = np.where(order < 0, ord('-'), buf[index]).astype(np.uint8)
+        strings = np.ascontiguousarray(chars).view('S26').ravel()
+        try:
+            times[good] = strings.astype('datetime64[us]')
+        except ValueError:
+            for i, string in zip(np.flatnonzero(good), strings):
+                try:
+                    times[i] = np.datetime64(string.decode('ascii'), 'us')
+                except ValueError:
+                    pass
+    return times
+
+def parse_many(lines, as_frame=False):
+    """
+    Parse a batch of WXT telegrams into columnar arrays.
+
+    The whole buffer is tokenized at once with vectorized byte operations
+    instead of calling parse_values per line. Lines may be raw telegrams or
+    the timestamped lines written by read_wxt530.py:pollsave; as in
+    parse_values, any other line is not a telegram.
+
+    Parameters:
+        lines: bytes/str buffer of newline separated telegrams, or an
+            iterable of bytes/str lines.
+        as_frame: If True, return a pandas DataFrame indexed by time.
+
+    Returns:
+        Dictionary with a datetime64 'time' array, the 'query' number
+        (0-3 or 5, -1 if not a telegram), a boolean 'valid' mask following the
+        parse_values rules and a float64 array per field (NaN if missing).
+    """
+    if isinstance(lines, str):
+        data = lines.encode('utf-8')
+    elif isinstance(lines, (bytes, bytearray, memoryview)):
+        data = bytes(lines)
+    else:
+        data = b'\n'.join(line.encode('utf-8') if isinstance(line, str) else bytes(line)
+                          for line in lines)
+
+    buf = np.frombuffer(data + b'\n', dtype=np.uint8)
+    # Remove the checksum/control characters, keep the line separators
+    buf = buf[(buf > 14) | (buf == ord('\n'))]
+    ends = np.flatnonzero(buf == ord('\n'))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    nonempty = ends > starts
+    starts = starts[nonempty]
+    ends = ends[nonempty]
+    nrows = len(starts)
+    # Pad so look-ahead indexing near the end stays within the buffer
+    buf = np.concatenate((buf, np.zeros(4, dtype=np.uint8)))
+
+    # Locate the telegram within each line, skipping a pollsave timestamp
+    # prefix; like parse_values, anything else must start with the command
+    delims = np.flatnonzero((buf == ord(',')) | (buf == ord('\n')))
+    raw = (buf[starts] == ord('0')) & (buf[starts + 1] == ord('R'))
+    first_delim = delims[np.searchsorted(delims, starts)]
+    times = _timestamps(buf, starts, np.where(raw, starts, first_delim))
+    tstart = np.where(raw, starts, first_delim + 1)
+    tstart = np.minimum(tstart, len(buf) - 4)
+    commands = np.zeros(256, dtype=bool)
+    commands[[command[2] for command in QUERY_FIELDS]] = True
+    is_query = ((raw | (~np.isnat(times) & (first_delim < ends)))
+                & (buf[tstart] == ord('0')) & (buf[tstart + 1] == ord('R'))
+                & commands[buf[tstart + 2]]
+                & ((buf[tstart + 3] == ord(',')) | (buf[tstart + 3] == ord('\n'))))
+    query = np.where(is_query, buf[tstart + 2].astype(np.int8) - ord('0'), -1).astype(np.int8)
+
+    result = {'time' : times, 'query' : query}
+
+    # Tokenize every 'Key=valueUnit' field in the buffer
+    equals = np.flatnonzero(buf == ord('='))
+    equals = equals[equals >= 2]
+    row = np.searchsorted(ends, equals)
+    keep = (row < nrows)
+    equals = equals[keep]
+    row = row[keep]
+    # Keys start a field, an '=' within a value (e.g. a lost comma) is not one
+    keep = (equals - 2 > tstart[row]) & (buf[equals - 3] == ord(',')) & (query[row] >= 0)
+    equals = equals[keep]
+    row = row[keep]
+    code = (buf[equals - 2].astype(np.int32) << 8) | buf[equals - 1]
+    stop = delims[np.searchsorted(delims, equals)]
+    unit = buf[stop - 1]
+    values = _bytes_to_float(buf, equals + 1, stop - equals - 2)
+
+    # Scatter the values into a (field, row) matrix in one pass
+    keys = list(FIELD_KEYS.values())
+    column = np.full(1 << 16, -1, dtype=np.int16)
+    for i, key in enumerate(keys):
+        column[_field_code(key)] = i
+    index = column[code]
+    select = (index >= 0) & ~np.isnan(values)
+    matrix = np.full((len(keys), nrows), np.nan)
+    matrix[index[select], row[select]] = values[select]
+    present = ~np.isnan(matrix)
+    for i, key in enumerate(keys):
+        result[key] = matrix[i]
+
+    # Heater status applies to every 0R0 telegram (default 0) and to every
+    # telegram with a heater voltage
+    heater = np.zeros(256, dtype=np.float64)
+    for char, status in HEATER_STATUS.items():
+        heater[char] = status
+    jo = np.where(query == 0, 0.0, np.nan)
+    vh = select & (index == keys.index('Vh'))
+    jo[row[vh]] = heater[unit[vh]]
+    result['Jo'] = jo
+
+    # Apply the parse_values validity rules per query
+    valid = (query == 0) & present.any(axis=0)
+    for command, required in QUERY_FIELDS.items():
+        number = command[2] - ord('0')
+        if number == 0:
+            continue
+        complete = query == number
+        for key in required:
+            complete &= present[keys.index(key)]
+        valid |= complete
+    result['valid'] = valid
+
+    if as_frame:
+        import pandas as pd
+        frame = pd.DataFrame({key : value for key, value in result.items() if key != 'time'},
+                             index=pd.DatetimeIndex(result['time'], name='time'))
+        return frame
+    return result
+
+def parse_file(path, as_frame=False):
+    """
+    Parse a file of WXT telegrams (e.g. written by read_wxt530.py) into
+    columnar arrays. See parse_many for details on the returned result.
+    """
+    with open(path, mode='rb') as rawfile:
+        data = rawfile.read()
+    return parse_many(data, as_frame=as_frame)
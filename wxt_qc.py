@@ -0,0 +1,176 @@
+"""
+Quality control of the parsed WXT536 samples.
+
+Each sample is checked before it is written and averaged: values outside
+the measurement range, changing faster than physically plausible, or far
+from the rolling median of the recent accepted values are flagged. The
+checks are evaluated for all variables at once on NumPy arrays, with a
+small ring buffer of accepted values per variable, so the cost per sample
+is fixed. Flags are written to the local file next to the values and the
+flagged values are left out of the running averages.
+"""
+
+import json
+import math
+import time
+
+import numpy as np
+
+# QC flag bits, combined when several checks fail
+QC_RANGE = 1
+QC_RATE = 2
+QC_SPIKE = 4
+QC_CHECKS = {"range" : QC_RANGE, "rate" : QC_RATE, "spike" : QC_SPIKE}
+
+# Suffix of the QC flag column of a variable (e.g. Ta_qc)
+QC_SUFFIX = "_qc"
+
+# Default limits of each variable: measurement range of the WXT536 (min, max),
+# largest plausible change per second (rate) and largest departure from the
+# rolling median (spike); None disables a check
+QC_LIMITS = {"Dm" : {"min" : 0, "max" : 360, "rate" : None, "spike" : None},
+             "Sm" : {"min" : 0, "max" : 60, "rate" : None, "spike" : None},
+             "Ta" : {"min" : -52, "max" : 60, "rate" : 1.0, "spike" : 3.0},
+             "Ua" : {"min" : 0, "max" : 100, "rate" : 5.0, "spike" : 10.0},
+             "Pa" : {"min" : 600, "max" : 1100, "rate" : 0.5, "spike" : 1.0},
+             "Rc" : {"min" : 0, "max" : None, "rate" : None, "spike" : None},
+             "Ri" : {"min" : 0, "max" : 200, "rate" : None, "spike" : None},
+             "Hc" : {"min" : 0, "max" : None, "rate" : None, "spike" : None},
+             "Hi" : {"min" : 0, "max" : None, "rate" : None, "spike" : None},
+             "Th" : {"min" : -52, "max" : 80, "rate" : 2.0, "spike" : 5.0},
+             "Vh" : {"min" : 0, "max" : 32, "rate" : None, "spike" : None},
+             "Vs" : {"min" : 0, "max" : 32, "rate" : None, "spike" : None},
+             "Vr" : {"min" : 0, "max" : 4, "rate" : None, "spike" : None},
+             }
+
+def load_limits(path=None):
+    """
+    Return the QC limits, with the variables of a JSON file (e.g.
+    {"Ta": {"spike": 2.0}}) updating the defaults.
+    """
+    limits = {key : dict(value) for key, value in QC_LIMITS.items()}
+    if path:
+        with open(path, encoding="utf-8") as config:
+            for key, value in json.load(config).items():
+                limits.setdefault(key, {"min" : None, "max" : None, "rate" : None, "spike" : None})
+                limits[key].update(value)
+    return limits
+
+def flag_names(publish_names, limits):
+    """
+    Return the publish_names entries of the QC flag columns of the checked
+    variables, e.g. Ta_qc : [wxt.env.temp.qc, Air Temperature QC Flag, Unitless]
+    """
+    return {key + QC_SUFFIX : [f"{info[0]}.qc", f"{info[1]} QC Flag", "Unitless"]
+            for key, info in publish_names.items() if key in limits}
+
+def accepted(sample):
+    """
+    Return a sample (e.g. read back with its flag columns) without the
+    flagged values and the flag columns.
+    """
+    return {key : value for key, value in sample.items()
+            if not key.endswith(QC_SUFFIX) and not sample.get(key + QC_SUFFIX)}
+
+class QualityControl:
+    """
+    Range, rate of change and rolling median spike checks of the samples.
+
+    A value is compared to the last accepted value of the variable (rate)
+    and to the median of the last window accepted values (spike, once the
+    window is full). A change that persists for more than window samples is
+    accepted as real and becomes the new reference.
+
+    Parameters:
+        limits: Dictionary of variable to its min, max, rate and spike limits
+        window: Number of accepted values of the rolling median
+        interval: Nominal seconds between samples, the shortest time assumed
+            between two samples for the rate of change (samples queued by
+            the asyncio engine may be checked back to back)
+        clock: Monotonic clock in seconds, for the rate of change
+    """
+    def __init__(self, limits=QC_LIMITS, window=5, interval=1.0, clock=time.monotonic):
+        self.keys = list(limits)
+        self.window = window
+        self.interval = interval
+        self.clock = clock
+        table = np.array([[math.nan if limits[key].get(name) is None else limits[key][name]
+                           for name in ("min", "max", "rate", "spike")]
+                          for key in self.keys], dtype=np.float64)
+        self.low, self.high, self.rate, self.spike = table.T.copy()
+        size = len(self.keys)
+        self.history = np.full((size, window), np.nan)
+        self.heads = np.zeros(size, dtype=np.int64)
+        self.last = np.full(size, np.nan)
+        self.last_time = np.full(size, np.nan)
+        self.rejected = np.zeros(size, dtype=np.int64)
+        self._rows = np.arange(size)
+        self.reset_counts()
+
+    def reset_counts(self):
+        """Clear the flag counters for the next interval"""
+        self.counts = {name : 0 for name in QC_CHECKS}
+        self.flagged = np.zeros(len(self.keys), dtype=np.int64)
+
+    def check(self, sample, now=None):
+        """
+        Check the values of a parsed sample.
+
+        Returns:
+            Dictionary of the QC flag of each checked variable in the sample,
+            0 if the value passed
+        """
+        now = self.clock() if now is None else now
+        values = np.array([sample.get(key) for key in self.keys], dtype=np.float64)
+        present = ~np.isnan(values)
+        flags = np.zeros(len(self.keys), dtype=np.int64)
+        # Comparisons with NaN limits (disabled checks) are always False
+        with np.errstate(invalid="ignore", divide="ignore"):
+            flags[(values < self.low) | (values > self.high)] |= QC_RANGE
+            change = np.abs(values - self.last) / np.maximum(now - self.last_time, self.interval)
+            flags[change > self.rate] |= QC_RATE
+            # Note: np.sort is several times faster than np.median on short rows
+            ordered = np.sort(self.history, axis=1)
+            middle = self.window // 2
+            if self.window % 2:
+                median = ordered[:, middle]
+            else:
+                median = (ordered[:, middle - 1] + ordered[:, middle]) / 2
+            # The spike check starts once the window is full
+            median[self.heads < self.window] = np.nan
+            flags[np.abs(values - median) > self.spike] |= QC_SPIKE
+
+        # Accept a persistent change (not a range failure) as the new reference
+        failed = present & (flags != 0)
+        self.rejected = np.where(failed, self.rejected + 1, np.where(present, 0, self.rejected))
+        persistent = failed & (self.rejected > self.window) & ((flags & QC_RANGE) == 0)
+        if persistent.any():
+            flags[persistent] = 0
+            self.history[persistent] = np.nan
+            self.heads[persistent] = 0
+            self.rejected[persistent] = 0
+
+        passed = present & (flags == 0)
+        self.last[passed] = values[passed]
+        self.last_time[passed] = now
+        rows = self._rows[passed]
+        self.history[rows, self.heads[rows] % self.window] = values[passed]
+        self.heads[rows] += 1
+
+        if failed.any():
+            self.flagged += failed & (flags != 0)
+            for name, bit in QC_CHECKS.items():
+                self.counts[name] += int(np.count_nonzero(flags & bit))
+        return {key : int(flag) for key, flag, here in zip(self.keys, flags.tolist(), present.tolist())
+                if here}
+
+    def metrics(self):
+        """
+        Return the flag counts of the interval as a dictionary: qc.range,
+        qc.rate, qc.spike and qc.<variable> for the flagged variables.
+        """
+        out = {f"qc.{name}" : count for name, count in self.counts.items()}
+        for key, count in zip(self.keys, self.flagged.tolist()):
+            if count:
+                out[f"qc.{key}"] = count
+        return out
@@ -0,0 +1,412 @@
+"""
+Offline reprocessing of archived WXT536 local files into interval averages.
+
+The CSV files written by app.py (<site>.wxt536.[<instrument>.]YYYYmmdd.HHMMSS.csv,
+optionally .gz, .xz or .zst compressed) are loaded with the pyarrow CSV
+reader, which understands the four-row header of initialize_local_file and
+the -9999 missing values. Each file is reduced in a process pool to the
+sums of its samples per interval (BinnedSums), so the workers only return a
+few rows per file. The sums are merged across files, which averages the
+intervals spanning file boundaries exactly, and written to one Parquet or
+NetCDF file per site and instrument.
+
+The averages follow wxt_stats.RunningAverage: temporal mean, vector mean of
+the wind directions, last value of the accumulations and most frequent
+heater status. Values flagged by the quality control (<variable>_qc
+columns) are left out. Requires pyarrow, and netCDF4 for NetCDF output.
+
+Usage:
+python wxt_reprocess.py /data/wxt536 --interval 15min --outdir /data/averages
+"""
+
+import os
+import re
+import csv
+import lzma
+import time
+import argparse
+import functools
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from wxt_stats import DIRECTION_KEYS, ACCUMULATION_KEYS, STATUS_KEYS
+from wxt_storage import STORAGE_FORMATS, CSV_MISSING, file_codec
+from wxt_qc import QC_SUFFIX
+
+# Local CSV files written by app.py, optionally compressed after rotation
+LOCAL_FILE = re.compile(r"^(?P<site>.+)\.wxt536\.(?:(?P<instrument>[^.]+)\.)?"
+                        r"(?P<stamp>\d{8}\.\d{6})\.csv(?:\.(?:gz|xz|zst))?$")
+
+# Number of header rows of the local CSV files (long names, units, waggle
+# names and short names)
+HEADER_ROWS = 4
+
+# Interval units accepted by parse_interval, in seconds
+INTERVAL_UNITS = {"s" : 1, "min" : 60, "h" : 3600, "H" : 3600, "d" : 86400}
+
+# Column of the number of samples averaged in each interval
+SAMPLES_NAME = {"samples" : ["wxt.samples", "Number of Samples", "Unitless"]}
+
+def parse_interval(interval):
+    """
+    Convert an interval string (e.g. 30s, 15min, 1h, 1d) or a number of
+    seconds to seconds.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*", str(interval))
+    if match is None or match.group(2) not in INTERVAL_UNITS and match.group(2):
+        raise ValueError(f"Invalid interval {interval}, e.g. 30s, 15min, 1h or 1d")
+    seconds = float(match.group(1)) * INTERVAL_UNITS.get(match.group(2), 1)
+    if seconds <= 0:
+        raise ValueError("interval must be > 0")
+    return seconds
+
+def interval_name(seconds):
+    """Short name of an interval for file names, e.g. 900 -> 15min"""
+    for unit, size in (("d", 86400), ("h", 3600), ("min", 60)):
+        if seconds % size == 0:
+            return f"{int(seconds // size)}{unit}"
+    return f"{seconds:g}s"
+
+def find_local_files(indir):
+    """
+    Find the local CSV files in a directory (recursively), grouped by site
+    and instrument.
+
+    A file kept both uncompressed and compressed (compress_file keeps the
+    original) is only read once, preferring the uncompressed copy.
+
+    Returns:
+        Dictionary of (site, instrument) to the sorted list of paths,
+        instrument is None for single-instrument file names
+    """
+    files = {}
+    for path in sorted(Path(indir).rglob("*.wxt536.*")):
+        match = LOCAL_FILE.match(path.name)
+        if match is None or not path.is_file():
+            continue
+        key = (match.group("site"), match.group("instrument"))
+        name = path.with_name(f"{path.name.split('.csv')[0]}.csv")
+        known = files.setdefault(key, {}).get(name)
+        if known is None or file_codec(known) is not None:
+            files[key][name] = path
+    return {key : [paths[name] for name in sorted(paths)] for key, paths in files.items()}
+
+def read_bytes(path):
+    """Read a whole file, decompressing gzip, xz or zstd files"""
+    if file_codec(path) == 'xz':
+        with lzma.open(path, mode='rb') as source:
+            return source.read()
+    import pyarrow
+    with pyarrow.input_stream(str(path), compression='detect') as source:
+        return source.read()
+
+def load_local_file(path):
+    """
+    Load a local CSV file written by app.py.
+
+    Returns:
+        Tuple of the variables (dictionary of short name to [waggle name,
+        long name, units], in column order, without the time), the UTC
+        seconds of the samples (int64) and the 2D float64 array of values
+        with NaN for missing values. Malformed rows, e.g. a truncated last
+        line, are skipped.
+    """
+    import pyarrow
+    import pyarrow.csv
+
+    data = read_bytes(path)
+    offset = 0
+    for _ in range(HEADER_ROWS):
+        offset = data.index(b'\n', offset) + 1
+    header = list(csv.reader(data[:offset].decode('utf-8').splitlines()))
+    long_names, units, waggle_names, short_names = (row[1:] for row in header)
+    variables = {name : [waggle_name, long_name, unit] for name, waggle_name, long_name, unit
+                 in zip(short_names, waggle_names, long_names, units)}
+
+    column_names = ['time'] + short_names
+    column_types = {name : pyarrow.float64() for name in short_names}
+    column_types['time'] = pyarrow.timestamp('s', tz='UTC')
+    table = pyarrow.csv.read_csv(
+        pyarrow.BufferReader(memoryview(data)[offset:]),
+        # Worker processes each read one file, no threads within a file
+        read_options=pyarrow.csv.ReadOptions(column_names=column_names, use_threads=False),
+        parse_options=pyarrow.csv.ParseOptions(invalid_row_handler=lambda row: 'skip'),
+        convert_options=pyarrow.csv.ConvertOptions(column_types=column_types,
+                                                   null_values=[CSV_MISSING, '']))
+    times = table.column('time').cast(pyarrow.int64()).to_numpy()
+    values = np.empty((table.num_rows, len(short_names)), dtype=np.float64)
+    for i, name in enumerate(short_names):
+        values[:, i] = table.column(name).to_numpy(zero_copy_only=False)
+    return variables, times, values
+
+class BinnedSums:
+    """
+    Sums of the samples of each averaging interval (bin), the reprocessing
+    counterpart of wxt_stats.RunningAverage.
+
+    Sums are kept in columns aligned with the bins: additive columns (sample
+    counts, sums, wind direction unit vectors and heater status counts) and
+    latest columns (time and value of the last accumulation sample). Sums of
+    the same bin from several files are merged with merge().
+
+    Parameters:
+        bins: Sorted int64 array of the bin numbers, UTC seconds // interval
+        nsamples: Number of samples of each bin
+        sums: Dictionary of additive column name to array
+        latest: Dictionary of accumulation variable to (times, values) arrays
+    """
+    def __init__(self, bins, nsamples, sums, latest):
+        self.bins = bins
+        self.nsamples = nsamples
+        self.sums = sums
+        self.latest = latest
+
+    @classmethod
+    def from_samples(cls, times, keys, values, interval):
+        """
+        Sum the samples (e.g. of a local file) per interval.
+
+        Parameters:
+            times: UTC seconds of the samples
+            keys: Short names of the value columns
+            values: 2D array of values, NaN if missing
+            interval: Interval in seconds
+        """
+        bins = np.floor_divide(times, interval).astype(np.int64)
+        sums = {}
+        latest = {}
+        for key, column in zip(keys, values.T):
+            valid = ~np.isnan(column)
+            if not valid.any():
+                continue
+            if key in ACCUMULATION_KEYS:
+                latest[key] = (np.where(valid, times, np.nan), column)
+            elif key in DIRECTION_KEYS:
+                radians = np.radians(column)
+                sums[f"{key}.east"] = np.where(valid, np.sin(radians), 0.0)
+                sums[f"{key}.north"] = np.where(valid, np.cos(radians), 0.0)
+                sums[f"{key}.count"] = valid.astype(np.float64)
+            elif key in STATUS_KEYS:
+                for status in np.unique(column[valid]).tolist():
+                    sums[f"{key}.{status:g}"] = (column == status).astype(np.float64)
+            else:
+                sums[f"{key}.sum"] = np.where(valid, column, 0.0)
+                sums[f"{key}.count"] = valid.astype(np.float64)
+        return cls(bins, np.ones(len(bins)), sums, latest)._reduce()
+
+    @classmethod
+    def merge(cls, parts):
+        """Merge the sums of several files, e.g. of consecutive files"""
+        parts = [part for part in parts if len(part.bins)]
+        if not parts:
+            return cls(np.empty(0, dtype=np.int64), np.empty(0), {}, {})
+        names = list(dict.fromkeys(name for part in parts for name in part.sums))
+        keys = list(dict.fromkeys(key for part in parts for key in part.latest))
+        sums = {name : np.concatenate([part.sums.get(name, np.zeros(len(part.bins)))
+                                       for part in parts]) for name in names}
+        latest = {}
+        for key in keys:
+            columns = [part.latest.get(key, (np.full(len(part.bins), np.nan),) * 2)
+                       for part in parts]
+            latest[key] = (np.concatenate([column[0] for column in columns]),
+                           np.concatenate([column[1] for column in columns]))
+        return cls(np.concatenate([part.bins for part in parts]),
+                   np.concatenate([part.nsamples for part in parts]), sums, latest)._reduce()
+
+    def _reduce(self):
+        """Combine the rows of the same bin, the bins are returned sorted"""
+        bins, inverse = np.unique(self.bins, return_inverse=True)
+        size = len(bins)
+        nsamples = np.bincount(inverse, weights=self.nsamples, minlength=size)
+        sums = {name : np.bincount(inverse, weights=column, minlength=size)
+                for name, column in self.sums.items()}
+        latest = {}
+        for key, (times, values) in self.latest.items():
+            # Last valid value of each bin: sort by bin, then time (NaN last)
+            valid = ~np.isnan(times)
+            order = np.lexsort((times[valid], inverse[valid]))
+            groups = inverse[valid][order]
+            ends = np.flatnonzero(np.append(groups[1:] != groups[:-1], True)) if len(groups) else groups
+            out_times = np.full(size, np.nan)
+            out_values = np.full(size, np.nan)
+            out_times[groups[ends]] = times[valid][order][ends]
+            out_values[groups[ends]] = values[valid][order][ends]
+            latest[key] = (out_times, out_values)
+        return BinnedSums(bins, nsamples, sums, latest)
+
+    def means(self, keys):
+        """
+        Return the interval averages of the variables as a 2D array in the
+        order of keys, NaN for intervals without valid samples.
+        """
+        out = np.full((len(self.bins), len(keys)), np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for i, key in enumerate(keys):
+                if key in ACCUMULATION_KEYS:
+                    if key in self.latest:
+                        out[:, i] = self.latest[key][1]
+                elif key in DIRECTION_KEYS:
+                    if f"{key}.count" not in self.sums:
+                        continue
+                    east = self.sums[f"{key}.east"]
+                    north = self.sums[f"{key}.north"]
+                    count = self.sums[f"{key}.count"]
+                    direction = np.degrees(np.arctan2(east / count, north / count)) % 360
+                    # Direction is undefined for opposing vectors (up to rounding)
+                    out[:, i] = np.where(np.hypot(east, north) <= 1e-9 * count, np.nan, direction)
+                elif key in STATUS_KEYS:
+                    prefix = f"{key}."
+                    statuses = sorted(float(name[len(prefix):]) for name in self.sums
+                                      if name.startswith(prefix))
+                    if not statuses:
+                        continue
+                    counts = np.stack([self.sums[f"{prefix}{status:g}"] for status in statuses])
+                    out[:, i] = np.where(counts.max(axis=0) > 0,
+                                         np.array(statuses)[counts.argmax(axis=0)], np.nan)
+                elif f"{key}.sum" in self.sums:
+                    out[:, i] = self.sums[f"{key}.sum"] / self.sums[f"{key}.count"]
+        return out
+
+def sum_local_file(path, interval):
+    """
+    Load a local file and sum its samples per interval, skipping the values
+    flagged by the quality control. Runs in the worker processes.
+
+    Returns:
+        Tuple of the path, the variables of the file and its BinnedSums, or
+        the path, None and the error message if the file could not be read
+    """
+    try:
+        variables, times, values = load_local_file(path)
+    except Exception as err:
+        return path, None, f"{type(err).__name__}: {err}"
+    keys = list(variables)
+    for key in keys:
+        if key.endswith(QC_SUFFIX) and key[:-len(QC_SUFFIX)] in variables:
+            flags = values[:, keys.index(key)]
+            values[flags > 0, keys.index(key[:-len(QC_SUFFIX)])] = np.nan
+    columns = [i for i, key in enumerate(keys) if not key.endswith(QC_SUFFIX)]
+    variables = {keys[i] : variables[keys[i]] for i in columns}
+    return path, variables, BinnedSums.from_samples(times, list(variables),
+                                                    values[:, columns], interval)
+
+def reprocess(paths, interval, workers=None):
+    """
+    Average the local files at the interval, in a pool of worker processes.
+
+    Returns:
+        Tuple of the variables (union of the file headers, in order of
+        appearance), the merged BinnedSums and the number of files read
+    """
+    variables = {}
+    parts = []
+    # A few tasks per worker and round, the results are small
+    chunksize = max(1, len(paths) // (8 * (workers or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path, file_variables, result in executor.map(functools.partial(sum_local_file,
+                                                                           interval=interval),
+                                                         paths, chunksize=chunksize):
+            if file_variables is None:
+                print(f"Skipped {path}: {result}")
+                continue
+            for key, info in file_variables.items():
+                variables.setdefault(key, info)
+            parts.append(result)
+    return variables, BinnedSums.merge(parts), len(parts)
+
+def write_averages(path, storage, variables, sums, interval, attrs, chunk_rows=100000):
+    """
+    Write the interval averages, labelled by the start of the interval, with
+    the number of samples of each interval, to a Parquet or NetCDF file.
+    """
+    keys = list(variables)
+    columns = {**variables, **SAMPLES_NAME}
+    writer = STORAGE_FORMATS[storage][1](path, columns, attrs=attrs)
+    try:
+        for start in range(0, len(sums.bins), chunk_rows):
+            rows = slice(start, start + chunk_rows)
+            chunk = BinnedSums(sums.bins[rows], sums.nsamples[rows],
+                               {name : column[rows] for name, column in sums.sums.items()},
+                               {key : (times[rows], values[rows])
+                                for key, (times, values) in sums.latest.items()})
+            values = np.column_stack([chunk.means(keys), chunk.nsamples])
+            writer.write_records(chunk.bins * interval, values)
+    finally:
+        writer.close()
+
+def main(args):
+    """Reprocess each site and instrument of the input directory"""
+    interval = parse_interval(args.interval)
+    outdir = Path(args.outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    groups = find_local_files(args.indir)
+    if args.site:
+        groups = {key : paths for key, paths in groups.items() if key[0] == args.site}
+    if args.instrument:
+        groups = {key : paths for key, paths in groups.items() if key[1] == args.instrument}
+    if not groups:
+        print(f"No local files found in {args.indir}")
+        return
+
+    for (site, instrument), paths in groups.items():
+        start = time.perf_counter()
+        variables, sums, nfiles = reprocess(paths, interval, workers=args.workers)
+        name = (site + '.wxt536.' + (f"{instrument}." if instrument else "") +
+                interval_name(interval) + STORAGE_FORMATS[args.storage][0])
+        attrs = {"site" : site, "averaging_interval" : interval_name(interval),
+                 "source_files" : nfiles}
+        if instrument:
+            attrs["instrument_name"] = instrument
+        write_averages(outdir / name, args.storage, variables, sums, interval, attrs)
+        print(f"Wrote {outdir / name}: {len(sums.bins)} intervals from {nfiles} files"
+              f" ({int(sums.nsamples.sum())} samples) in {time.perf_counter() - start:.1f} s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Reprocess archived WXT536 local files into interval averages")
+    parser.add_argument("indir",
+                        type=str,
+                        help="Directory of the <site>.wxt536.*.csv local files, searched recursively"
+                        )
+    parser.add_argument("--interval",
+                        type=str,
+                        default="1min",
+                        dest="interval",
+                        help="[str|Default 1min] Averaging interval, e.g. 30s, 15min, 1h or 1d"
+                        )
+    parser.add_argument("--outdir",
+                        type=str,
+                        default=".",
+                        dest="outdir",
+                        help="[str|Default .] Directory of the averaged files," +
+                             " named <site>.wxt536.[<instrument>.]<interval>.<ext>"
+                        )
+    parser.add_argument("--storage",
+                        type=str,
+                        default="parquet",
+                        choices=["parquet", "nc"],
+                        dest="storage",
+                        help="[str|Default parquet] Format of the averaged files"
+                        )
+    parser.add_argument("--workers",
+                        type=int,
+                        default=None,
+                        dest="workers",
+                        help="[int|Default CPU count] Number of worker processes"
+                        )
+    parser.add_argument("--site",
+                        type=str,
+                        default=None,
+                        dest="site",
+                        help="[str|Default all] Only reprocess the files of this site"
+                        )
+    parser.add_argument("--instrument",
+                        type=str,
+                        default=None,
+                        dest="instrument",
+                        help="[str|Default all] Only reprocess the files of this instrument name"
+                        )
+    args = parser.parse_args()
+
+    main(args)
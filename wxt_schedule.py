@@ -0,0 +1,149 @@
+"""
+Scheduling of the WXT536 queries and local file rotation.
+
+Queries are timed against absolute deadlines on the monotonic clock, so the
+time spent on each query does not accumulate into the sampling interval.
+Several query commands can be scheduled at individual rates. File rotation
+is aligned to wall-clock interval boundaries.
+"""
+
+import time
+
+class SampleClock:
+    """
+    Drift-free sampling clock with jitter statistics.
+
+    Call tick() when a sample is started and wait() (or sleep for delay() in
+    an event loop) afterwards. Deadlines advance by a fixed interval from the
+    start time; deadlines that can no longer be met are skipped and counted
+    as missed.
+
+    Parameters:
+        interval: Sampling interval in seconds
+        clock: Monotonic clock function returning seconds
+    """
+    def __init__(self, interval, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self.deadline = clock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Start a new statistics interval"""
+        self.stats_start = self.clock()
+        self.samples = 0
+        self.missed = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+
+    def tick(self):
+        """Record the start of a sample against its deadline"""
+        jitter = abs(self.clock() - self.deadline)
+        self.samples += 1
+        self.jitter_sum += jitter
+        self.jitter_max = max(self.jitter_max, jitter)
+
+    def delay(self):
+        """
+        Advance to the next deadline and return the seconds until it.
+
+        If the next deadline has already passed, the missed ticks are skipped
+        and logged rather than run back to back.
+        """
+        self.deadline += self.interval
+        late = self.clock() - self.deadline
+        if late > 0:
+            missed = int(late // self.interval) + 1
+            self.deadline += missed * self.interval
+            self.missed += missed
+            print(f"Sampling behind schedule, skipped {missed} queries")
+        return max(self.deadline - self.clock(), 0.0)
+
+    def wait(self):
+        """Sleep until the next deadline"""
+        time.sleep(self.delay())
+
+    def stats(self):
+        """Return the sampling statistics of the current interval as a dictionary"""
+        elapsed = self.clock() - self.stats_start
+        return {"sample.rate" : self.samples / elapsed if elapsed > 0 else 0.0,
+                "sample.jitter_mean" : self.jitter_sum / self.samples if self.samples else 0.0,
+                "sample.jitter_max" : self.jitter_max,
+                "sample.missed" : self.missed,
+                }
+
+class QuerySchedule:
+    """
+    Round-robin schedule of several query commands at individual rates.
+
+    Each query is given as 'COMMAND' (sent every tick) or 'COMMAND:SECONDS'
+    (e.g. '0R2:10' for PTU every 10 seconds), rates are rounded to a whole
+    number of sampling ticks.
+
+    Parameters:
+        queries: List of query strings
+        interval: Sampling tick interval in seconds
+    """
+    def __init__(self, queries, interval):
+        self.interval = interval
+        self.commands = []
+        for query in queries:
+            command, _, seconds = query.partition(':')
+            every = max(int(round(float(seconds) / interval)), 1) if seconds else 1
+            self.commands.append((command, every))
+        self.tick = 0
+
+    def due(self):
+        """Return the commands due at this tick and advance to the next"""
+        due = [command for command, every in self.commands if self.tick % every == 0]
+        self.tick += 1
+        return due
+
+class IntervalBoundary:
+    """
+    Wall-clock aligned interval boundaries, e.g. every 15 minutes UTC.
+
+    due() returns True once each time a boundary has been crossed since the
+    previous call, even if the loop was too slow to observe the boundary
+    minute itself. The length of the interval it ends, from the boundary
+    that started it, is then available as length (seconds); it differs from
+    the period when the period was changed during the interval.
+
+    Parameters:
+        minutes: Interval length in minutes
+        clock: Wall clock function returning seconds since the epoch
+    """
+    def __init__(self, minutes, clock=time.time):
+        self.period = minutes * 60
+        self.clock = clock
+        self.last = self.index()
+        self.start = self.last * self.period
+        self.length = self.period
+
+    def set_period(self, minutes):
+        """
+        Change the interval length, the current interval is not rotated and
+        ends at the next boundary of the new length
+        """
+        self.period = minutes * 60
+        self.last = self.index()
+
+    def index(self):
+        """Number of whole intervals since the epoch"""
+        return int(self.clock() // self.period)
+
+    def due(self):
+        """True if a boundary has been crossed since the last call"""
+        index = self.index()
+        if index > self.last:
+            self.last = index
+            self.length = index * self.period - self.start
+            self.start = index * self.period
+            return True
+        # Note: wall clock stepped back (e.g. NTP), re-align without rotating
+        self.last = index
+        return False
+
+    def remaining(self):
+        """Seconds until the next boundary"""
+        return self.period - self.clock() % self.period
@@ -0,0 +1,398 @@
+"""
+Serial communication helpers for the WXT536.
+
+SerialConnection owns the serial port, detects I/O errors and timeouts and
+reconnects with exponential backoff, discovering the WXT among the serial
+ports if needed. TelegramStream frames the telegrams the WXT536 pushes in
+automatic message mode, so they can be read continuously instead of polled
+one query at a time. clean_telegram strips the line terminator and control
+characters and validates the optional WXT CRC.
+"""
+
+import json
+import time
+from pathlib import Path
+
+import serial
+from serial.tools import list_ports
+
+# Control characters removed from every telegram (line terminator etc.)
+CONTROL_CHARS = bytes(range(15))
+
+def _crc_table():
+    """CRC-16 lookup table of the WXT (polynomial 0xA001, reflected)"""
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+CRC_TABLE = _crc_table()
+
+def wxt_crc(data):
+    """
+    Return the three character CRC the WXT appends to a telegram.
+
+    The CRC-16 of the telegram (without CRC and line terminator) is encoded
+    in three printable characters of 4, 6 and 6 bits, each ORed with 0x40.
+    """
+    crc = 0
+    for byte in data:
+        crc = (crc >> 8) ^ CRC_TABLE[(crc ^ byte) & 0xFF]
+    return bytes((0x40 | (crc >> 12), 0x40 | ((crc >> 6) & 0x3F), 0x40 | (crc & 0x3F)))
+
+def clean_telegram(line, crc=False):
+    """
+    Remove the line terminator and control characters from a raw telegram.
+
+    The characters are removed in a single bytes.translate pass, which
+    returns a new bytes object.
+
+    Parameters:
+        line: Raw telegram bytes as read from the serial port
+        crc: If True, the telegram ends with a WXT CRC (e.g. responses to
+            0r0 polls or M=a automatic messages), which is validated and
+            removed, and the lowercase CRC command is returned as '0R'.
+
+    Returns:
+        Cleaned telegram bytes, None if the CRC does not match
+    """
+    telegram = line.translate(None, CONTROL_CHARS)
+    if crc:
+        if len(telegram) < 4 or wxt_crc(telegram[:-3]) != telegram[-3:]:
+            return None
+        if telegram[1:2] == b'r':
+            return b'0R' + telegram[2:-3]
+        return telegram[:-3]
+    return telegram
+
+def crc_command(command):
+    """
+    Return the variant of a poll or message mode command whose replies
+    carry a CRC, e.g. 0R0 -> 0r0 and 0XU,M=A -> 0XU,M=a.
+    """
+    if command[1:2] == 'R':
+        return command[:1] + 'r' + command[2:]
+    if command.endswith(',M=A'):
+        return command[:-1] + 'a'
+    return command
+
+# Automatic ASCII message mode, the WXT pushes telegrams at the update
+# intervals of each sensor (e.g. 0WU,I=1 for wind every second)
+STREAM_CONFIG = ["0XU,M=A"]
+# Polled ASCII mode, restored when streaming is stopped
+POLL_CONFIG = ["0XU,M=P"]
+
+class TelegramStream:
+    """
+    Frames telegrams from the WXT automatic message stream.
+
+    Bytes are read as they become available into a reusable buffer and
+    split on the line terminator; partial telegrams are kept until the rest
+    arrives. Each complete telegram is copied once out of the buffer into
+    its own bytes object, which clean_telegram then translates into a
+    second one; the telegrams are not parsed in place.
+
+    Parameters:
+        ser: Open serial.Serial connection to the WXT
+        max_length: Longest telegram accepted; bytes without a line
+            terminator beyond this are discarded as garbage
+    """
+    def __init__(self, ser, max_length=512):
+        self.ser = ser
+        self.max_length = max_length
+        self.discarded = 0
+        self._buffer = bytearray()
+
+    def configure(self, commands, settle=0.2):
+        """
+        Send configuration commands (e.g. STREAM_CONFIG) to the WXT.
+
+        The replies, and anything received before, are discarded.
+        """
+        for command in commands:
+            self.ser.write(bytearray(command + '\r\n', 'utf-8'))
+            time.sleep(settle)
+        self.ser.reset_input_buffer()
+        self._buffer.clear()
+
+    def read(self):
+        """
+        Read from the serial port and return the complete telegrams.
+
+        Blocks for at most the serial port timeout when no data are
+        available. Each returned telegram includes its line terminator.
+        """
+        data = self.ser.read(max(self.ser.in_waiting, 1))
+        if not data:
+            return []
+        self._buffer += data
+        telegrams = []
+        start = 0
+        # Note: slicing the memoryview instead of the bytearray copies
+        # each telegram once instead of twice
+        view = memoryview(self._buffer)
+        while True:
+            end = self._buffer.find(b'\n', start)
+            if end < 0:
+                break
+            telegrams.append(bytes(view[start:end + 1]))
+            start = end + 1
+        view.release()
+        # Note: deleting from the front keeps the allocated capacity
+        del self._buffer[:start]
+        if len(self._buffer) > self.max_length:
+            self.discarded += len(self._buffer)
+            self._buffer.clear()
+        return telegrams
+
+# Identification query, the WXT replies with its communication settings
+# (e.g. 0XU,A=0,M=P,T=0,C=2,I=0,B=19200,...,N=WXT530,V=3.86)
+PROBE_COMMAND = "0XU"
+
+def probe_port(device, baud_rate=19200, timeout=2.0):
+    """
+    Return True if a WXT answers the identification query on a serial port.
+
+    The WXT may be pushing automatic messages, so a few lines are read
+    looking for the settings reply.
+    """
+    try:
+        with serial.Serial(device, baud_rate, timeout=0.5) as ser:
+            ser.reset_input_buffer()
+            ser.write(bytearray(PROBE_COMMAND + '\r\n', 'utf-8'))
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                line = ser.readline().translate(None, CONTROL_CHARS)
+                if line.startswith(PROBE_COMMAND.encode('ascii') + b','):
+                    return True
+    except (serial.SerialException, OSError):
+        pass
+    return False
+
+def discover_port(baud_rate=19200, preferred=None):
+    """
+    Find the serial port of a WXT by probing the ports of the system.
+
+    Parameters:
+        baud_rate: Baud rate of the WXT
+        preferred: USB serial number of the port probed first, e.g. of the
+            port cached from a previous discovery
+
+    Returns:
+        serial.tools.list_ports ListPortInfo of the WXT, None if not found
+    """
+    ports = [port for port in list_ports.comports() if port.hwid != 'n/a']
+    ports.sort(key=lambda port: preferred is None or port.serial_number != preferred)
+    for port in ports:
+        if probe_port(port.device, baud_rate):
+            return port
+    return None
+
+class SerialConnection:
+    """
+    Serial connection to the WXT with reconnection and port discovery.
+
+    The read and write methods mirror serial.Serial. I/O errors, and reads
+    returning no data for silence seconds, close the port and are raised as
+    serial.SerialException. The silence is counted from the first query
+    left unanswered (or the last data received, when reading without a
+    query, e.g. automatic messages), so a gap between polls is not silence; connect() then reopens it with exponential
+    backoff. With device 'auto' the WXT is discovered among the
+    serial ports with an identification query, and the port found is cached
+    so the next start (or a USB re-enumeration) tries it first.
+
+    Parameters:
+        device: Serial device path, or 'auto' to discover the WXT
+        baud_rate: Baud rate of the WXT
+        timeout: Read timeout in seconds
+        cache_path: JSON file where the discovered port is cached
+        backoff: Seconds before the first reconnection attempt, doubled
+            after each failed attempt
+        backoff_max: Upper limit of the wait between attempts
+        silence: Seconds without any data received treated as a lost
+            connection (e.g. a powered down WXT), 0 to never reconnect on
+            timeouts. Must exceed the query interval plus the timeout, for
+            a single missed reply not to close the port
+        on_connect: Callable run after each (re)connection, e.g. to
+            configure automatic messages
+    """
+    def __init__(self, device='auto', baud_rate=19200, timeout=1, cache_path=None,
+                 backoff=1.0, backoff_max=60.0, silence=10.0, on_connect=None):
+        self.requested = device
+        self.device = None if device == 'auto' else device
+        self.baud_rate = baud_rate
+        self.timeout = timeout
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.silence = silence
+        self.on_connect = on_connect
+        self.ser = None
+        self.connects = 0
+        self.disconnects = 0
+        self._serial_number = None
+        self._attempts = 0
+        self._next_attempt = 0.0
+        self._last_data = 0.0
+        self._unanswered = None
+        self._load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _load(self):
+        """Restore the port cached by a previous discovery"""
+        if self.requested != 'auto' or self.cache_path is None or not self.cache_path.exists():
+            return
+        try:
+            with open(self.cache_path, encoding="utf-8") as cache:
+                port = json.load(cache)
+            self.device = port['device']
+            self._serial_number = port.get('serial_number')
+        except (OSError, ValueError, KeyError) as err:
+            print(f"Unable to read cached serial port {self.cache_path}: {err}")
+
+    def _save(self):
+        """Cache the discovered port"""
+        if self.requested != 'auto' or self.cache_path is None:
+            return
+        try:
+            with open(self.cache_path, mode='w', encoding="utf-8") as cache:
+                json.dump({'device' : self.device, 'serial_number' : self._serial_number}, cache)
+        except OSError as err:
+            print(f"Unable to cache serial port {self.cache_path}: {err}")
+
+    @property
+    def connected(self):
+        """True while the port is open"""
+        return self.ser is not None
+
+    def _find(self):
+        """Return the device to open, discovering the WXT if needed"""
+        if self.requested != 'auto':
+            return self.requested
+        if self.device is not None and probe_port(self.device, self.baud_rate):
+            return self.device
+        print("Searching the serial ports for the WXT")
+        port = discover_port(self.baud_rate, preferred=self._serial_number)
+        if port is None:
+            return None
+        print(f"Found the WXT on {port.device}")
+        self.device = port.device
+        self._serial_number = port.serial_number
+        self._save()
+        return self.device
+
+    def connect(self):
+        """
+        Open the port if it is closed and a (re)connection attempt is due.
+
+        Returns:
+            True if the port is open
+        """
+        if self.ser is not None:
+            return True
+        now = time.monotonic()
+        if now < self._next_attempt:
+            return False
+        try:
+            device = self._find()
+            if device is None:
+                raise serial.SerialException("no WXT found on the serial ports")
+            self.ser = serial.Serial(device,
+                                     self.baud_rate,
+                                     parity=serial.PARITY_NONE,
+                                     stopbits=serial.STOPBITS_ONE,
+                                     bytesize=serial.EIGHTBITS,
+                                     timeout=self.timeout)
+            self.device = device
+            self._last_data = time.monotonic()
+            self._unanswered = None
+            if self.on_connect is not None:
+                self.on_connect()
+        except (serial.SerialException, OSError) as err:
+            self._close()
+            self._attempts += 1
+            wait = min(self.backoff * 2 ** (self._attempts - 1), self.backoff_max)
+            self._next_attempt = time.monotonic() + wait
+            print(f"Unable to open serial port ({err}), retrying in {wait:.0f} s")
+            return False
+        print(f"Serial connection to {self.device} is open")
+        self._attempts = 0
+        self.connects += 1
+        return True
+
+    def _close(self):
+        """Close the port, ignoring errors of a lost device"""
+        ser, self.ser = self.ser, None
+        if ser is not None:
+            try:
+                ser.close()
+            except (serial.SerialException, OSError):
+                pass
+
+    def close(self):
+        """Close the port"""
+        self._close()
+
+    def _lost(self, err):
+        """Close the port after an I/O error, connect() reopens it"""
+        print(f"Serial connection to {self.device} lost: {err}")
+        self._close()
+        self.disconnects += 1
+        self._next_attempt = time.monotonic() + self.backoff
+
+    def _io(self, function, *args):
+        """Call function(ser, *args) on the port, closing it on I/O errors"""
+        if self.ser is None:
+            raise serial.SerialException("serial port is not open")
+        try:
+            return function(self.ser, *args)
+        except (serial.SerialException, OSError) as err:
+            self._lost(err)
+            raise serial.SerialException(str(err)) from err
+
+    def write(self, data):
+        written = self._io(serial.Serial.write, data)
+        if self._unanswered is None:
+            self._unanswered = time.monotonic()
+        return written
+
+    def _received(self, data):
+        """Track the time of the last data, closing the port after silence"""
+        now = time.monotonic()
+        if data:
+            self._last_data = now
+            self._unanswered = None
+            return data
+        since = self._last_data if self._unanswered is None else self._unanswered
+        if self.silence and now - since >= self.silence:
+            self._lost(f"no data for {now - since:.1f} s")
+            raise serial.SerialException("serial read timeout")
+        return data
+
+    def read(self, size=1):
+        return self._received(self._io(serial.Serial.read, size))
+
+    def readline(self):
+        return self._received(self._io(serial.Serial.readline))
+
+    def reset_input_buffer(self):
+        return self._io(serial.Serial.reset_input_buffer)
+
+    @property
+    def in_waiting(self):
+        return self._io(lambda ser: ser.in_waiting)
+
+    def metrics(self):
+        """Return the connection counters as a dictionary"""
+        return {"serial.connected" : int(self.connected),
+                "serial.connects" : self.connects,
+                "serial.disconnects" : self.disconnects,
+                }
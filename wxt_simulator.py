@@ -0,0 +1,343 @@
+"""
+Hardware-free simulator of the Vaisala WXT536 ASCII protocol.
+
+The simulator opens a pseudo-terminal (pty) and answers the 0R0-0R3 poll
+commands and the 0XU settings query like the instrument. After an automatic message mode command
+(0XU,M=A) it pushes the wind, PTU, precipitation and supervisor telegrams
+on its own until polling mode (0XU,M=P) is restored.
+
+The fields of each message, the heater voltage suffix, the reply latency,
+the noise of the simulated observations and the rate of corrupted replies
+are configurable, to exercise app.py against the variety of WXT settings
+and line conditions found on the nodes.
+
+Usage:
+python wxt_simulator.py --interval 1
+python wxt_simulator.py --fields 0R0=Dm,Sm,Ta,Pa --heater NVWF --garbage 0.01
+python app.py --device <printed pty device>
+"""
+
+import os
+import tty
+import time
+import random
+import argparse
+import threading
+
+from wxt_serial import wxt_crc
+
+# Fields of each message with the factory settings of the WXT
+DEFAULT_FIELDS = {'0R0' : ('Dm', 'Sm', 'Ta', 'Ua', 'Pa', 'Rc', 'Th', 'Vh'),
+                  '0R1' : ('Dn', 'Dm', 'Dx', 'Sn', 'Sm', 'Sx'),
+                  '0R2' : ('Ta', 'Ua', 'Pa'),
+                  '0R3' : ('Rc', 'Rd', 'Ri', 'Hc', 'Hd', 'Hi'),
+                  '0R5' : ('Th', 'Vh', 'Vs', 'Vr'),
+                  }
+
+# Value format and unit character of each field; the unit of the heater
+# voltage is the heater status suffix
+FIELD_FORMATS = {'Dn' : ('.0f', 'D'), 'Dm' : ('.0f', 'D'), 'Dx' : ('.0f', 'D'),
+                 'Sn' : ('.1f', 'M'), 'Sm' : ('.1f', 'M'), 'Sx' : ('.1f', 'M'),
+                 'Ta' : ('.1f', 'C'), 'Tp' : ('.1f', 'C'), 'Ua' : ('.1f', 'P'),
+                 'Pa' : ('.1f', 'H'),
+                 'Rc' : ('.2f', 'M'), 'Rd' : ('.0f', 'S'), 'Ri' : ('.1f', 'M'),
+                 'Rp' : ('.1f', 'M'), 'Hc' : ('.1f', 'M'), 'Hd' : ('.0f', 'S'),
+                 'Hi' : ('.1f', 'M'), 'Hp' : ('.1f', 'M'),
+                 'Th' : ('.1f', 'C'), 'Vh' : ('.1f', None), 'Vs' : ('.1f', 'V'),
+                 'Vr' : ('.3f', 'V'),
+                 }
+
+# Heater voltage suffixes: not supplied, above heating temperature and
+# the three heating duty cycles
+HEATER_SUFFIXES = '#NVWF'
+
+class WXTSimulator:
+    """
+    Emulates a WXT536 on a pseudo-terminal.
+
+    Parameters:
+        interval: Seconds between pushed telegrams in automatic mode
+        latency: Seconds between receiving a poll and replying
+        seed: Random seed for the simulated observations
+        fields: Dictionary of message command (e.g. '0R0') to the tuple of
+            fields it reports, overriding DEFAULT_FIELDS
+        heater: Heater voltage suffixes (HEATER_SUFFIXES), one is picked at
+            random for each telegram if several are given
+        jitter: Maximum random delay in seconds added to the latency
+        noise: Scale of the random walk of the simulated observations
+        garbage: Probability of corrupting a reply (line noise, a flipped
+            byte, a '#' invalid value or a truncated line)
+    """
+    def __init__(self, interval=1.0, latency=0.0, seed=None, fields=None, heater='N',
+                 jitter=0.0, noise=1.0, garbage=0.0):
+        if not heater or set(heater) - set(HEATER_SUFFIXES):
+            raise ValueError(f"Heater suffixes must be in {HEATER_SUFFIXES}, got {heater!r}")
+        self.interval = interval
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.fields = {**DEFAULT_FIELDS, **(fields or {})}
+        self.heater = heater
+        self.jitter = jitter
+        self.noise = noise
+        self.garbage = garbage
+        self.corrupted = 0
+        self.automatic = False
+        self.crc = False
+        self.polls = 0
+        self.sent = 0
+        self.state = {'Dm' : 180.0, 'Sm' : 3.0, 'Ta' : 20.0, 'Ua' : 60.0,
+                      'Pa' : 990.0, 'Rc' : 0.0, 'Hc' : 0.0, 'Th' : 22.0,
+                      'Vh' : 12.0, 'Vs' : 12.1, 'Vr' : 3.5}
+        self._master = None
+        self._slave = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        """Open the pty and start answering, returns the device path"""
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._serve, daemon=True),
+                         threading.Thread(target=self._push, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        return self.device
+
+    @property
+    def device(self):
+        """Path of the pty device to connect to"""
+        return os.ttyname(self._slave)
+
+    def stop(self):
+        """Stop answering and close the pty"""
+        self._stop.set()
+        if self._slave is not None:
+            # Wake up the reply thread, so the pty is hung up once closed
+            try:
+                os.write(self._slave, b'\n')
+            except OSError:
+                pass
+            for thread in self._threads[:1]:
+                thread.join(1)
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        for thread in self._threads:
+            thread.join(1)
+        self._master = self._slave = None
+
+    def _step(self):
+        """Advance the simulated observations by one random walk step"""
+        state = self.state
+        rand = self.random
+        noise = self.noise
+        state['Dm'] = (state['Dm'] + rand.gauss(0, 10 * noise)) % 360
+        state['Sm'] = max(state['Sm'] + rand.gauss(0, 0.3 * noise), 0.0)
+        state['Ta'] += rand.gauss(0, 0.05 * noise)
+        state['Ua'] = min(max(state['Ua'] + rand.gauss(0, 0.2 * noise), 0.0), 100.0)
+        state['Pa'] += rand.gauss(0, 0.02 * noise)
+        if rand.random() < 0.05:
+            state['Rc'] += 0.01
+
+    def _values(self):
+        """Values of all fields derived from the simulated observations"""
+        s = self.state
+        rain = 0.6 if self.random.random() < 0.05 else 0.0
+        return {'Dn' : (s['Dm'] - 15) % 360, 'Dm' : s['Dm'], 'Dx' : (s['Dm'] + 15) % 360,
+                'Sn' : s['Sm'] * 0.7, 'Sm' : s['Sm'], 'Sx' : s['Sm'] * 1.3,
+                'Ta' : s['Ta'], 'Tp' : s['Ta'] + 1.0, 'Ua' : s['Ua'], 'Pa' : s['Pa'],
+                'Rc' : s['Rc'], 'Rd' : 10.0 if rain else 0.0, 'Ri' : rain, 'Rp' : rain * 2,
+                'Hc' : s['Hc'], 'Hd' : 0.0, 'Hi' : 0.0, 'Hp' : 0.0,
+                'Th' : s['Th'], 'Vh' : s['Vh'], 'Vs' : s['Vs'], 'Vr' : s['Vr']}
+
+    def telegram(self, command):
+        """
+        Return the telegram the WXT would send for a message command, with
+        a CRC for the lowercase CRC commands (e.g. 0r0)
+        """
+        if command[1:2] == 'r':
+            telegram = self.telegram(command[:1] + 'R' + command[2:])
+            if telegram is None:
+                return None
+            telegram = command[:3].encode('ascii') + telegram[3:-2]
+            return telegram + wxt_crc(telegram) + b'\r\n'
+        keys = self.fields.get(command)
+        if keys is None:
+            return None
+        self._step()
+        values = self._values()
+        fields = []
+        for key in keys:
+            spec, unit = FIELD_FORMATS[key]
+            if unit is None:
+                unit = self.random.choice(self.heater)
+            fields.append(f"{key}={values[key]:{spec}}{unit}")
+        return f"{command},{','.join(fields)}\r\n".encode('ascii')
+
+    def _corrupt(self, telegram):
+        """Return the telegram corrupted like a noisy serial line would"""
+        self.corrupted += 1
+        rand = self.random
+        kind = rand.randrange(4)
+        if kind == 0:
+            # Line noise before the telegram
+            return bytes(rand.randrange(256) for _ in range(rand.randint(1, 8))) + telegram
+        if kind == 1:
+            # A flipped byte within the telegram
+            index = rand.randrange(len(telegram) - 2)
+            return telegram[:index] + bytes([telegram[index] ^ 0x20]) + telegram[index + 1:]
+        if kind == 2:
+            # A value flagged invalid by the WXT
+            start = telegram.find(b'=') + 1
+            stop = telegram.find(b',', start)
+            if start and stop > start:
+                return telegram[:start] + b'#' * (stop - start) + telegram[stop:]
+            return telegram
+        # A line cut short, the reader times out
+        return telegram[:rand.randrange(1, len(telegram) - 2)]
+
+    def _garble(self, telegram):
+        """Corrupt a telegram with the configured probability"""
+        if self.garbage and self.random.random() < self.garbage:
+            return self._corrupt(telegram)
+        return telegram
+
+    def _write(self, data):
+        """Write to the pty, serialized between the reply and push threads"""
+        with self._lock:
+            os.write(self._master, data)
+            self.sent += 1
+
+    def _serve(self):
+        """Answer commands received on the pty"""
+        buffer = b''
+        while not self._stop.is_set():
+            try:
+                data = os.read(self._master, 256)
+            except OSError:
+                return
+            buffer += data
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                reply = self._reply(line.strip().decode('ascii', errors='replace'))
+                if reply is None:
+                    continue
+                try:
+                    self._write(reply)
+                except OSError:
+                    return
+
+    def _reply(self, command):
+        """Return the reply to a command, None if the WXT would not answer"""
+        if command == '0XU':
+            mode = ('a' if self.crc else 'A') if self.automatic else 'P'
+            return (f"0XU,A=0,M={mode},T=0,C=2,I=0,B=19200,D=8,P=N,S=1,"
+                    f"L=25,N=WXT530,V=3.86\r\n".encode('ascii'))
+        if command.startswith('0XU,M='):
+            self.automatic = command[6:7] in ('A', 'a')
+            self.crc = command[6:7] == 'a'
+            return f"{command}\r\n".encode('ascii')
+        reply = self.telegram(command)
+        if reply is not None:
+            self.polls += 1
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+            if delay:
+                time.sleep(delay)
+            reply = self._garble(reply)
+        return reply
+
+    def _push(self):
+        """Push telegrams at the update interval in automatic mode"""
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            deadline += self.interval
+            self._stop.wait(max(deadline - time.monotonic(), 0))
+            if self.automatic and not self._stop.is_set():
+                try:
+                    for command in (('0r1', '0r2', '0r3', '0r5') if self.crc
+                                    else ('0R1', '0R2', '0R3', '0R5')):
+                        self._write(self._garble(self.telegram(command)))
+                except OSError:
+                    return
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulate a Vaisala WXT536 on a pseudo-terminal")
+    parser.add_argument("--interval",
+                        type=float,
+                        default=1.0,
+                        dest="interval",
+                        help="[float|Default 1 sec] Automatic message interval"
+                        )
+    parser.add_argument("--latency",
+                        type=float,
+                        default=0.0,
+                        dest="latency",
+                        help="[float|Default 0 sec] Delay before answering a poll"
+                        )
+    parser.add_argument("--jitter",
+                        type=float,
+                        default=0.0,
+                        dest="jitter",
+                        help="[float|Default 0 sec] Maximum random delay added to the latency"
+                        )
+    parser.add_argument("--fields",
+                        type=str,
+                        nargs="+",
+                        default=[],
+                        dest="fields",
+                        help="[str|Default WXT settings] Fields of a message, e.g." +
+                             " 0R0=Dm,Sm,Ta,Pa 0R2=Ta,Ua,Pa"
+                        )
+    parser.add_argument("--heater",
+                        type=str,
+                        default="N",
+                        dest="heater",
+                        help="[str|Default N] Heater voltage suffixes (#, N, V, W, F)," +
+                             " picked at random per telegram if several are given"
+                        )
+    parser.add_argument("--noise",
+                        type=float,
+                        default=1.0,
+                        dest="noise",
+                        help="[float|Default 1] Scale of the random walk of the observations"
+                        )
+    parser.add_argument("--garbage",
+                        type=float,
+                        default=0.0,
+                        dest="garbage",
+                        help="[float|Default 0] Probability of corrupting a reply"
+                        )
+    parser.add_argument("--seed",
+                        type=int,
+                        default=None,
+                        dest="seed",
+                        help="[int|Default None] Random seed"
+                        )
+    args = parser.parse_args()
+
+    fields = {}
+    for message in args.fields:
+        command, _, keys = message.partition('=')
+        fields[command] = tuple(keys.split(','))
+
+    with WXTSimulator(interval=args.interval, latency=args.latency, seed=args.seed,
+                      fields=fields, heater=args.heater, jitter=args.jitter,
+                      noise=args.noise, garbage=args.garbage) as simulator:
+        print(f"Simulated WXT536 on {simulator.device}", flush=True)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
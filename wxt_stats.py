@@ -0,0 +1,213 @@
+"""
+Streaming statistics for the parsed WXT536 samples.
+
+Samples are folded into running sums as they are parsed, so averages for
+publishing to Beehive are available without re-reading the local files.
+Wind samples can also be kept in fixed-size NumPy ring buffers for the
+statistics that need the whole interval (gusts, percentiles, direction
+variability).
+"""
+
+import math
+
+import numpy as np
+
+# Wind directions are averaged as unit vectors to handle the 0/360 wrap
+DIRECTION_KEYS = ('Dn', 'Dm', 'Dx')
+# Accumulated amounts and durations (reset by the WXT, not per interval)
+# are reported as the last value within the interval
+ACCUMULATION_KEYS = ('Rc', 'Rd', 'Hc', 'Hd')
+# Heater status is a category, reported as the most frequent value
+STATUS_KEYS = ('Jo',)
+
+class RunningAverage:
+    """
+    O(1)-memory running average of parsed samples over a publish interval.
+
+    Each call to update() adds a parsed sample (dictionary returned by
+    parse_values); mean() returns the interval averages and reset() starts
+    a new interval.
+
+    Parameters:
+        wind: Optional WindStatistics updated and reset along with the
+            running sums
+
+    Attributes:
+        timestamp: Read time (ns) of the last sample, None if not given
+    """
+    def __init__(self, wind=None):
+        self.wind = wind
+        self.reset()
+
+    def reset(self):
+        """Clear the running sums to start a new averaging interval"""
+        if self.wind is not None:
+            self.wind.reset()
+        self.nsamples = 0
+        self.timestamp = None
+        self.sums = {}
+        self.counts = {}
+        self.last = {}
+        self.vectors = {}
+        self.modes = {}
+
+    def update(self, sample, timestamp=None):
+        """Add a parsed sample, read at timestamp (ns), to the running sums"""
+        self.nsamples += 1
+        if timestamp is not None:
+            self.timestamp = timestamp
+        if self.wind is not None:
+            self.wind.update(sample, timestamp)
+        for key, value in sample.items():
+            if value is None or value != value:
+                # Skip missing (None) and NaN values
+                continue
+            if key in ACCUMULATION_KEYS:
+                self.last[key] = value
+            elif key in DIRECTION_KEYS:
+                radians = math.radians(value)
+                east, north, count = self.vectors.get(key, (0.0, 0.0, 0))
+                self.vectors[key] = (east + math.sin(radians),
+                                     north + math.cos(radians),
+                                     count + 1)
+            elif key in STATUS_KEYS:
+                counts = self.modes.setdefault(key, {})
+                counts[value] = counts.get(value, 0) + 1
+            else:
+                self.sums[key] = self.sums.get(key, 0.0) + value
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def mean(self):
+        """
+        Return the interval averages as a dictionary.
+
+        Variables without any valid samples within the interval are omitted.
+        """
+        out = {key : self.sums[key] / self.counts[key] for key in self.sums}
+        for key, (east, north, count) in self.vectors.items():
+            if math.hypot(east, north) <= 1e-9 * count:
+                # Direction is undefined for opposing vectors (up to rounding)
+                continue
+            out[key] = math.degrees(math.atan2(east / count, north / count)) % 360
+        for key, counts in self.modes.items():
+            out[key] = max(counts, key=counts.get)
+        out.update(self.last)
+        return out
+
+class WindStatistics:
+    """
+    Wind statistics of a publish interval on fixed-size NumPy ring buffers.
+
+    update() stores the mean wind speed (Sm) and direction (Dm) of each
+    sample in O(1); stats() computes the interval statistics vectorized over
+    the buffers. Once more than capacity samples are added, the oldest are
+    overwritten and the statistics cover the most recent capacity samples.
+
+    Parameters:
+        capacity: Number of samples held, should cover a publish interval
+        gust_samples: Number of consecutive samples averaged for a gust
+            (e.g. 3 for the 3 second WMO gust at 1 Hz)
+        percentiles: Wind speed percentiles reported by stats()
+        gust_window: Seconds averaged for a gust, for samples arriving at
+            the rate of the WXT (automatic messages): gust_samples is then
+            derived from the median spacing of the timestamped samples
+    """
+    def __init__(self, capacity, gust_samples=3, percentiles=(10, 50, 90), gust_window=None):
+        self.capacity = capacity
+        self.gust_samples = max(int(gust_samples), 1)
+        self.gust_window = gust_window
+        self.percentiles = tuple(percentiles)
+        self.speed = np.full(capacity, np.nan)
+        self.direction = np.full(capacity, np.nan)
+        self.time = np.full(capacity, np.nan)
+        self.head = 0
+
+    def reset(self):
+        """Clear the buffers to start a new interval"""
+        self.speed.fill(np.nan)
+        self.direction.fill(np.nan)
+        self.time.fill(np.nan)
+        self.head = 0
+
+    def update(self, sample, timestamp=None):
+        """
+        Add the wind of a parsed sample, read at timestamp (ns), samples
+        without wind are ignored
+        """
+        speed = sample.get('Sm')
+        direction = sample.get('Dm')
+        if speed is None and direction is None:
+            return
+        slot = self.head % self.capacity
+        self.speed[slot] = np.nan if speed is None else speed
+        self.direction[slot] = np.nan if direction is None else direction
+        self.time[slot] = np.nan if timestamp is None else timestamp / 1e9
+        self.head += 1
+
+    def _ordered(self):
+        """Speed, direction and time of the interval in chronological order"""
+        if self.head <= self.capacity:
+            return self.speed[:self.head], self.direction[:self.head], self.time[:self.head]
+        slots = np.arange(self.head - self.capacity, self.head) % self.capacity
+        return self.speed[slots], self.direction[slots], self.time[slots]
+
+    def _gust_samples(self, time):
+        """Samples of the gust window, at the median spacing of the samples"""
+        if self.gust_window is None:
+            return self.gust_samples
+        # Telegrams read together share a timestamp, only the steps count
+        steps = np.diff(time[~np.isnan(time)])
+        steps = steps[steps > 0]
+        if not len(steps):
+            return self.gust_samples
+        return max(round(self.gust_window / float(np.median(steps))), 1)
+
+    def stats(self):
+        """
+        Return the wind statistics of the interval as a dictionary.
+
+        speed_vector, direction_vector: Speed and direction of the mean wind
+            vector (speed-weighted, unlike the unit vector mean direction)
+        direction_std: Yamartino estimate of the direction standard deviation
+        gust: Maximum mean speed over gust_samples consecutive samples
+        speed_max, speed_std: Maximum and standard deviation of the speed
+        speed_p<N>: Speed percentiles
+        Statistics without enough valid samples are omitted.
+        """
+        speed, direction, time = self._ordered()
+        out = {}
+        valid = ~np.isnan(speed)
+        if valid.any():
+            speeds = speed[valid]
+            out['speed_max'] = float(speeds.max())
+            out['speed_std'] = float(speeds.std())
+            for percentile, value in zip(self.percentiles,
+                                         np.percentile(speeds, self.percentiles)):
+                out[f'speed_p{percentile:g}'] = float(value)
+            # Moving average over the gust window, windows with gaps are skipped
+            window = self._gust_samples(time)
+            if len(speed) >= window:
+                sums = np.concatenate(([0.0], np.cumsum(np.where(valid, speed, 0.0))))
+                counts = np.concatenate(([0], np.cumsum(valid)))
+                full = (counts[window:] - counts[:-window]) == window
+                if full.any():
+                    means = (sums[window:] - sums[:-window])[full] / window
+                    out['gust'] = float(means.max())
+
+        valid = ~np.isnan(direction)
+        if valid.any():
+            radians = np.radians(direction[valid])
+            sin, cos = np.sin(radians), np.cos(radians)
+            mean_sin, mean_cos = sin.mean(), cos.mean()
+            epsilon = math.sqrt(max(1.0 - (mean_sin ** 2 + mean_cos ** 2), 0.0))
+            out['direction_std'] = math.degrees(math.asin(epsilon)
+                                                * (1 + (2 / math.sqrt(3) - 1) * epsilon ** 3))
+            both = valid & ~np.isnan(speed)
+            if both.any():
+                radians = np.radians(direction[both])
+                east = (speed[both] * np.sin(radians)).mean()
+                north = (speed[both] * np.cos(radians)).mean()
+                out['speed_vector'] = math.hypot(east, north)
+                if east or north:
+                    out['direction_vector'] = math.degrees(math.atan2(east, north)) % 360
+        return out
@@ -0,0 +1,376 @@
+"""
+Local file storage for the WXT536 samples.
+
+The writers keep the output file open for the life of the file, buffer rows
+in memory and write them out in batches to reduce syscalls and flash wear
+on long running nodes. Samples are stored as text CSV or as compressed
+columnar Parquet or NetCDF files with float32 values and NaN for missing
+observations; pyarrow and netCDF4 are only required for their format.
+Rotated files can be compressed as a whole (gzip, xz or zstd) before upload.
+"""
+
+import os
+import csv
+import gzip
+import lzma
+import time
+import shutil
+import importlib.util
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import numpy as np
+
+# Value written for missing observations in CSV files
+CSV_MISSING = '-9999'
+
+class BufferedCSVWriter:
+    """
+    Long-lived CSV writer that owns the open file handle.
+
+    Rows are held in memory and written to the file once flush_rows rows are
+    buffered or flush_interval seconds have passed since the last flush. The
+    file is only fsync'd when closed (i.e. at file rotation), close() must be
+    called before the file is uploaded.
+
+    Parameters:
+        path: Path of the CSV file, opened for appending
+        flush_rows: Number of buffered rows that triggers a flush
+        flush_interval: Seconds since the last flush that triggers a flush
+    """
+    def __init__(self, path, flush_rows=60, flush_interval=60.0):
+        self.path = Path(path)
+        self.flush_rows = max(int(flush_rows), 1)
+        self.flush_interval = flush_interval
+        self._file = open(self.path, mode='a', newline='', encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._rows = []
+        self.rows_written = 0
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def closed(self):
+        """True once the file has been closed"""
+        return self._file.closed
+
+    def write_record(self, timestamp, values):
+        """
+        Buffer a sample record.
+
+        Parameters:
+            timestamp: Timezone aware datetime of the sample
+            values: Sequence of values in column order, None if missing
+        """
+        self.writerow([timestamp.isoformat(timespec="seconds"),
+                       *(CSV_MISSING if value is None else str(value) for value in values)])
+
+    def writerow(self, row):
+        """Buffer a row, flushing if the row count or time window is reached"""
+        self._rows.append(row)
+        if (len(self._rows) >= self.flush_rows
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows to the file"""
+        if self._rows:
+            self._writer.writerows(self._rows)
+            self.rows_written += len(self._rows)
+            self._rows.clear()
+            self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self, sync=True):
+        """Flush the buffered rows, fsync and close the file"""
+        if self.closed:
+            return
+        try:
+            self.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+
+class ColumnarWriter(ABC):
+    """
+    Base class of the columnar sample writers.
+
+    Records are buffered in preallocated float32 arrays and written out as
+    one compressed chunk once flush_rows records are buffered or
+    flush_interval seconds have passed since the last flush. Subclasses
+    implement _open, _write_chunk and _close.
+
+    Parameters:
+        path: Path of the output file, created (truncated) on open
+        variables: Dictionary of short name to [waggle name, long name,
+            units] of each column, in column order
+        flush_rows: Number of buffered records written as one chunk
+        flush_interval: Seconds since the last flush that triggers a flush
+        attrs: Dictionary of global file attributes
+    """
+    def __init__(self, path, variables, flush_rows=60, flush_interval=60.0, attrs=None):
+        self.path = Path(path)
+        self.variables = dict(variables)
+        self.flush_rows = max(int(flush_rows), 1)
+        self.flush_interval = flush_interval
+        self.attrs = dict(attrs or {})
+        self._times = np.empty(self.flush_rows, dtype=np.float64)
+        self._values = np.full((self.flush_rows, len(self.variables)), np.nan, dtype=np.float32)
+        self._nrows = 0
+        self.rows_written = 0
+        self._closed = False
+        self._last_flush = time.monotonic()
+        self._open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def closed(self):
+        """True once the file has been closed"""
+        return self._closed
+
+    def write_record(self, timestamp, values):
+        """
+        Buffer a sample record, flushing if the row count or time window is
+        reached.
+
+        Parameters:
+            timestamp: Timezone aware datetime of the sample
+            values: Sequence of values in column order, None if missing
+        """
+        row = self._nrows
+        self._times[row] = timestamp.timestamp()
+        self._values[row] = [np.nan if value is None else value for value in values]
+        self._nrows += 1
+        if (self._nrows >= self.flush_rows
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Write the buffered records to the file as one chunk"""
+        if self._nrows:
+            self._write_chunk(self._times[:self._nrows], self._values[:self._nrows])
+            self.rows_written += self._nrows
+            self._values.fill(np.nan)
+            self._nrows = 0
+        self._last_flush = time.monotonic()
+
+    def write_records(self, times, values):
+        """
+        Write a block of records as one chunk, after the buffered records.
+
+        Parameters:
+            times: Array of the UTC seconds of the records
+            values: 2D array of values in column order, NaN if missing
+        """
+        self.flush()
+        if len(times):
+            self._write_chunk(np.asarray(times, dtype=np.float64),
+                              np.asarray(values, dtype=np.float32))
+            self.rows_written += len(times)
+
+    def close(self, sync=True):
+        """Flush the buffered records, finalize, fsync and close the file"""
+        if self._closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._closed = True
+            self._close()
+        if sync:
+            fd = os.open(self.path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    @abstractmethod
+    def _open(self):
+        """Create the output file"""
+
+    @abstractmethod
+    def _write_chunk(self, times, values):
+        """Write records (UTC seconds, float32 values) as one chunk"""
+
+    @abstractmethod
+    def _close(self):
+        """Finalize and close the output file"""
+
+class ParquetWriter(ColumnarWriter):
+    """
+    Parquet sample writer, each flush is written as one zstd compressed row
+    group. The file footer is written on close(). Requires pyarrow.
+
+    Column names are the waggle names, the short and long names and units
+    are stored in the field metadata.
+    """
+    def _open(self):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as err:
+            raise ImportError("Parquet storage requires pyarrow") from err
+        self._pa = pyarrow
+        fields = [pyarrow.field('time', pyarrow.timestamp('ms', tz='UTC'))]
+        for name, (waggle_name, long_name, units) in self.variables.items():
+            fields.append(pyarrow.field(waggle_name, pyarrow.float32(),
+                                        metadata={'short_name' : name,
+                                                  'long_name' : long_name,
+                                                  'units' : units}))
+        self._schema = pyarrow.schema(fields, metadata={str(key) : str(value)
+                                                        for key, value in self.attrs.items()})
+        self._writer = pyarrow.parquet.ParquetWriter(self.path, self._schema,
+                                                     compression='zstd')
+
+    def _write_chunk(self, times, values):
+        pa = self._pa
+        columns = [pa.array((times * 1000).astype(np.int64), pa.timestamp('ms', tz='UTC'))]
+        columns += [pa.array(values[:, i]) for i in range(values.shape[1])]
+        self._writer.write_table(pa.Table.from_arrays(columns, schema=self._schema))
+
+    def _close(self):
+        self._writer.close()
+
+class NetCDFWriter(ColumnarWriter):
+    """
+    NetCDF4 sample writer appending each flush along an unlimited time
+    dimension, with zlib compressed variables. Requires netCDF4.
+
+    Variables are named by their short names (e.g. Ta), with the waggle
+    name, long name and units as attributes.
+    """
+    def _open(self):
+        try:
+            import netCDF4
+        except ImportError as err:
+            raise ImportError("NetCDF storage requires netCDF4") from err
+        self._dataset = netCDF4.Dataset(self.path, mode='w', format='NETCDF4')
+        self._dataset.setncatts(self.attrs)
+        self._dataset.createDimension('time', None)
+        times = self._dataset.createVariable('time', 'f8', ('time',), zlib=True)
+        times.units = 'seconds since 1970-01-01 00:00:00 UTC'
+        times.long_name = 'Timestamp'
+        for name, (waggle_name, long_name, units) in self.variables.items():
+            variable = self._dataset.createVariable(name, 'f4', ('time',), zlib=True,
+                                                    shuffle=True, fill_value=np.nan)
+            variable.waggle_name = waggle_name
+            variable.long_name = long_name
+            variable.units = units
+
+    def _write_chunk(self, times, values):
+        dataset = self._dataset
+        start = len(dataset.dimensions['time'])
+        end = start + len(times)
+        dataset['time'][start:end] = times
+        for i, name in enumerate(self.variables):
+            dataset[name][start:end] = values[:, i]
+        # Keep the file readable if the process is killed before close()
+        dataset.sync()
+
+    def _close(self):
+        self._dataset.close()
+
+# Local file formats, as file suffix and writer class
+STORAGE_FORMATS = {'csv' : ('.csv', BufferedCSVWriter),
+                   'parquet' : ('.parquet', ParquetWriter),
+                   'nc' : ('.nc', NetCDFWriter),
+                   }
+
+# Optional modules required by the local file formats
+STORAGE_MODULES = {'parquet' : 'pyarrow',
+                   'nc' : 'netCDF4',
+                   }
+
+def check_storage(storage):
+    """
+    Raise ImportError if the module required by a local file format is not
+    installed, so a missing module is reported at startup rather than when
+    the first file is opened.
+    """
+    module = STORAGE_MODULES.get(storage)
+    if module is not None and importlib.util.find_spec(module) is None:
+        raise ImportError(f"{storage} storage requires {module}")
+
+# Whole-file compression codecs of rotated files, as file suffix
+CODECS = {'gzip' : '.gz',
+          'xz' : '.xz',
+          'zstd' : '.zst',
+          }
+
+# Optional modules required by the compression codecs
+CODEC_MODULES = {'zstd' : 'zstandard'}
+
+def check_codec(codec):
+    """
+    Raise ImportError if the module required by a compression codec is not
+    installed, rotated files are only compressed once the first interval is
+    over, in the upload worker.
+    """
+    module = CODEC_MODULES.get(codec)
+    if module is not None and importlib.util.find_spec(module) is None:
+        raise ImportError(f"{codec} compression requires {module}")
+
+def _open_compressed(path, codec, level):
+    """Open a binary file for writing with the compression codec"""
+    if codec == 'gzip':
+        return gzip.open(path, mode='wb', compresslevel=level)
+    if codec == 'xz':
+        return lzma.open(path, mode='wb', preset=level)
+    if codec == 'zstd':
+        try:
+            import zstandard
+        except ImportError as err:
+            raise ImportError("zstd compression requires zstandard") from err
+        return zstandard.ZstdCompressor(level=level).stream_writer(open(path, mode='wb'))
+    raise ValueError(f"Unknown compression codec {codec}")
+
+def file_codec(path):
+    """Return the compression codec of a file from its suffix, None if uncompressed"""
+    suffix = Path(path).suffix
+    for codec, codec_suffix in CODECS.items():
+        if suffix == codec_suffix:
+            return codec
+    return None
+
+def compress_file(path, codec='gzip', level=6):
+    """
+    Compress a file, e.g. a rotated local file, to path + codec suffix.
+
+    The compressed file is written to a temporary file, fsync'd and renamed
+    into place, so an interrupted compression never leaves a truncated
+    file. The original file is kept, files already compressed are returned
+    unchanged.
+
+    Returns:
+        Path of the compressed file
+    """
+    path = Path(path)
+    if file_codec(path) is not None:
+        return path
+    compressed_path = path.with_name(path.name + CODECS[codec])
+    temp_path = compressed_path.with_name(compressed_path.name + '.tmp')
+    try:
+        with open(path, mode='rb') as source, _open_compressed(temp_path, codec, level) as target:
+            shutil.copyfileobj(source, target, 1 << 20)
+        fd = os.open(temp_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(temp_path, compressed_path)
+    except BaseException:
+        if temp_path.exists():
+            temp_path.unlink()
+        raise
+    return compressed_path
@@ -0,0 +1,503 @@
+"""
+Uplink of the WXT536 data products to Beehive.
+
+All publishes and file uploads share a single long-lived Waggle Plugin
+session, and file uploads are handed to a background worker so that serial
+acquisition never waits on the network.
+"""
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+
+from waggle.plugin import Plugin
+
+class PluginSession:
+    """
+    Long-lived Waggle Plugin shared across publishes and file uploads.
+
+    The Plugin is entered once on first use and kept open. If a publish or
+    upload fails, the Plugin is torn down, a new one is created and the call
+    is retried once before the error is raised to the caller.
+
+    Parameters:
+        factory: Callable returning a new Plugin-like object (context manager
+            with publish and upload_file methods)
+    """
+    def __init__(self, factory=Plugin):
+        self.factory = factory
+        self.connects = 0
+        self.reconnects = 0
+        self._plugin = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self):
+        """Return the open Plugin, creating it if needed"""
+        with self._lock:
+            if self._plugin is None:
+                plugin = self.factory()
+                plugin.__enter__()
+                self._plugin = plugin
+                self.connects += 1
+            return self._plugin
+
+    def close(self):
+        """Close the Plugin, flushing any queued messages"""
+        with self._lock:
+            plugin, self._plugin = self._plugin, None
+        if plugin is not None:
+            plugin.__exit__(None, None, None)
+
+    def _discard(self, plugin):
+        """Drop a failed Plugin so the next call creates a new one"""
+        with self._lock:
+            if self._plugin is not plugin:
+                # Already replaced by another thread
+                return
+            self._plugin = None
+            self.reconnects += 1
+        try:
+            plugin.__exit__(None, None, None)
+        except Exception as err:
+            print(f"Unable to close failed Plugin: {err}")
+
+    def _call(self, method, *args, **kwargs):
+        """Call a Plugin method, reconnecting and retrying once on failure"""
+        for attempt in range(2):
+            plugin = self.open()
+            try:
+                return getattr(plugin, method)(*args, **kwargs)
+            except (TypeError, ValueError):
+                # Invalid message, a new connection will not help
+                raise
+            except Exception as err:
+                if attempt:
+                    raise
+                print(f"Plugin {method} failed ({err}), reconnecting")
+                self._discard(plugin)
+
+    def publish(self, *args, **kwargs):
+        """Publish a measurement, see waggle.plugin.Plugin.publish"""
+        return self._call('publish', *args, **kwargs)
+
+    def upload_file(self, *args, **kwargs):
+        """Upload a file, see waggle.plugin.Plugin.upload_file"""
+        return self._call('upload_file', *args, **kwargs)
+
+class UploadQueue:
+    """
+    Bounded background upload queue with retry and exponential backoff.
+
+    Files submitted to the queue are uploaded by a worker thread using the
+    upload callable. Pending uploads are persisted to state_path so that
+    they are resumed after a restart.
+
+    Parameters:
+        upload: Callable taking a file path, raises an exception on failure
+        prepare: Callable run by the worker before the upload, taking a file
+            path and returning the path to upload instead (e.g. a compressed
+            copy); the submitted file is then replaced in the queue and
+            removed
+        on_complete: Callable taking a file path and True once uploaded, or
+            False once given up on (e.g. Backfill.update)
+        state_path: JSON file where pending uploads are persisted
+        maxsize: Maximum number of pending uploads held by the queue
+        max_retries: Attempts per file before it is reported as failed
+        backoff: Initial wait in seconds after a failed upload, doubled
+            after each consecutive failure
+        backoff_max: Upper limit of the wait after a failed upload
+    """
+    def __init__(self, upload, prepare=None, on_complete=None, state_path=None, maxsize=100,
+                 max_retries=10, backoff=5.0, backoff_max=600.0):
+        self.upload = upload
+        self.prepare = prepare
+        self.on_complete = on_complete
+        self.state_path = Path(state_path) if state_path else None
+        self.maxsize = maxsize
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.uploaded = 0
+        self.failed = 0
+        self.retries = 0
+        self.dropped = 0
+        self._pending = []
+        self._attempts = {}
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._load()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _load(self):
+        """Restore the pending uploads persisted by a previous run"""
+        if self.state_path is None or not self.state_path.exists():
+            return
+        try:
+            with open(self.state_path, encoding="utf-8") as state:
+                pending = json.load(state)
+        except (OSError, ValueError) as err:
+            print(f"Unable to read upload state {self.state_path}: {err}")
+            return
+        self._pending = [path for path in pending if Path(path).exists()][:self.maxsize]
+        if self._pending:
+            print(f"Resuming {len(self._pending)} pending uploads")
+
+    def _save(self):
+        """Persist the pending uploads, called with the condition held"""
+        if self.state_path is None:
+            return
+        temp_path = self.state_path.with_name(self.state_path.name + '.tmp')
+        try:
+            with open(temp_path, mode='w', encoding="utf-8") as state:
+                json.dump(self._pending, state)
+            os.replace(temp_path, self.state_path)
+        except OSError as err:
+            print(f"Unable to write upload state {self.state_path}: {err}")
+
+    @property
+    def depth(self):
+        """Number of uploads waiting in the queue"""
+        with self._condition:
+            return len(self._pending)
+
+    def metrics(self):
+        """Return the queue counters as a dictionary"""
+        with self._condition:
+            return {"upload.queue_depth" : len(self._pending),
+                    "upload.uploaded" : self.uploaded,
+                    "upload.failed" : self.failed,
+                    "upload.retries" : self.retries,
+                    "upload.dropped" : self.dropped,
+                    }
+
+    def submit(self, file_path):
+        """
+        Add a file to the queue without blocking.
+
+        Returns False if the queue is full, the file is then left on disk.
+        """
+        file_path = str(file_path)
+        with self._condition:
+            if file_path in self._pending:
+                return True
+            if len(self._pending) >= self.maxsize:
+                self.dropped += 1
+                print(f"Upload queue full, leaving {file_path} on disk")
+                return False
+            self._pending.append(file_path)
+            self._save()
+            self._condition.notify()
+        return True
+
+    def start(self):
+        """Start the background upload worker"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run,
+                                            name="wxt-upload",
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        """
+        Stop the upload worker. Uploads still pending remain persisted and
+        are resumed on the next start.
+        """
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _prepare(self, file_path):
+        """Replace a pending file by its prepared version"""
+        prepared = str(self.prepare(file_path))
+        if prepared == file_path:
+            return file_path
+        with self._condition:
+            self._pending[self._pending.index(file_path)] = prepared
+            if file_path in self._attempts:
+                self._attempts[prepared] = self._attempts.pop(file_path)
+            self._save()
+        # Note: once persisted the prepared file is resumed after a restart
+        os.remove(file_path)
+        return prepared
+
+    def _run(self):
+        """Upload worker, processes the queue in order of submission"""
+        while not self._stop.is_set():
+            with self._condition:
+                while not self._pending and not self._stop.is_set():
+                    self._condition.wait()
+                if self._stop.is_set():
+                    return
+                file_path = self._pending[0]
+
+            try:
+                if self.prepare is not None:
+                    file_path = self._prepare(file_path)
+                self.upload(file_path)
+            except Exception as err:
+                attempts = self._attempts.get(file_path, 0) + 1
+                with self._condition:
+                    self.retries += 1
+                    given_up = attempts >= self.max_retries
+                    if given_up:
+                        self.failed += 1
+                        self._pending.remove(file_path)
+                        self._attempts.pop(file_path, None)
+                        self._save()
+                        print(f"Giving up on upload of {file_path}: {err}")
+                if given_up:
+                    self._complete(file_path, False)
+                    continue
+                self._attempts[file_path] = attempts
+                wait = min(self.backoff * 2 ** (attempts - 1), self.backoff_max)
+                print(f"Upload of {file_path} failed ({err}), retrying in {wait:.0f} s")
+                self._stop.wait(wait)
+                continue
+
+            with self._condition:
+                self.uploaded += 1
+                self._pending.remove(file_path)
+                self._attempts.pop(file_path, None)
+                self._save()
+            self._complete(file_path, True)
+
+    def _complete(self, file_path, uploaded):
+        """Report the outcome of an upload to the on_complete callback"""
+        if self.on_complete is not None:
+            try:
+                self.on_complete(file_path, uploaded)
+            except Exception as err:
+                print(f"Upload completion callback failed: {err}")
+
+class Backfill:
+    """
+    Sweeper and backfill uploader of the files left in the output directory.
+
+    Files left behind by failed uploads or restarts are indexed by path in a
+    small JSON state file with their upload status (pending, uploaded or
+    failed).
+    While the upload queue is idle, pending and failed files are submitted
+    to it at a limited rate. Files older than the retention period are
+    deleted. The output directories are only scanned at start and every
+    scan_interval; rotated files are tracked through the outcome reported by
+    the upload queue (use update as its on_complete callback).
+
+    Parameters:
+        upload_queue: UploadQueue the backlog is submitted to
+        outdir: Output directory of the local files, or a list of the
+            output directories (e.g. of several instruments)
+        pattern: Glob pattern of the local files in the output directories
+        state_path: JSON file where the index is persisted
+        rate: Maximum number of files submitted per hour
+        retention_days: Age in days after which files are deleted whatever
+            their status, 0 to keep all files
+        min_age: Seconds since the last modification before a file is
+            indexed, so the open local file is never touched
+        scan_interval: Seconds between scans of the output directory
+        retry_interval: Seconds before a failed file is submitted again
+    """
+    def __init__(self, upload_queue, outdir, pattern, state_path=None, rate=60,
+                 retention_days=30, min_age=3600, scan_interval=86400,
+                 retry_interval=3600):
+        self.upload_queue = upload_queue
+        self.outdirs = ([Path(outdir)] if isinstance(outdir, (str, os.PathLike))
+                        else [Path(path) for path in outdir])
+        self.pattern = pattern
+        self.state_path = Path(state_path) if state_path else None
+        self.rate = rate
+        self.retention_days = retention_days
+        self.min_age = min_age
+        self.scan_interval = scan_interval
+        self.retry_interval = retry_interval
+        self.submitted = 0
+        self.pruned = 0
+        self._index = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_scan = None
+        self._load()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _load(self):
+        """Restore the index persisted by a previous run"""
+        if self.state_path is None or not self.state_path.exists():
+            return
+        try:
+            with open(self.state_path, encoding="utf-8") as state:
+                self._index = json.load(state)
+        except (OSError, ValueError) as err:
+            print(f"Unable to read backfill index {self.state_path}: {err}")
+
+    def _save(self):
+        """Persist the index, called with the lock held"""
+        if self.state_path is None:
+            return
+        temp_path = self.state_path.with_name(self.state_path.name + '.tmp')
+        try:
+            with open(temp_path, mode='w', encoding="utf-8") as state:
+                json.dump(self._index, state)
+            os.replace(temp_path, self.state_path)
+        except OSError as err:
+            print(f"Unable to write backfill index {self.state_path}: {err}")
+
+    def metrics(self):
+        """Return the backfill counters as a dictionary"""
+        with self._lock:
+            statuses = [entry['status'] for entry in self._index.values()]
+            return {"backfill.pending" : statuses.count('pending'),
+                    "backfill.failed" : statuses.count('failed'),
+                    "backfill.submitted" : self.submitted,
+                    "backfill.pruned" : self.pruned,
+                    }
+
+    def update(self, file_path, uploaded):
+        """Record the outcome of an upload, see UploadQueue on_complete"""
+        path = Path(file_path)
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            # Moved away by the upload, the file is forgotten at the next scan
+            mtime = time.time()
+        with self._lock:
+            entry = self._index.setdefault(str(path), {'status' : 'pending',
+                                                       'mtime' : mtime,
+                                                       'attempts' : 0})
+            entry['status'] = 'uploaded' if uploaded else 'failed'
+            entry['updated'] = time.time()
+            if not uploaded:
+                entry['attempts'] += 1
+            self._save()
+
+    def scan(self):
+        """Index the files in the output directories not indexed yet"""
+        now = time.time()
+        found = set()
+        with self._lock:
+            for path in (path for outdir in self.outdirs for path in outdir.glob(self.pattern)):
+                if path.name.endswith('.tmp'):
+                    continue
+                found.add(str(path))
+                if str(path) in self._index:
+                    continue
+                try:
+                    mtime = path.stat().st_mtime
+                except OSError:
+                    continue
+                if now - mtime < self.min_age:
+                    continue
+                self._index[str(path)] = {'status' : 'pending', 'mtime' : mtime, 'attempts' : 0}
+            # Forget files removed since, e.g. moved away by an upload
+            for name in set(self._index) - found:
+                del self._index[name]
+            self._save()
+        self._last_scan = time.monotonic()
+        outdirs = ", ".join(str(outdir) for outdir in self.outdirs)
+        print(f"Indexed {outdirs}, {self.metrics()['backfill.pending']} files pending upload")
+
+    def prune(self):
+        """Delete the files older than the retention period"""
+        if self.retention_days <= 0:
+            return
+        cutoff = time.time() - self.retention_days * 86400
+        with self._lock:
+            for name, entry in list(self._index.items()):
+                if entry['mtime'] >= cutoff:
+                    continue
+                try:
+                    Path(name).unlink()
+                    self.pruned += 1
+                    print(f"Deleted {name} ({entry['status']}) after {self.retention_days} days")
+                except FileNotFoundError:
+                    pass
+                except OSError as err:
+                    print(f"Unable to delete {name}: {err}")
+                    continue
+                del self._index[name]
+            self._save()
+
+    def _next(self):
+        """Return the oldest file due for upload, None if there is none"""
+        now = time.time()
+        with self._lock:
+            due = [(entry['mtime'], name) for name, entry in self._index.items()
+                   if entry['status'] == 'pending'
+                   or (entry['status'] == 'failed'
+                       and now - entry.get('updated', 0) >= self.retry_interval)]
+        for _, name in sorted(due):
+            path = Path(name)
+            if path.exists():
+                return path
+            with self._lock:
+                self._index.pop(name, None)
+        return None
+
+    def step(self):
+        """Scan if due, prune and submit one file if the upload queue is idle"""
+        if self._last_scan is None or time.monotonic() - self._last_scan >= self.scan_interval:
+            self.scan()
+        self.prune()
+        if self.upload_queue.depth:
+            return
+        path = self._next()
+        if path is None:
+            return
+        # Note: marked before submitting, the upload may complete right away
+        with self._lock:
+            self._index[str(path)]['status'] = 'pending'
+            self._index[str(path)]['updated'] = time.time()
+            self._save()
+        if self.upload_queue.submit(path):
+            self.submitted += 1
+            print(f"Backfilling {path}")
+
+    def start(self):
+        """Start the background sweeper"""
+        if self.rate <= 0:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run,
+                                            name="wxt-backfill",
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        """Stop the background sweeper"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        """Sweeper, submits at most rate files per hour"""
+        while not self._stop.is_set():
+            try:
+                self.step()
+            except Exception as err:
+                print(f"Backfill failed: {err}")
+            self._stop.wait(3600 / self.rate)